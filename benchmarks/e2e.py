@@ -0,0 +1,232 @@
+# benchmarks/e2e.py - End-to-end scenarios against the local fake Discord, timed offline.
+#
+# Usage: python -m benchmarks.e2e [--members 100] [--latency 50] [--rate-limit-chance 0.02] [--output results.json]
+#
+# Starts benchmarks/fake_discord.py, then runs the bot the way main.py does (create_bot, load_cogs and the
+# Supervisor) with a temporary database, and plays the scenarios in order: connect, challenge set through
+# /setchallenge and its modal, hint release through the scheduler, a burst of solves from every member
+# (some with a wrong guess first), the rating clicks and /shutdown. For each scenario it reports how long it
+# took, the time from dispatching an interaction to the bot's callback as the server saw it, the REST
+# requests made and the 429s served. The results are written as JSON under benchmarks/results/.
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+
+from main import create_bot, drain, load_cogs
+from supervisor import Supervisor
+from cogs.async_db import db
+from cogs.dispatcher import dispatcher
+from cogs.fanout import fanout
+from cogs.scheduler import scheduler
+
+from .fake_discord import FakeDiscord
+from .load_test import RESULTS_DIR, percentiles
+
+FLAG = "flag{end_to_end}"
+
+
+class Scenario:
+    """
+    Measures one scenario: wall time, acknowledgement latency of its interactions and the REST traffic.
+    """
+
+    def __init__(self, fake, name):
+        self.fake = fake
+        self.name = name
+        self.interactions = []
+
+    def __enter__(self):
+        self._requests = Counter(self.fake.requests)
+        self._rate_limited = sum(self.fake.rate_limited.values())
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._started
+        return False
+
+    def track(self, interaction_id):
+        self.interactions.append(interaction_id)
+        return interaction_id
+
+    def answered(self):
+        return all(interaction_id in self.fake.callbacks for interaction_id in self.interactions)
+
+    def result(self):
+        acks = [self.fake.acks[i] for i in self.interactions if i in self.fake.acks]
+        requests = Counter(self.fake.requests)
+        requests.subtract(self._requests)
+        result = {
+            "seconds": self.seconds,
+            "interactions": len(self.interactions),
+            "ack_ms": percentiles(acks),
+            "requests": {route: count for route, count in requests.items() if count},
+            "rate_limited": sum(self.fake.rate_limited.values()) - self._rate_limited,
+            "dispatcher_depth": dispatcher.depth,
+            "fanout_depth": fanout.depth,
+        }
+        ack = result["ack_ms"]
+        print(
+            f"{self.name:>12}: {self.seconds:.2f}s, {len(self.interactions)} interactions"
+            + (f", ack p50 {ack['p50']:.1f} ms, p99 {ack['p99']:.1f} ms" if ack else "")
+            + f", {sum(result['requests'].values())} requests, {result['rate_limited']} rate limited"
+        )
+        return result
+
+
+def expect(condition, message):
+    # The timings are only worth something if the bot actually did the work.
+    if not condition:
+        raise AssertionError(message)
+
+
+async def set_challenge(fake, channel_id):
+    with Scenario(fake, "setchallenge") as scenario:
+        command = scenario.track(await fake.command(fake.admin, "setchallenge"))
+        await fake.wait_for(lambda: command in fake.callbacks)
+        modal = fake.callbacks[command]["data"]
+        values = {"Description": "End-to-end run", "Answer": FLAG, "Hints": "Look closer"}
+        scenario.track(await fake.submit_modal(fake.admin, modal, values))
+        # The ping and the challenge embed.
+        await fake.wait_for(lambda: scenario.answered() and len(fake.messages[channel_id]) >= 2)
+    return scenario.result()
+
+
+async def release_hint(fake, channel_id):
+    with Scenario(fake, "hint") as scenario:
+        day = (await db.active_challenge(fake.guild_id)).challenge.day
+        # Brings the hint forward instead of waiting six hours, the scheduler fires it as usual.
+        await scheduler.schedule(fake.guild_id, day, "hint", time.time())
+        await fake.wait_for(
+            lambda: any("Hint for Day" in m["content"] for m in fake.messages[channel_id])
+        )
+    return scenario.result()
+
+
+async def solve_burst(fake, rng, wrong):
+    with Scenario(fake, "solves") as scenario:
+        attempts = []
+        for member in fake.members:
+            if rng.random() < wrong:
+                attempts.append((member, "flag{wrong}"))
+            attempts.append((member, FLAG))
+        rng.shuffle(attempts)
+        solves = []
+        for member, flag in attempts:
+            interaction_id = scenario.track(await fake.command(member, "submit", flag=flag))
+            if flag == FLAG:
+                solves.append((member, f"token-{interaction_id}"))
+        await fake.wait_for(scenario.answered, timeout=120)
+    active = await db.active_challenge(fake.guild_id)
+    expect(active.solve_count == len(fake.members), f"{active.solve_count} of {len(fake.members)} solves recorded")
+    return scenario.result(), solves
+
+
+async def rate(fake, rng, solves):
+    with Scenario(fake, "ratings") as scenario:
+        # The rating prompts are followups of the solves, sent from the fan-out queue.
+        await fake.wait_for(lambda: all(fake.followups.get(token) for _, token in solves), timeout=120)
+        for member, token in solves:
+            message = fake.followups[token][0]
+            scenario.track(await fake.click(member, message, f"rate_{rng.randint(1, 5)}"))
+        await fake.wait_for(scenario.answered, timeout=120)
+    active = await db.active_challenge(fake.guild_id)
+    expect(active.rating_count == len(solves), f"{active.rating_count} of {len(solves)} ratings recorded")
+    return scenario.result()
+
+
+async def shutdown(fake):
+    leaderboard_id = fake.channels["leaderboard"]["id"]
+    with Scenario(fake, "shutdown") as scenario:
+        scenario.track(await fake.command(fake.admin, "shutdown"))
+        # The leaderboard and the merged announcements end with the write-up line.
+        await fake.wait_for(
+            lambda: scenario.answered()
+            and any("official writeup" in m["content"].lower() for m in fake.messages[leaderboard_id]),
+            timeout=120,
+        )
+    expect((await db.active_challenge(fake.guild_id)).challenge is None, "the challenge is still active")
+    return scenario.result()
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    fake = FakeDiscord(
+        members=args.members,
+        latency=args.latency / 1000,
+        rate_limit_chance=args.rate_limit_chance,
+        seed=args.seed,
+    )
+    await fake.start()
+    fake.patch_discord()
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.path = os.path.join(tmp, "e2e.db")
+        channel_id = fake.channels["challenges"]["id"]
+        await db.update_config(fake.guild_id, "channel_id", int(channel_id))
+        await db.update_config(
+            fake.guild_id, "leaderboard_channel_id", int(fake.channels["leaderboard"]["id"])
+        )
+        await db.update_config(fake.guild_id, "ctf_creators", int(fake.creators_role["id"]))
+
+        bot = create_bot()
+        async with bot:
+            started = time.perf_counter()
+            await load_cogs(bot)
+            session = asyncio.create_task(Supervisor(bot, "fake-token").run())
+            await asyncio.wait_for(bot.wait_until_ready(), 30)
+            # on_ready syncs the commands, the scenarios need their ids.
+            await fake.wait_for(lambda: "submit" in fake.commands)
+            results["connect"] = {"seconds": time.perf_counter() - started}
+            print(f"{'connect':>12}: {results['connect']['seconds']:.2f}s")
+
+            results["setchallenge"] = await set_challenge(fake, channel_id)
+            results["hint"] = await release_hint(fake, channel_id)
+
+            results["solves"], solves = await solve_burst(fake, rng, args.wrong)
+            results["ratings"] = await rate(fake, rng, solves)
+            results["shutdown"] = await shutdown(fake)
+
+            # Same stop as main.run: the queues are drained before the bot is closed.
+            await drain()
+            await bot.close()
+            await session
+        await db.close()
+    await fake.stop()
+
+    report = {
+        "timestamp": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "args": vars(args),
+        "scenarios": results,
+        "unhandled_routes": dict(fake.unhandled),
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"e2e-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end scenarios against a local fake Discord.")
+    parser.add_argument("--members", type=int, default=100, help="guild members taking part in the solve burst")
+    parser.add_argument("--wrong", type=float, default=0.5, help="probability of a wrong guess before the correct one")
+    parser.add_argument("--latency", type=float, default=50.0, help="median REST latency in milliseconds")
+    parser.add_argument("--rate-limit-chance", type=float, default=0.0, help="probability of a random 429 on limited routes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file for the results (default: benchmarks/results/e2e-<time>.json)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+# benchmarks/event_loop_lag.py - Measures event-loop lag while a stream of /submit database work runs.
+#
+# Usage: python -m benchmarks.event_loop_lag [--submissions 1500] [--rate 150] [--io-latency 1.0]
+#
+# The "blocking" run calls db_utils directly from the event loop (what the cogs used to do),
+# the "async" run goes through cogs.async_db. Submissions arrive at a fixed rate, like interactions
+# coming in from the gateway, rather than as one gather, so the lag measured is the one caused by the
+# database work and not by scheduling thousands of coroutines at once. A probe task sleeps for 1 ms in a
+# loop and records how late it wakes up while the submissions run, which is the delay every other
+# interaction and the gateway heartbeat would see. The lag is reported per quarter of the run to show
+# whether it stays flat as the leaderboard grows.
+# --io-latency adds a sleep to every SQL statement, on whichever thread runs it, to model a disk slower
+# than the page cache (a cloud volume, an fsync); 0 measures the raw local speed.
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from cogs import db_utils
+from cogs.async_db import AsyncDatabase
+
+PROBE_INTERVAL = 0.001
+GUILD_ID = 1
+
+
+def add_io_latency(con, latency):
+    if latency:
+        con.set_trace_callback(lambda statement: time.sleep(latency))
+    return con
+
+
+async def probe(lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(loop.time() - start - PROBE_INTERVAL)
+
+
+async def blocking_submit(con, user_id):
+    # Same sequence of queries as GeneralCommands.submit before the async layer.
+    db_utils.fetch_config(con, GUILD_ID)
+    db_utils.fetch_challenge_data(con, GUILD_ID)
+    db_utils.check_leaderboard(con, GUILD_ID, user_id)
+    db_utils.len_leaderboard(con, GUILD_ID)
+    db_utils.insert_leaderboard(con, GUILD_ID, user_id)
+
+
+async def async_submit(database, user_id):
+    await database.fetch_config(GUILD_ID)
+    await database.fetch_challenge_data(GUILD_ID)
+    await database.check_leaderboard(GUILD_ID, user_id)
+    await database.len_leaderboard(GUILD_ID)
+    await database.insert_leaderboard(GUILD_ID, user_id)
+
+
+async def arrivals(submit, target, submissions, rate):
+    # Starts submission i at i / rate seconds, each as its own task like an interaction handler.
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    tasks = []
+    for user_id in range(submissions):
+        delay = start + user_id / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(submit(target, user_id)))
+    await asyncio.gather(*tasks)
+
+
+def ms(lags, q):
+    return lags[min(len(lags) - 1, int(len(lags) * q))] * 1000
+
+
+async def run(name, submit, target, submissions, rate):
+    lags = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.05)  # Let the probe settle before the submissions start.
+    del lags[:]
+
+    started = time.perf_counter()
+    await arrivals(submit, target, submissions, rate)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe_task
+    quarters = [sorted(lags[i * len(lags) // 4:(i + 1) * len(lags) // 4]) for i in range(4)]
+    lags.sort()
+    print(
+        f"{name:>9}: {submissions} submissions at {rate:g}/s in {elapsed:.2f}s | "
+        f"loop lag median {statistics.median(lags) * 1000:.2f} ms, "
+        f"p99 {ms(lags, 0.99):.2f} ms, max {lags[-1] * 1000:.2f} ms ({len(lags)} probes) | "
+        f"p99 per quarter {' / '.join(f'{ms(quarter, 0.99):.2f}' for quarter in quarters)} ms"
+    )
+
+
+async def main(submissions, rate, latency):
+    # Every connection the async layer opens gets the same latency as the blocking one.
+    configure_connection = db_utils.configure_connection
+
+    def configure_slow_connection(con):
+        configure_connection(add_io_latency(con, latency))
+
+    db_utils.configure_connection = configure_slow_connection
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A plain connection with SQLite's defaults (rollback journal, an fsync per commit), as the cogs opened it.
+        con = sqlite3.connect(os.path.join(tmp, "blocking.db"))
+        db_utils.create_tables(con)
+        add_io_latency(con, latency)
+        db_utils.insert_challenge(con, GUILD_ID, (1, "bench", "flag", "", "hint", ""))
+        await run("blocking", blocking_submit, con, submissions, rate)
+        con.close()
+
+        database = AsyncDatabase(os.path.join(tmp, "async.db"))
+        await database.insert_challenge(GUILD_ID, (1, "bench", "flag", "", "hint", ""))
+        await run("async", async_submit, database, submissions, rate)
+        await database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Event-loop lag under a stream of submissions.")
+    parser.add_argument("--submissions", type=int, default=1500)
+    parser.add_argument("--rate", type=float, default=150, help="submissions per second")
+    parser.add_argument("--io-latency", type=float, default=1.0, help="added to every SQL statement, in ms")
+    args = parser.parse_args()
+    asyncio.run(main(args.submissions, args.rate, args.io_latency / 1000))
@@ -0,0 +1,582 @@
+# benchmarks/fake_discord.py - Local stand-in for the Discord REST API and gateway, for offline end-to-end runs.
+#
+# An aiohttp server with one guild (two text channels, a CTF creators role, an admin and N members)
+# that a real commands.Bot can log in and connect to once patch_discord() has pointed discord.py at it.
+# It implements the endpoints the bot uses: login, application info, command sync, DMs, channel messages,
+# interaction callbacks and followups. Scenarios inject interactions through the gateway with command(),
+# submit_modal() and click(), and wait for the bot's answers with wait_for().
+#
+# Every REST request waits for a log-normally distributed latency. Channel messages are limited like Discord
+# does (5 per 5 seconds per channel, with the X-RateLimit headers), and any rate limited route can also
+# answer a random 429. The randomness comes from one seeded generator, so runs are reproducible.
+# Written against discord.py 2.x.
+
+import asyncio
+import datetime
+import json
+import logging
+import math
+import random
+import time
+from collections import Counter, defaultdict
+
+import discord
+import yarl
+from aiohttp import web
+
+API = "/api/v10"
+DISCORD_EPOCH = 1420070400000
+
+# Discord's limit on messages sent to one channel.
+CHANNEL_LIMIT = 5
+CHANNEL_WINDOW = 5.0
+
+# Routes that take part in rate limiting, interaction callbacks are never limited.
+LIMITED_ROUTES = ("/channels/", "/users/@me/channels", "/webhooks/")
+
+OPTION_TYPES = {str: 3, int: 4, bool: 5, float: 10}
+
+
+def json_response(data, status=200, headers=None):
+    # Not web.json_response: its Content-Type carries "; charset=utf-8" and discord.py only parses a body
+    # as JSON when the header is exactly application/json, anything else reaches the bot as a string.
+    return web.Response(
+        body=json.dumps(data).encode(), status=status, headers=headers, content_type="application/json"
+    )
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class FakeDiscord:
+    """
+    latency is the median delay of a REST request in seconds and jitter the sigma of its log-normal
+    distribution. rate_limit_chance is the probability that a request to a limited route answers a 429
+    regardless of the channel buckets.
+    """
+
+    def __init__(self, members=100, latency=0.05, jitter=0.5, rate_limit_chance=0.0, seed=0):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_chance = rate_limit_chance
+        self._counter = 0
+
+        self.application_id = self.snowflake()
+        self.guild_id = self.snowflake()
+        self.bot_user = self._user("DailyCTF Robot", bot=True)
+        self.admin = self._user("admin")
+        self.members = [self._user(f"member{i}") for i in range(members)]
+        self.everyone_role = self._role(self.guild_id, "@everyone", 0)
+        self.creators_role = self._role(self.snowflake(), "CTF creators", 8)
+        self.channels = {
+            name: self._channel(name, position)
+            for position, name in enumerate(("challenges", "leaderboard"))
+        }
+
+        self.commands = {}  # name -> registered command payload
+        self.messages = defaultdict(list)  # channel id -> message payloads
+        self.callbacks = {}  # interaction id -> callback payload
+        self.followups = defaultdict(list)  # interaction token -> message payloads
+        self.acks = {}  # interaction id -> seconds between the dispatch and the callback
+        self.requests = Counter()
+        self.rate_limited = Counter()
+        self.unhandled = Counter()
+
+        self._dispatched = {}  # interaction id -> perf_counter() at dispatch
+        self._buckets = {}  # channel id -> [window reset time, remaining]
+        self._sockets = {}  # websocket -> sequence number
+        self._changed = None
+        self._runner = None
+        self.url = None
+
+    # Payloads
+
+    def snowflake(self):
+        self._counter += 1
+        return ((int(time.time() * 1000) - DISCORD_EPOCH) << 22) | (self._counter & 0x3FFFFF)
+
+    def _user(self, name, bot=False):
+        return {
+            "id": str(self.snowflake()),
+            "username": name,
+            "discriminator": "0",
+            "global_name": None,
+            "avatar": None,
+            "bot": bot,
+            "public_flags": 0,
+        }
+
+    def _role(self, id, name, permissions):
+        return {
+            "id": str(id),
+            "name": name,
+            "permissions": str(permissions),
+            "position": 0 if id == self.guild_id else 1,
+            "color": 0,
+            "hoist": False,
+            "managed": False,
+            "mentionable": False,
+            "flags": 0,
+        }
+
+    def _channel(self, name, position):
+        return {
+            "id": str(self.snowflake()),
+            "guild_id": str(self.guild_id),
+            "type": 0,
+            "name": name,
+            "position": position,
+            "permission_overwrites": [],
+            "nsfw": False,
+            "parent_id": None,
+            "topic": None,
+            "last_message_id": None,
+            "rate_limit_per_user": 0,
+        }
+
+    def _member(self, user):
+        admin = user is self.admin
+        return {
+            "user": user,
+            "roles": [self.creators_role["id"]] if admin else [],
+            "joined_at": _now(),
+            "deaf": False,
+            "mute": False,
+            "flags": 0,
+            "permissions": "8" if admin else "0",
+        }
+
+    def guild_payload(self):
+        users = [self.bot_user, self.admin] + self.members
+        return {
+            "id": str(self.guild_id),
+            "name": "Fake Guild",
+            "icon": None,
+            "owner_id": self.admin["id"],
+            "roles": [self.everyone_role, self.creators_role],
+            "channels": list(self.channels.values()),
+            "members": [self._member(user) for user in users],
+            "member_count": len(users),
+            "large": False,
+            "unavailable": False,
+            "joined_at": _now(),
+            "emojis": [],
+            "stickers": [],
+            "features": [],
+            "presences": [],
+            "voice_states": [],
+            "threads": [],
+            "stage_instances": [],
+            "guild_scheduled_events": [],
+            "verification_level": 0,
+            "default_message_notifications": 0,
+            "explicit_content_filter": 0,
+            "mfa_level": 0,
+            "nsfw_level": 0,
+            "premium_tier": 0,
+            "system_channel_id": None,
+            "system_channel_flags": 0,
+            "preferred_locale": "en-US",
+            "afk_timeout": 300,
+            "premium_progress_bar_enabled": False,
+        }
+
+    def _message(self, channel_id, author, body):
+        message = {
+            "id": str(self.snowflake()),
+            "channel_id": str(channel_id),
+            "author": author,
+            "content": body.get("content") or "",
+            "timestamp": _now(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": body.get("embeds") or [],
+            "components": body.get("components") or [],
+            "pinned": False,
+            "type": 0,
+            "flags": body.get("flags", 0),
+        }
+        if any(channel["id"] == str(channel_id) for channel in self.channels.values()):
+            message["guild_id"] = str(self.guild_id)
+        return message
+
+    # Server
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._changed = asyncio.Condition()
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/gateway", self._gateway)
+        app.router.add_get(f"{API}/gateway", self._get_gateway)
+        app.router.add_get(f"{API}/gateway/bot", self._get_gateway)
+        app.router.add_get(f"{API}/users/@me", self._get_user)
+        app.router.add_get(f"{API}/oauth2/applications/@me", self._get_application)
+        app.router.add_put(f"{API}/applications/{{application_id}}/commands", self._sync)
+        app.router.add_put(
+            f"{API}/applications/{{application_id}}/guilds/{{guild_id}}/commands", self._sync
+        )
+        app.router.add_post(f"{API}/users/@me/channels", self._create_dm)
+        app.router.add_post(f"{API}/channels/{{channel_id}}/messages", self._send_message)
+        app.router.add_post(
+            f"{API}/interactions/{{interaction_id}}/{{token}}/callback", self._callback
+        )
+        app.router.add_post(f"{API}/webhooks/{{application_id}}/{{token}}", self._followup)
+        app.router.add_route("*", "/{tail:.*}", self._not_found)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        for ws in list(self._sockets):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def patch_discord(self):
+        """
+        Points discord.py's REST routes, webhook routes and default gateway at this server.
+        """
+        discord.http.Route.BASE = f"{self.url}{API}"
+        discord.webhook.async_.Route.BASE = f"{self.url}{API}"
+        if hasattr(discord.gateway.DiscordWebSocket, "DEFAULT_GATEWAY"):
+            discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(self.gateway_url)
+
+    @property
+    def gateway_url(self):
+        return self.url.replace("http://", "ws://", 1) + "/gateway"
+
+    async def wait_for(self, predicate, timeout=30.0):
+        """
+        Waits until predicate() is true, it's checked again after every request the server handles.
+        """
+        async with self._changed:
+            await asyncio.wait_for(self._changed.wait_for(predicate), timeout)
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    def _delay(self):
+        if not self.latency:
+            return 0.0
+        return self.rng.lognormvariate(math.log(self.latency), self.jitter)
+
+    def _rate_limit(self, request):
+        """
+        Returns a 429 response if the request is rate limited, otherwise the X-RateLimit headers to answer with.
+        """
+        path = request.path
+        if not any(route in path for route in LIMITED_ROUTES):
+            return None, {}
+
+        if self.rate_limit_chance and self.rng.random() < self.rate_limit_chance:
+            return self._too_many_requests(path, round(self.rng.uniform(0.05, 1.0), 3), "shared"), {}
+
+        channel_id = request.match_info.get("channel_id")
+        if channel_id is None or request.method != "POST":
+            return None, {}
+        now = time.monotonic()
+        bucket = self._buckets.get(channel_id)
+        if bucket is None or bucket[0] <= now:
+            bucket = self._buckets[channel_id] = [now + CHANNEL_WINDOW, CHANNEL_LIMIT]
+        reset_after = round(bucket[0] - now, 3)
+        if bucket[1] == 0:
+            return self._too_many_requests(path, reset_after, "user"), {}
+        bucket[1] -= 1
+        return None, {
+            "X-RateLimit-Limit": str(CHANNEL_LIMIT),
+            "X-RateLimit-Remaining": str(bucket[1]),
+            "X-RateLimit-Reset": str(round(time.time() + reset_after, 3)),
+            "X-RateLimit-Reset-After": str(reset_after),
+            "X-RateLimit-Bucket": f"channel-{channel_id}",
+        }
+
+    def _too_many_requests(self, path, retry_after, scope):
+        self.rate_limited[path] += 1
+        return json_response(
+            {"message": "You are being rate limited.", "retry_after": retry_after, "global": False},
+            status=429,
+            headers={
+                # Without Via discord.py takes a 429 for a Cloudflare ban and gives up.
+                "Via": "1.1 google",
+                "Retry-After": str(math.ceil(retry_after)),
+                "X-RateLimit-Limit": str(CHANNEL_LIMIT),
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Reset-After": str(retry_after),
+                "X-RateLimit-Scope": scope,
+            },
+        )
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        if request.path == "/gateway":
+            return await handler(request)
+        request["received"] = time.perf_counter()
+        resource = request.match_info.route.resource
+        self.requests[f"{request.method} {resource.canonical if resource else request.path}"] += 1
+
+        await asyncio.sleep(self._delay())
+        limited, headers = self._rate_limit(request)
+        if limited is not None:
+            return limited
+        response = await handler(request)
+        response.headers.update(headers)
+        await self._notify()
+        return response
+
+    async def _payload(self, request):
+        if request.content_type.startswith("multipart/"):
+            form = await request.post()
+            value = form.get("payload_json", "{}")
+            if hasattr(value, "file"):
+                value = value.file.read()
+            return json.loads(value)
+        if request.can_read_body:
+            return await request.json()
+        return {}
+
+    # REST endpoints
+
+    async def _get_gateway(self, request):
+        return json_response(
+            {
+                "url": self.gateway_url,
+                "shards": 1,
+                "session_start_limit": {
+                    "total": 1000,
+                    "remaining": 1000,
+                    "reset_after": 0,
+                    "max_concurrency": 1,
+                },
+            }
+        )
+
+    async def _get_user(self, request):
+        return json_response(self.bot_user)
+
+    async def _get_application(self, request):
+        return json_response(
+            {
+                "id": str(self.application_id),
+                "name": self.bot_user["username"],
+                "description": "",
+                "icon": None,
+                "bot_public": True,
+                "bot_require_code_grant": False,
+                "owner": self.admin,
+                "team": None,
+                "summary": "",
+                "verify_key": "0" * 64,
+                "flags": 0,
+            }
+        )
+
+    async def _sync(self, request):
+        registered = []
+        for command in await self._payload(request):
+            command = dict(command)
+            command.setdefault("type", 1)
+            command.setdefault("default_member_permissions", None)
+            command.setdefault("dm_permission", True)
+            command["id"] = str(self.snowflake())
+            command["application_id"] = str(self.application_id)
+            command["version"] = str(self.snowflake())
+            if "guild_id" in request.match_info:
+                command["guild_id"] = request.match_info["guild_id"]
+            self.commands[command["name"]] = command
+            registered.append(command)
+        return json_response(registered)
+
+    async def _create_dm(self, request):
+        body = await self._payload(request)
+        users = [self.admin, self.bot_user] + self.members
+        recipient = next((user for user in users if user["id"] == str(body["recipient_id"])), None)
+        if recipient is None:
+            return json_response({"message": "Unknown User", "code": 10013}, status=404)
+        return json_response(
+            {
+                "id": str(int(recipient["id"]) + 1),
+                "type": 1,
+                "recipients": [recipient],
+                "last_message_id": None,
+            }
+        )
+
+    async def _send_message(self, request):
+        channel_id = request.match_info["channel_id"]
+        message = self._message(channel_id, self.bot_user, await self._payload(request))
+        self.messages[channel_id].append(message)
+        return json_response(message)
+
+    async def _callback(self, request):
+        interaction_id = int(request.match_info["interaction_id"])
+        body = await self._payload(request)
+        self.callbacks[interaction_id] = body
+        dispatched = self._dispatched.pop(interaction_id, None)
+        if dispatched is not None:
+            self.acks[interaction_id] = request["received"] - dispatched
+
+        if request.query.get("with_response") not in ("true", "True", "1"):
+            return web.Response(status=204)
+        data = body.get("data") or {}
+        message = self._message(0, self.bot_user, data)
+        return json_response(
+            {
+                "interaction": {
+                    "id": str(interaction_id),
+                    "type": 2,
+                    "activity_instance_id": None,
+                    "response_message_id": message["id"],
+                    "response_message_loading": False,
+                    "response_message_ephemeral": bool(data.get("flags", 0) & 64),
+                },
+                "resource": {"type": body.get("type"), "message": message},
+            }
+        )
+
+    async def _followup(self, request):
+        body = await self._payload(request)
+        message = self._message(0, self.bot_user, body)
+        self.followups[request.match_info["token"]].append(message)
+        return json_response(message)
+
+    async def _not_found(self, request):
+        self.unhandled[f"{request.method} {request.path}"] += 1
+        logging.warning(f"Fake Discord has no route for {request.method} {request.path}")
+        return json_response({"message": "404: Not Found", "code": 0}, status=404)
+
+    # Gateway
+
+    async def _gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets[ws] = 0
+        await ws.send_json({"op": 10, "d": {"heartbeat_interval": 41250}, "s": None, "t": None})
+        try:
+            async for msg in ws:
+                payload = json.loads(msg.data)
+                op = payload["op"]
+                if op == 1:
+                    await ws.send_json({"op": 11, "d": None, "s": None, "t": None})
+                elif op == 2:
+                    shard = payload["d"].get("shard", [0, 1])
+                    await self._send(ws, "READY", self._ready(shard))
+                    await self._send(ws, "GUILD_CREATE", self.guild_payload())
+                elif op == 6:
+                    await self._send(ws, "RESUMED", {})
+                elif op == 8:
+                    await self._send(
+                        ws,
+                        "GUILD_MEMBERS_CHUNK",
+                        {
+                            "guild_id": str(self.guild_id),
+                            "members": self.guild_payload()["members"],
+                            "chunk_index": 0,
+                            "chunk_count": 1,
+                            "nonce": payload["d"].get("nonce"),
+                        },
+                    )
+        finally:
+            self._sockets.pop(ws, None)
+        return ws
+
+    def _ready(self, shard):
+        return {
+            "v": 10,
+            "user": self.bot_user,
+            "guilds": [{"id": str(self.guild_id), "unavailable": True}],
+            "session_id": f"session-{self.snowflake()}",
+            "resume_gateway_url": self.gateway_url,
+            "shard": shard,
+            "application": {"id": str(self.application_id), "flags": 0},
+            "private_channels": [],
+            "relationships": [],
+        }
+
+    async def _send(self, ws, event, data):
+        self._sockets[ws] += 1
+        await ws.send_json({"op": 0, "t": event, "s": self._sockets[ws], "d": data})
+
+    async def dispatch(self, event, data):
+        for ws in list(self._sockets):
+            await self._send(ws, event, data)
+
+    # Interactions
+
+    async def _interact(self, user, type, data, channel="challenges", message=None):
+        interaction_id = self.snowflake()
+        channel = self.channels[channel]
+        payload = {
+            "id": str(interaction_id),
+            "application_id": str(self.application_id),
+            "type": type,
+            "data": data,
+            "guild_id": str(self.guild_id),
+            "channel_id": channel["id"],
+            "channel": channel,
+            "member": self._member(user),
+            "token": f"token-{interaction_id}",
+            "version": 1,
+            "locale": "en-US",
+            "guild_locale": "en-US",
+            "app_permissions": "0",
+            "attachment_size_limit": 25 * 1024 * 1024,
+            "entitlements": [],
+            "authorizing_integration_owners": {"0": str(self.guild_id)},
+            "context": 0,
+        }
+        if message is not None:
+            payload["message"] = message
+        self._dispatched[interaction_id] = time.perf_counter()
+        await self.dispatch("INTERACTION_CREATE", payload)
+        return interaction_id
+
+    async def command(self, user, name, **options):
+        """
+        Invokes the slash command as user, the options are sent with the type of their Python value.
+        """
+        command = self.commands.get(name, {})
+        data = {
+            "id": command.get("id", str(self.snowflake())),
+            "name": name,
+            "type": 1,
+            "options": [
+                {"name": key, "type": OPTION_TYPES[type(value)], "value": value}
+                for key, value in options.items()
+            ],
+        }
+        return await self._interact(user, 2, data)
+
+    async def submit_modal(self, user, modal, values):
+        """
+        Submits the modal of a callback, values maps the labels of its text inputs to the entered text.
+        """
+        rows = [
+            {
+                "type": 1,
+                "components": [
+                    {"type": 4, "custom_id": item["custom_id"], "value": values.get(item["label"], "")}
+                    for item in row["components"]
+                ],
+            }
+            for row in modal["components"]
+        ]
+        return await self._interact(user, 5, {"custom_id": modal["custom_id"], "components": rows})
+
+    async def click(self, user, message, custom_id):
+        """
+        Clicks the button custom_id of a message the bot sent.
+        """
+        data = {"custom_id": custom_id, "component_type": 2}
+        return await self._interact(user, 3, data, message=message)
@@ -0,0 +1,125 @@
+# benchmarks/fakes.py - Minimal stand-ins for the discord.py objects the cogs touch, for driving commands without Discord.
+#
+# Only the attributes and coroutines the cogs actually use are implemented. Every send is recorded in memory
+# and the interaction response records when it was sent, so the harness can measure time to acknowledgement.
+
+import itertools
+import time
+
+_ids = itertools.count(10_000)
+
+
+class FakeMessage:
+    def __init__(self, content=None, **kwargs):
+        self.id = next(_ids)
+        self.content = content
+        self.kwargs = kwargs
+
+
+class FakeMessageable:
+    def __init__(self, id=None, name=""):
+        self.id = id if id is not None else next(_ids)
+        self.name = name
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(content, **kwargs)
+        self.sent.append(message)
+        return message
+
+
+class FakeChannel(FakeMessageable):
+    pass
+
+
+class FakeRole:
+    def __init__(self, id=None, name="role"):
+        self.id = id if id is not None else next(_ids)
+        self.name = name
+
+
+class FakeUser(FakeMessageable):
+    def __init__(self, id=None, name=None, roles=()):
+        super().__init__(id)
+        self.name = name or f"user{self.id}"
+        self.roles = list(roles)
+        self.avatar = None
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+
+class FakeGuild:
+    def __init__(self, id=None, name="guild", roles=(), channels=()):
+        self.id = id if id is not None else next(_ids)
+        self.name = name
+        self.roles = list(roles)
+        self.channels = list(channels)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+        self.messages = []
+        self.responded_at = None
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        if self._done:
+            raise RuntimeError("This interaction has already been responded to before")
+        self._done = True
+        self.responded_at = time.perf_counter()
+        self.messages.append(FakeMessage(content, **kwargs))
+
+    async def send_modal(self, modal):
+        await self.send_message(modal=modal)
+
+    async def defer(self, **kwargs):
+        await self.send_message(**kwargs)
+
+
+class FakeInteraction:
+    def __init__(self, guild, user):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.response = FakeResponse(self)
+        self.followup = FakeMessageable()
+        self.created_at = time.perf_counter()
+
+    @property
+    def ack_latency(self):
+        if self.response.responded_at is None:
+            return None
+        return self.response.responded_at - self.created_at
+
+    @property
+    def reply(self):
+        messages = self.response.messages
+        return messages[0].content if messages else None
+
+
+class FakeBot:
+    def __init__(self, guild, users=()):
+        self.user = FakeUser(name="DailyCTF Robot")
+        self.guilds = [guild]
+        self.latency = 0.0
+        self._channels = {channel.id: channel for channel in guild.channels}
+        self._users = {user.id: user for user in users}
+
+    def add_user(self, user):
+        self._users[user.id] = user
+        return user
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def get_user(self, user_id):
+        return self._users.get(user_id)
+
+    def remove_command(self, name):
+        return None
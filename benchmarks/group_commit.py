@@ -0,0 +1,65 @@
+# benchmarks/group_commit.py - Throughput of solve/rating writes with and without group commit.
+#
+# Usage: python -m benchmarks.group_commit [--writes 2000] [--synchronous FULL]
+#
+# The "per-write" run commits every solve and rating on its own (db_utils.register_solve / insert_rating),
+# the "batched" run goes through AsyncDatabase, which group-commits them with WriteBatcher.
+# Use --synchronous FULL to see the effect when every commit pays for an fsync.
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from cogs import db_utils
+from cogs.async_db import AsyncDatabase
+
+GUILD_ID = 1
+
+
+async def per_write(database, user_id):
+    await database.run(db_utils.register_solve, GUILD_ID, user_id)
+    await database.run(db_utils.insert_rating, GUILD_ID, user_id, user_id % 5 + 1)
+
+
+async def batched(database, user_id):
+    await database.register_solve(GUILD_ID, user_id)
+    await database.insert_rating(GUILD_ID, user_id, user_id % 5 + 1)
+
+
+async def run(name, write, path, writes, synchronous):
+    database = AsyncDatabase(path)
+    await database.run(lambda con: con.execute(f"PRAGMA synchronous = {synchronous}"))
+    await database.insert_challenge(GUILD_ID, (1, "bench", "flag", "", "hint", ""))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(write(database, user_id) for user_id in range(writes)))
+    elapsed = time.perf_counter() - started
+
+    solves = await database.len_leaderboard(GUILD_ID)
+    await database.close()
+    print(
+        f"{name:>9}: {writes} solves + {writes} ratings in {elapsed:.3f}s "
+        f"({2 * writes / elapsed:,.0f} writes/s, {solves} solves stored)"
+    )
+    return elapsed
+
+
+async def main(writes, synchronous):
+    with tempfile.TemporaryDirectory() as tmp:
+        slow = await run(
+            "per-write", per_write, os.path.join(tmp, "a.db"), writes, synchronous
+        )
+        fast = await run(
+            "batched", batched, os.path.join(tmp, "b.db"), writes, synchronous
+        )
+        print(f"speedup: {slow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Group commit throughput.")
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"])
+    args = parser.parse_args()
+    asyncio.run(main(args.writes, args.synchronous))
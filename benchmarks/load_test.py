@@ -0,0 +1,219 @@
+# benchmarks/load_test.py - Load test of the slash command hot paths with fake Discord objects.
+#
+# Usage: python -m benchmarks.load_test [--users 2000] [--wrong 0.5] [--timeleft 1000] [--output results.json]
+#
+# Drives the real command callbacks (submit, the rating buttons, timeleft and shutdown) with the stand-ins of
+# benchmarks/fakes.py against a temporary database. Every user submits a wrong flag with probability --wrong and
+# then the correct one, all concurrently, and every solver clicks a rating. For each phase it reports throughput,
+# p50/p95/p99 latency of the whole callback and of the interaction acknowledgement, event-loop lag and the time
+# spent in database calls. The results are written as JSON under benchmarks/results/ so runs can be compared.
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from cogs import dispatcher as dispatcher_module
+from cogs.async_db import db
+from cogs.dispatcher import dispatcher
+from cogs.fanout import fanout
+from cogs.AdminCommands import AdminCommands
+from cogs.GeneralCommands import GeneralCommands
+from cogs.utils import RateButton
+
+from .event_loop_lag import probe
+from .fakes import FakeBot, FakeChannel, FakeGuild, FakeInteraction, FakeRole, FakeUser
+
+FLAG = "flag{load_test}"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class DatabaseTimer:
+    """
+    Wraps AsyncDatabase._call to add up the time spent running db_utils functions on the worker threads.
+    """
+
+    def __init__(self, database):
+        self.seconds = 0.0
+        self.calls = 0
+        self._lock = threading.Lock()
+        call = database._call
+
+        def timed(connect, func, *args):
+            start = time.perf_counter()
+            try:
+                return call(connect, func, *args)
+            finally:
+                with self._lock:
+                    self.seconds += time.perf_counter() - start
+                    self.calls += 1
+
+        database._call = timed
+
+    def reset(self):
+        with self._lock:
+            seconds, calls = self.seconds, self.calls
+            self.seconds, self.calls = 0.0, 0
+        return seconds, calls
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    if len(samples) == 1:
+        value = samples[0] * 1000
+        return {"p50": value, "p95": value, "p99": value, "max": value}
+    cuts = statistics.quantiles(samples, n=100)
+    return {
+        "p50": cuts[49] * 1000,
+        "p95": cuts[94] * 1000,
+        "p99": cuts[98] * 1000,
+        "max": max(samples) * 1000,
+    }
+
+
+async def run_phase(name, timer, calls):
+    """
+    Runs the (callback, interaction, args) calls concurrently and measures them.
+    """
+    lags = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.05)  # Let the probe settle before the burst.
+    timer.reset()
+
+    latencies = []
+
+    async def timed(callback, interaction, args):
+        start = time.perf_counter()
+        interaction.created_at = start
+        await callback(interaction, *args)
+        latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(*call) for call in calls))
+    elapsed = time.perf_counter() - started
+    db_seconds, db_calls = timer.reset()
+
+    stop.set()
+    await probe_task
+
+    acks = [interaction.ack_latency for _, interaction, _ in calls if interaction.ack_latency is not None]
+    replies = {}
+    for _, interaction, _ in calls:
+        reply = (interaction.reply or "<no reply>").split("!")[0]
+        replies[reply] = replies.get(reply, 0) + 1
+
+    result = {
+        "calls": len(calls),
+        "seconds": elapsed,
+        "throughput": len(calls) / elapsed if elapsed else None,
+        "latency_ms": percentiles(latencies),
+        "ack_ms": percentiles(acks),
+        "loop_lag_ms": percentiles(lags),
+        "db_seconds": db_seconds,
+        "db_calls": db_calls,
+        "replies": replies,
+    }
+    latency = result["latency_ms"]
+    print(
+        f"{name:>9}: {len(calls)} calls in {elapsed:.2f}s ({result['throughput']:,.0f}/s) | "
+        f"latency p50 {latency['p50']:.2f} ms, p95 {latency['p95']:.2f} ms, p99 {latency['p99']:.2f} ms | "
+        f"loop lag p99 {result['loop_lag_ms']['p99']:.2f} ms | db {db_seconds:.3f}s in {db_calls} calls"
+    )
+    return result
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    # The fake channels have no rate limits, don't let the dispatcher pace the sends as if they had.
+    dispatcher_module.ROUTE_RATE = 1e9
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.path = os.path.join(tmp, "load_test.db")
+        timer = DatabaseTimer(db)
+
+        creators = FakeRole(name="CTF creators")
+        channel = FakeChannel(name="challenges")
+        leaderboard = FakeChannel(name="leaderboard")
+        guild = FakeGuild(roles=[creators], channels=[channel, leaderboard])
+        admin = FakeUser(name="admin", roles=[creators])
+        bot = FakeBot(guild, [admin])
+        users = [bot.add_user(FakeUser()) for _ in range(args.users)]
+
+        await db.update_config(guild.id, "channel_id", channel.id)
+        await db.update_config(guild.id, "leaderboard_channel_id", leaderboard.id)
+        await db.update_config(guild.id, "ctf_creators", creators.id)
+        await db.insert_challenge(guild.id, (admin.id, "Load test", FLAG, "", "No hints", ""))
+        if not args.keep_rate_limit:
+            await db.update_rate_limit(guild.id, 600, 100)
+
+        general = GeneralCommands(bot)
+        admin_commands = AdminCommands(bot)
+        submit = lambda interaction, flag: GeneralCommands.submit.callback(general, interaction, flag)
+        timeleft = lambda interaction: GeneralCommands.timeleft.callback(general, interaction)
+        shutdown = lambda interaction: AdminCommands.shutdown.callback(admin_commands, interaction)
+
+        attempts = []
+        for user in users:
+            if rng.random() < args.wrong:
+                attempts.append((submit, FakeInteraction(guild, user), ("flag{wrong}",)))
+            attempts.append((submit, FakeInteraction(guild, user), (FLAG,)))
+        rng.shuffle(attempts)
+
+        results = {"submit": await run_phase("submit", timer, attempts)}
+
+        buttons = [RateButton(rating) for rating in range(1, 6)]
+        clicks = [
+            (rng.choice(buttons).callback, FakeInteraction(guild, user), ())
+            for user in users
+        ]
+        results["rate"] = await run_phase("rate", timer, clicks)
+
+        checks = [
+            (timeleft, FakeInteraction(guild, rng.choice(users)), ())
+            for _ in range(args.timeleft)
+        ]
+        results["timeleft"] = await run_phase("timeleft", timer, checks)
+
+        results["shutdown"] = await run_phase(
+            "shutdown", timer, [(shutdown, FakeInteraction(guild, admin), ())]
+        )
+
+        await fanout.drain()
+        await dispatcher.drain()
+        await db.close()
+
+    report = {
+        "timestamp": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "args": vars(args),
+        "phases": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load_test-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the slash command hot paths.")
+    parser.add_argument("--users", type=int, default=2000, help="users submitting (and rating) concurrently")
+    parser.add_argument("--wrong", type=float, default=0.5, help="probability of a wrong guess before the correct one")
+    parser.add_argument("--timeleft", type=int, default=1000, help="number of /timeleft calls")
+    parser.add_argument("--keep-rate-limit", action="store_true", help="keep the default /submit rate limit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file for the results (default: benchmarks/results/load_test-<time>.json)")
+    asyncio.run(main(parser.parse_args()))
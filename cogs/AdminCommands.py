@@ -7,30 +7,25 @@ from .utils import (
     end_challenge,
     calculate_average_rating,
 )
-from .db_utils import (
-    db_init,
-    fetch_config,
-    insert_challenge,
-    fetch_challenge_data,
-    fetch_leaderboard_data,
-    remove_challenge_data,
-    generate_title
-)
+from .async_db import db
+from .scheduler import scheduler
+from .dispatcher import dispatcher
+from .metrics import metrics, instrument_cog
+from .attachments import attachment_store
+from .fanout import fanout
+from .flags import FlagVerifier, hash_flags
+from .ratelimit import submit_limiter, DEFAULT_RATE, DEFAULT_BURST
+from typing import Optional
 import logging
 import datetime
+import os
+import re
 from discord.ui import Modal, TextInput
 from discord import TextStyle
 
-# Initialize logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s"
-)
-logging.getLogger("werkzeug").setLevel(logging.ERROR)
-logging.getLogger("flask.app").setLevel(logging.ERROR)
+# Base URL of a web server serving the attachment store directory, optional.
+ATTACHMENT_MIRROR_URL = os.environ.get("ATTACHMENT_MIRROR_URL")
 
-# Initialize connection to database
-con = db_init()
-config = fetch_challenge_data(con)
 
 class AttachmentsButton(discord.ui.View):
     """
@@ -44,6 +39,31 @@ class AttachmentsButton(discord.ui.View):
         self.add_item(button)
 
 
+async def post_with_attachment(guild_id, challenge_channel, challenge_ping, embed, url):
+    """
+    Downloads the attachment of a new challenge into the attachment store, then posts the challenge with
+    the stored copy: linked from the local mirror if ATTACHMENT_MIRROR_URL is set, otherwise uploaded to
+    Discord if it fits the server's upload limit. The original link is kept as a fallback.
+    """
+    stored = None
+    try:
+        stored = await attachment_store.fetch(url, keep=await db.fetch_attachment_hashes())
+        await db.update_attachment(guild_id, stored.sha256)
+    except Exception as e:
+        logging.warning(f"Could not store the attachment {url}: {e!r}")
+
+    link = url
+    kwargs = {}
+    if stored is not None:
+        if ATTACHMENT_MIRROR_URL:
+            link = f"{ATTACHMENT_MIRROR_URL.rstrip('/')}/{stored.sha256[:2]}/{stored.sha256}"
+        elif stored.size <= challenge_channel.guild.filesize_limit:
+            kwargs["file"] = discord.File(stored.path, filename=stored.name)
+
+    dispatcher.send(challenge_channel, challenge_ping)
+    dispatcher.send(challenge_channel, embed=embed, view=AttachmentsButton(link), **kwargs)
+
+
 # Modal Class to handle the setchallenge
 
 class SetChallengeModal(discord.ui.Modal):
@@ -52,9 +72,8 @@ class SetChallengeModal(discord.ui.Modal):
     The title of the modal is dynamically generated by a helper function
     in db_utils.py, Which fetches the data from the database for each invoke and displays it.
     """
-    def __init__(self, bot, config):
-        #super().__init__()
-        super().__init__(title=generate_title(con))
+    def __init__(self, bot, config, title):
+        super().__init__(title=title)
         self.bot = bot
         self.config = config
 
@@ -67,10 +86,11 @@ class SetChallengeModal(discord.ui.Modal):
     )
 
     answer_input = discord.ui.TextInput(
-        style=discord.TextStyle.short,
+        style=discord.TextStyle.long,
         label="Answer",
         required=True,
-        placeholder="Answer to the challenge",
+        max_length=1000,
+        placeholder="One flag per line, prefixes nocase: nowrap: re:, reveal: text shown at the end",
     )
 
     attachment_input = discord.ui.TextInput(
@@ -107,35 +127,59 @@ class SetChallengeModal(discord.ui.Modal):
             hints = self.hints_input.value
             writeup = self.writeup_input.value
 
-            insert_challenge(
-                con,
+            try:
+                verifier = FlagVerifier(hash_flags(answer))
+            except re.error as e:
+                await interaction.response.send_message(
+                    f"Invalid regular expression in the answer: {e}", ephemeral=True
+                )
+                return
+            # Without an accepted flag every submission would be wrong.
+            if not verifier:
+                await interaction.response.send_message(
+                    "The answer has no flag, add at least one flag line besides the reveal: line.",
+                    ephemeral=True,
+                )
+                return
+
+            await db.insert_challenge(
+                interaction.guild_id,
                 (interaction.user.id, description, answer, attachment, hints, writeup),
             )
 
-            challenge_data = fetch_challenge_data(con)
+            challenge_data = (await db.active_challenge(interaction.guild_id)).challenge
+            submit_limiter.reset(interaction.guild_id)
+            # Replaces the hint/end events of the previous challenge straight away.
+            await scheduler.schedule_challenge(interaction.guild_id, challenge_data)
 
             # Maybe in the future I will change this to a specific role during setup process
             challenge_ping = "@everyone"
 
-            embed = discord.Embed(title=f"Day: {challenge_data['day']} Challenge")
+            embed = discord.Embed(title=f"Day: {challenge_data.day} Challenge")
             embed.add_field(
-                name="Description:", value=f"```{challenge_data['description']}```"
+                name="Description:", value=f"```{challenge_data.description}```"
             )
             embed.set_footer(text=f"Challenge submitted by {interaction.user.name}")
-            challenge_channel = self.bot.get_channel(int(self.config["channel_id"]))
+            challenge_channel = self.bot.get_channel(self.config.channel_id)
 
             # idk, for what reason is None reurning false positives ?_?
-            if len(challenge_data["attachment"]) == 0:  # if no url is entered, we will not call the AttachmentsButton class
-                await challenge_channel.send(challenge_ping)
-                await challenge_channel.send(embed=embed)
+            if len(challenge_data.attachment) == 0:  # if no url is entered, we will not call the AttachmentsButton class
+                dispatcher.send(challenge_channel, challenge_ping)
+                dispatcher.send(challenge_channel, embed=embed)
             else:
-                await challenge_channel.send(challenge_ping)
-                await challenge_channel.send(
-                    embed=embed, view=AttachmentsButton(challenge_data["attachment"])
+                # The attachment is copied to the local store before the challenge is posted, in the
+                # background so the modal is still answered straight away.
+                fanout.submit(
+                    post_with_attachment,
+                    interaction.guild_id,
+                    challenge_channel,
+                    challenge_ping,
+                    embed,
+                    challenge_data.attachment,
                 )
 
             await interaction.response.send_message(
-                f"Challenge set successfully for Day {challenge_data['day']}!",
+                f"Challenge set successfully for Day {challenge_data.day}!",
                 ephemeral=True,
             )
 
@@ -154,23 +198,20 @@ class SetChallengeModal(discord.ui.Modal):
 class AdminCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        try:
-            self.config = fetch_config(con)
-        except Exception as e:
-            logging.error(f"Error loading config: {e}")
 
     @discord.app_commands.command(
         name="setchallenge", description="Create a new challenge"
     )
+    @discord.app_commands.guild_only()
     async def setchallenge(self, interaction: discord.Interaction) -> None:
         """
         Function responsible for the creation of new challenges, handles things like,
         Is user the part of the ctf_creator guild and if the config is empty.
         """
         try:
-            self.config = fetch_config(con)
+            config = await db.config(interaction.guild_id)
 
-            if self.config is None:
+            if config is None:
                 await interaction.response.send_message(
                     "Failed to fetch config, Did you run `/setup`?", ephemeral=True
                 )
@@ -178,11 +219,13 @@ class AdminCommands(commands.Cog):
 
             if (
                 discord.utils.get(
-                    interaction.guild.roles, id=self.config["ctf_creators"]
+                    interaction.guild.roles, id=config.ctf_creators
                 )
                 in interaction.user.roles
             ):
-                modal = SetChallengeModal(self.bot, self.config)
+                modal = SetChallengeModal(
+                    self.bot, config, await db.generate_title(interaction.guild_id)
+                )
                 await interaction.response.send_modal(modal)
             else:
                 await interaction.response.send_message(
@@ -197,15 +240,16 @@ class AdminCommands(commands.Cog):
     @discord.app_commands.command(
         name="shutdown", description="Shutdowns active challenge"
     )
+    @discord.app_commands.guild_only()
     async def shutdown(self, interaction: discord.Interaction) -> None:
         """
         Function responsible for shutting down challenge and displaying neccessary things like,
         printing the database, announcing the answer with average ratings and clearing the database
         """
         try:
-            self.config = fetch_config(con)
-            self.leaderboard_data = fetch_leaderboard_data(con)
-            if self.config is None:
+            config = await db.config(interaction.guild_id)
+            leaderboard_data = await db.fetch_leaderboard_data(interaction.guild_id)
+            if config is None:
                 await interaction.response.send_message(
                     "Failed to fetch config, Did you run `/setup`?"
                 )
@@ -213,7 +257,7 @@ class AdminCommands(commands.Cog):
 
             if (
                 discord.utils.get(
-                    interaction.guild.roles, id=int(self.config["ctf_creators"])
+                    interaction.guild.roles, id=config.ctf_creators
                 )
                 not in interaction.user.roles
             ):
@@ -223,7 +267,7 @@ class AdminCommands(commands.Cog):
                 )
                 return
 
-            challenge_data = fetch_challenge_data(con)
+            challenge_data = (await db.active_challenge(interaction.guild_id)).challenge
             if not challenge_data:
                 await interaction.response.send_message(
                     "No active challenge to shut down.", ephemeral=True
@@ -231,33 +275,47 @@ class AdminCommands(commands.Cog):
                 return
 
             challenge_channel = self.bot.get_channel(
-                int(self.config["leaderboard_channel_id"])
+                config.leaderboard_channel_id
             )
-            if self.leaderboard_data:
-                await display_leaderboard(self.bot)
+            if leaderboard_data:
+                await display_leaderboard(self.bot, interaction.guild_id)
             else:
-                await challenge_channel.send("No one has solved the challenge yet.")
+                dispatcher.send(
+                    challenge_channel, "No one has solved the challenge yet.", merge=True
+                )
 
-            await challenge_channel.send(
-                f"Correct answer for Day-{challenge_data['day']} was: ||`{challenge_data['answer']}`||"
-            )
-            if challenge_data["writeup"]:
-                await challenge_channel.send(
-                    f"Official Writeup: {challenge_data['writeup']}"
+            if challenge_data.answer:
+                dispatcher.send(
+                    challenge_channel,
+                    f"Correct answer for Day-{challenge_data.day} was: ||`{challenge_data.answer}`||",
+                    merge=True,
+                )
+            if challenge_data.writeup:
+                dispatcher.send(
+                    challenge_channel,
+                    f"Official Writeup: {challenge_data.writeup}",
+                    merge=True,
                 )
             else:
-                await challenge_channel.send(
-                    f"No official writeup for Day-{challenge_data['day']}"
+                dispatcher.send(
+                    challenge_channel,
+                    f"No official writeup for Day-{challenge_data.day}",
+                    merge=True,
                 )
-            avg = calculate_average_rating()
+            avg = await calculate_average_rating(interaction.guild_id)
             if avg is not None:
-                await challenge_channel.send(
-                    f"The average rating for the challenge is: {avg:.2f}"
+                dispatcher.send(
+                    challenge_channel,
+                    f"The average rating for the challenge is: {avg:.2f}",
+                    merge=True,
                 )
             else:
-                await challenge_channel.send("No ratings received for the challenge.")
+                dispatcher.send(
+                    challenge_channel, "No ratings received for the challenge.", merge=True
+                )
 
-            remove_challenge_data(con)
+            await db.remove_challenge_data(interaction.guild_id)
+            await scheduler.cancel(interaction.guild_id)
             await interaction.response.send_message(
                 "Challenge has been shut down and leaderboard has been printed.",
                 ephemeral=True,
@@ -269,5 +327,192 @@ class AdminCommands(commands.Cog):
             )
 
 
+    @discord.app_commands.command(
+        name="newseason", description="Start a new season of the leaderboard"
+    )
+    @discord.app_commands.guild_only()
+    async def newseason(self, interaction: discord.Interaction) -> None:
+        """
+        Bumps the season in the config, solves from now on count towards the new season's standings.
+        The all-time standings are not affected.
+        """
+        try:
+            config = await db.config(interaction.guild_id)
+            if config is None:
+                await interaction.response.send_message(
+                    "Failed to fetch config, Did you run `/setup`?", ephemeral=True
+                )
+                return
+
+            if (
+                discord.utils.get(
+                    interaction.guild.roles, id=config.ctf_creators
+                )
+                not in interaction.user.roles
+            ):
+                await interaction.response.send_message(
+                    "You don't have permission to start a new season!",
+                    ephemeral=True,
+                )
+                return
+
+            season = (config.season or 1) + 1
+            await db.update_config(interaction.guild_id, "season", season)
+            await interaction.response.send_message(f"Season {season} has started!")
+        except Exception as e:
+            logging.error(f"Error in newseason: {e}")
+            await interaction.response.send_message(
+                "Failed to start a new season. Please check logs.", ephemeral=True
+            )
+
+    @discord.app_commands.command(
+        name="ratelimit",
+        description="Show or change the /submit rate limit of the active challenge",
+    )
+    @discord.app_commands.describe(
+        per_minute="Attempts each user gets back per minute",
+        burst="Attempts a user can make in a row",
+    )
+    @discord.app_commands.guild_only()
+    async def ratelimit(
+        self,
+        interaction: discord.Interaction,
+        per_minute: Optional[discord.app_commands.Range[float, 0.1, 600.0]] = None,
+        burst: Optional[discord.app_commands.Range[int, 1, 100]] = None,
+    ) -> None:
+        """
+        Without arguments it shows the current limits and how many attempts were let through or rejected,
+        otherwise it sets the limits (an omitted one is reset to the default) for the rest of the challenge.
+        """
+        try:
+            config = await db.config(interaction.guild_id)
+            if config is None:
+                await interaction.response.send_message(
+                    "Failed to fetch config, Did you run `/setup`?", ephemeral=True
+                )
+                return
+
+            if (
+                discord.utils.get(
+                    interaction.guild.roles, id=config.ctf_creators
+                )
+                not in interaction.user.roles
+            ):
+                await interaction.response.send_message(
+                    "You don't have permission to change the rate limit!",
+                    ephemeral=True,
+                )
+                return
+
+            challenge_data = (await db.active_challenge(interaction.guild_id)).challenge
+            if not challenge_data:
+                await interaction.response.send_message(
+                    "No active challenge currently!", ephemeral=True
+                )
+                return
+
+            if per_minute is not None or burst is not None:
+                await db.update_rate_limit(interaction.guild_id, per_minute, burst)
+                challenge_data = (await db.active_challenge(interaction.guild_id)).challenge
+
+            stats = submit_limiter.stats(interaction.guild_id)
+            await interaction.response.send_message(
+                f"Rate limit for Day-{challenge_data.day}: "
+                f"{challenge_data.submit_rate or DEFAULT_RATE:g} attempts per minute, "
+                f"bursts of {challenge_data.submit_burst or DEFAULT_BURST}.\n"
+                f"Attempts allowed: {stats['allowed']}, rejected: {stats['rejected']}, "
+                f"users tracked: {stats['tracked']}",
+                ephemeral=True,
+            )
+        except Exception as e:
+            logging.error(f"Error in ratelimit: {e}")
+            await interaction.response.send_message(
+                "Failed to update the rate limit. Please check logs.", ephemeral=True
+            )
+
+    @discord.app_commands.command(
+        name="stats", description="Latency and call counts of the bot's commands and queries"
+    )
+    @discord.app_commands.guild_only()
+    async def stats(self, interaction: discord.Interaction) -> None:
+        """
+        Shows the command and database timings recorded since the bot started (for the whole bot, not
+        only this server) and the depth of the background queues.
+        """
+        try:
+            config = await db.config(interaction.guild_id)
+            if config is None:
+                await interaction.response.send_message(
+                    "Failed to fetch config, Did you run `/setup`?", ephemeral=True
+                )
+                return
+
+            if (
+                discord.utils.get(
+                    interaction.guild.roles, id=config.ctf_creators
+                )
+                not in interaction.user.roles
+            ):
+                await interaction.response.send_message(
+                    "You don't have permission to view the stats!", ephemeral=True
+                )
+                return
+
+            command_stats = sorted(metrics.snapshot("command"), key=lambda s: -s.calls)
+            query_stats = sorted(metrics.snapshot("query"), key=lambda s: -s.total)
+            command_lines = [
+                f"`/{s.name}`: {s.calls:,} calls, {s.errors} errors, "
+                f"p50 {_format_bound(s.quantile(0.5))}, p99 {_format_bound(s.quantile(0.99))}"
+                for s in command_stats
+                if s.calls
+            ]
+            query_lines = [
+                f"`{s.name}`: {s.calls:,} calls, {s.total:.2f}s total, "
+                f"p99 {_format_bound(s.quantile(0.99))}, {s.rows:,} rows"
+                for s in query_stats
+                if s.calls
+            ]
+            queue_lines = [
+                f"Dispatcher: {dispatcher.depth} queued, {dispatcher.sent:,} sent, {dispatcher.merged:,} merged, "
+                f"{dispatcher.retried:,} retried, {dispatcher.failed:,} failed",
+                f"Fan-out: {fanout.depth} queued, {fanout.completed:,} done, {fanout.failed:,} failed, "
+                f"{fanout.dropped:,} dropped",
+            ]
+
+            embed = discord.Embed(title="📊 Bot stats", color=discord.Color.blue())
+            embed.add_field(name="Commands", value=_field_value(command_lines), inline=False)
+            embed.add_field(name="Database (by total time)", value=_field_value(query_lines), inline=False)
+            embed.add_field(name="Queues", value=_field_value(queue_lines), inline=False)
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        except Exception as e:
+            logging.error(f"Error in stats: {e}")
+            await interaction.response.send_message(
+                "Failed to fetch the stats. Please check logs.", ephemeral=True
+            )
+
+
+def _format_bound(seconds):
+    # Histogram quantiles are bucket upper bounds, hence the ≤.
+    if seconds is None:
+        return "-"
+    if seconds == float("inf"):
+        return ">10 s"
+    if seconds < 0.001:
+        return f"≤{seconds * 1_000_000:g} µs"
+    if seconds < 1:
+        return f"≤{seconds * 1000:g} ms"
+    return f"≤{seconds:g} s"
+
+
+def _field_value(lines, limit=1024):
+    # Embed fields hold at most 1024 characters, the lines are sorted so the least interesting ones are cut.
+    value = ""
+    for line in lines:
+        if len(value) + len(line) + 1 > limit:
+            break
+        value += line + "\n"
+    return value or "Nothing recorded yet."
+
+
 async def setup(bot) -> None:
-    await bot.add_cog(AdminCommands(bot))
+    await bot.add_cog(instrument_cog(AdminCommands(bot)))
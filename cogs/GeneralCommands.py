@@ -9,30 +9,16 @@ from .utils import (
     RateView,
     RateButton,
 )
-from .db_utils import (
-    db_init,
-    fetch_config,
-    insert_rating,
-    fetch_challenge_data,
-    insert_leaderboard,
-    len_leaderboard,
-    fetch_rating,
-    check_leaderboard,
-)
+from .async_db import db
+from .ratelimit import submit_limiter, RATE_LIMITED_MESSAGE
+from .fanout import fanout
+from .dispatcher import dispatcher
+from .metrics import instrument_cog
+from .feedback import feedback_outbox
+from .standings import ALL_TIME
+from typing import Optional
 import logging
 import datetime
-import aiohttp
-
-# Initialize logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s"
-)
-# Stopping keep_alive log messages as they make hard to read and are useless
-# Suppress Flask development server log
-logging.getLogger("werkzeug").setLevel(logging.ERROR)
-logging.getLogger("flask.app").setLevel(logging.ERROR)
-
-con = db_init()
 
 # Class to handle the feedback forms
 
@@ -61,20 +47,13 @@ class FeedbackModal(discord.ui.Modal, title="Send us your feedback"):
             color=discord.Color.yellow(),
         )
         embed.set_author(
-            name=interaction.user.name, icon_url=interaction.user.avatar.url
+            name=interaction.user.name, icon_url=interaction.user.display_avatar.url
         )
 
-        # Send the feedback to the feedback channel via webhook
-        async with aiohttp.ClientSession() as session:
-            try:
-                webhook = discord.Webhook.from_url(
-                    "https://discord.com/api/webhooks/1231415807549112360/hIUh0IQA6Cby1hThcZCUkTSEzslJEn7PdoWfNDpnzItgHZk85kBT5h20KxXDTx37yAVe",
-                    session=session,
-                )
-                # Send the feedback via the webhook
-                await webhook.send(embed=embed)
-            except Exception as e:
-                logging.error(e)
+        # Stored in the outbox and sent to the feedback webhook in the background, so a slow or failing
+        # webhook neither delays the answer nor loses the feedback.
+        if await feedback_outbox.put(embed.to_dict()) is None:
+            raise RuntimeError("Feedback could not be stored")
 
         await interaction.response.send_message(
             "Thank you for your feedback! Join the Official bot server to check the status of your feedback here: https://discord.gg/CTWQm7KjCn",
@@ -93,12 +72,14 @@ class GeneralCommands(commands.Cog):
         self.bot = bot
         # Overriding default discord help message for our very own embeded one.
         self.bot.remove_command("help")
-        self.config = fetch_config(con)
 
     @discord.app_commands.command(name="submit", description="Used to Submit flag.")
+    @discord.app_commands.guild_only()
     async def submit(self, interaction: discord.Interaction, flag: str) -> None:
-        self.config = fetch_config(con)
-        challenge_data = fetch_challenge_data(con)
+        # Everything up to the solve itself is answered from the guild's in-memory cache.
+        active = await db.active_challenge(interaction.guild_id)
+        config = active.config
+        challenge_data = active.challenge
 
         if not challenge_data:
             await interaction.response.send_message(
@@ -106,79 +87,91 @@ class GeneralCommands(commands.Cog):
             )
             return
 
-        if challenge_data["answer"] != "" and check_leaderboard(
-            con, interaction.user.id
+        # Brute force guard, checked before any other work is done for the attempt.
+        if not submit_limiter.allow(
+            interaction.guild_id,
+            interaction.user.id,
+            challenge_data.submit_rate,
+            challenge_data.submit_burst,
         ):
+            await interaction.response.send_message(RATE_LIMITED_MESSAGE, ephemeral=True)
+            return
+
+        if active.verifier is not None and active.has_solved(interaction.user.id):
             await interaction.response.send_message(
                 "You've already submitted the correct answer!", ephemeral=True
             )
             return
 
-        if challenge_data["answer"] != "" and challenge_data["answer"] == flag:
-            leaderboard_length = len_leaderboard(con)
-            # Checking if we can insert the user id or if it already exsists?
-            if insert_leaderboard(con, interaction.user.id):
-
-                master = self.bot.get_user(challenge_data["master_id"])
-                if master != "":
-                    await master.send(
-                        f"{interaction.user.name} just solved the challenge!"
-                    )
-
-                    challenge_channel = self.bot.get_channel(
-                        self.config["leaderboard_channel_id"]
-                    )
-                    # Logic for the leaderboard messages
-                    if leaderboard_length == 0:
-                        await challenge_channel.send(
-                            f"🚩 First Blood! {interaction.user.mention} just conquered today's challenge! Only two top spots left. Who's claiming the next one?"
-                        )
-                        await interaction.response.send_message(
-                            "Incredible! You've stormed through the challenge and secured the top spot!",
-                            ephemeral=True,
-                        )
-                        await check_rating(interaction)
-                    elif leaderboard_length == 1:
-                        await challenge_channel.send(
-                            f"🎉 Bravo! {interaction.user.mention} secures the second spot! Only one more top spot remaining. Who's taking it?"
-                        )
-                        await interaction.response.send_message(
-                            "Fantastic! You've secured the second top spot! Let's see who claims the last!",
-                            ephemeral=True,
-                        )
-                        await check_rating(interaction)
-                    elif leaderboard_length == 2:
-                        await challenge_channel.send(
-                            f"🔥 {interaction.user.mention} clinches the third spot! Top spots are taken but the game's still on! ⚡ Push your limits!"
-                        )
-                        await interaction.response.send_message(
-                            "Great job grabbing the third spot! Keep this energy up for the next challenges!",
-                            ephemeral=True,
-                        )
-                        await check_rating(interaction)
-                        display_leaderboard(self.bot)
-                    else:
-                        await interaction.response.send_message(
-                            f"Correct answer! You're in position {leaderboard_length+1}. Push harder next time to claim a top spot!",
-                            ephemeral=True,
-                        )
-                        await check_rating(interaction)
-                else:
-                    await interaction.response.send_message(
-                        "You've already submitted!", ephemeral=True
-                    )
+        # The cached verifier checks the flag against the salted hashes of every accepted flag.
+        if active.check_flag(flag):
+            # A second solve is rejected by the unique index, the rank comes from the same transaction.
+            rank = await db.register_solve(interaction.guild_id, interaction.user.id)
+            if rank is None:
+                await interaction.response.send_message(
+                    "You've already submitted!", ephemeral=True
+                )
+                return
+
+            # Logic for the leaderboard messages
+            announcement = None
+            if rank == 1:
+                announcement = f"🚩 First Blood! {interaction.user.mention} just conquered today's challenge! Only two top spots left. Who's claiming the next one?"
+                reply = "Incredible! You've stormed through the challenge and secured the top spot!"
+            elif rank == 2:
+                announcement = f"🎉 Bravo! {interaction.user.mention} secures the second spot! Only one more top spot remaining. Who's taking it?"
+                reply = "Fantastic! You've secured the second top spot! Let's see who claims the last!"
+            elif rank == 3:
+                announcement = f"🔥 {interaction.user.mention} clinches the third spot! Top spots are taken but the game's still on! ⚡ Push your limits!"
+                reply = "Great job grabbing the third spot! Keep this energy up for the next challenges!"
+            else:
+                reply = f"Correct answer! You're in position {rank}. Push harder next time to claim a top spot!"
+
+            # Acknowledge the solver first, everything else is queued (the dispatcher for messages,
+            # the fan-out queue for work that reads the database) so a slow Discord API can't make us
+            # miss the interaction deadline.
+            await interaction.response.send_message(reply, ephemeral=True)
+
+            # A burst of solves is merged into a few DMs to the challenge master instead of one per solve.
+            master = self.bot.get_user(challenge_data.master_id)
+            if master is not None:
+                dispatcher.send(
+                    master, f"{interaction.user.name} just solved the challenge!", merge=True
+                )
+            if announcement is not None:
+                fanout.submit(
+                    self.announce_solve,
+                    interaction.guild_id,
+                    config.leaderboard_channel_id,
+                    announcement,
+                    rank == 3,
+                )
+            fanout.submit(check_rating, interaction)
         else:
             await interaction.response.send_message(
                 "Wrong answer! Try again.", ephemeral=True
             )
 
+    async def announce_solve(self, guild_id, channel_id, announcement, show_leaderboard):
+        """
+        Background half of submit, the leaderboard follows the announcement of the third solve.
+        """
+        challenge_channel = self.bot.get_channel(channel_id)
+        if challenge_channel is None:
+            logging.warning(f"Leaderboard channel of guild {guild_id} not found.")
+            return
+        dispatcher.send(challenge_channel, announcement)
+        if show_leaderboard:
+            await display_leaderboard(self.bot, guild_id)
+
     @discord.app_commands.command(
         name="timeleft",
         description="Tells the time left for the hint and the challenge end.",
     )
+    @discord.app_commands.guild_only()
     async def timeleft(self, interaction: discord.Interaction) -> None:
-        self.config = fetch_config(con)
-        challenge_data = fetch_challenge_data(con)
+        active = await db.active_challenge(interaction.guild_id)
+        challenge_data = active.challenge
 
         if not challenge_data:
             await interaction.response.send_message(
@@ -187,7 +180,7 @@ class GeneralCommands(commands.Cog):
             return
 
         start_time = start_time = datetime.datetime.strptime(
-            challenge_data["start_time"], "%Y-%m-%d %H:%M:%S"
+            challenge_data.start_time, "%Y-%m-%d %H:%M:%S"
         )
         current_time = datetime.datetime.utcnow()
 
@@ -203,7 +196,7 @@ class GeneralCommands(commands.Cog):
             )
             return
 
-        if len_leaderboard == 0 and challenge_data["hints_released"] != 0:
+        if active.solve_count != 0 and challenge_data.hints_released == 0:
             hint_msg = "Hint will no longer be printed since someone has already solved the challenge."
         elif current_time < hint_time:
             hours_hint, remainder_hint = divmod(time_to_hint.total_seconds(), 3600)
@@ -212,14 +205,63 @@ class GeneralCommands(commands.Cog):
         else:
             hint_msg = "Hint has been released!"
 
-            hours_end, remainder_end = divmod(time_to_end.total_seconds(), 3600)
-            minutes_end, seconds_end = divmod(remainder_end, 60)
-            end_msg = f"Time left for challenge end: {int(hours_end)}:{int(minutes_end):02}:{int(seconds_end):02}"
+        hours_end, remainder_end = divmod(time_to_end.total_seconds(), 3600)
+        minutes_end, seconds_end = divmod(remainder_end, 60)
+        end_msg = f"Time left for challenge end: {int(hours_end)}:{int(minutes_end):02}:{int(seconds_end):02}"
+
+        await interaction.response.send_message(
+            f"{hint_msg}\n{end_msg}", ephemeral=True
+        )
+
+    @discord.app_commands.command(
+        name="leaderboard", description="Shows the standings of the season or of all time."
+    )
+    @discord.app_commands.describe(scope="Which standings to show")
+    @discord.app_commands.choices(
+        scope=[
+            discord.app_commands.Choice(name="This season", value="season"),
+            discord.app_commands.Choice(name="All time", value="all-time"),
+        ]
+    )
+    @discord.app_commands.guild_only()
+    async def leaderboard(
+        self,
+        interaction: discord.Interaction,
+        scope: Optional[discord.app_commands.Choice[str]] = None,
+    ) -> None:
+        # Served from the in-memory top-K, no query unless the standings aren't loaded yet.
+        config = await db.config(interaction.guild_id)
+        season = (config.season if config else None) or 1
+        all_time = scope is not None and scope.value == "all-time"
+        standings = await db.standings(
+            interaction.guild_id, ALL_TIME if all_time else season
+        )
+        top = standings.top()
 
+        if not top:
             await interaction.response.send_message(
-                f"{hint_msg}\n{end_msg}", ephemeral=True
+                "Nobody has solved a challenge yet!", ephemeral=True
+            )
+            return
+
+        position_emojis = ["🥇", "🥈", "🥉"]
+        lines = []
+        for i, (user_id, stats) in enumerate(top):
+            position = position_emojis[i] if i < 3 else f"**{i + 1}.**"
+            minutes, seconds = divmod(int(stats.average_solve_time or 0), 60)
+            hours, minutes = divmod(minutes, 60)
+            lines.append(
+                f"{position} <@{user_id}> - {stats.points} pts, {stats.solves} solves, "
+                f"{stats.first_bloods} first bloods, avg solve {hours}:{minutes:02}:{seconds:02}"
             )
 
+        embed = discord.Embed(
+            title="🏆 All-time leaderboard 🏆" if all_time else f"🏆 Season {season} leaderboard 🏆",
+            description="\n".join(lines),
+            color=discord.Color.blue(),
+        )
+        await interaction.response.send_message(embed=embed)
+
     @discord.app_commands.command(
         name="feedback", description="Submit feedback, bugs, or suggestions."
     )
@@ -233,29 +275,22 @@ class GeneralCommands(commands.Cog):
     @discord.app_commands.command(
         name="rate", description="Rate the challenge out of 5."
     )
+    @discord.app_commands.guild_only()
     async def rate_challenge(self, interaction: discord.Interaction):
-        challenge_data = fetch_challenge_data(con)
-        rating_data = fetch_rating(con)
+        active = await db.active_challenge(interaction.guild_id)
 
-        if not challenge_data:
+        if not active.challenge:
             await interaction.response.send_message(
                 "No active challenge currently!", ephemeral=True
             )
             return
         # Check if user has already rated
-        if rating_data is None:
+        if active.has_rated(interaction.user.id):
             await interaction.response.send_message(
-                "Failed to fetch ratings. Please try again later.", ephemeral=True
+                "You have already rated this challenge!", ephemeral=True
             )
             return
 
-        for rating in rating_data:
-            if rating[0] == interaction.user.id:
-                await interaction.response.send_message(
-                    "You have already rated this challenge!", ephemeral=True
-                )
-                return
-
         view = RateView()
         await interaction.response.send_message(
             "Rate today's challenge:", view=view, ephemeral=True
@@ -263,7 +298,7 @@ class GeneralCommands(commands.Cog):
 
 
 async def setup(bot) -> None:
-    await bot.add_cog(GeneralCommands(bot))
+    await bot.add_cog(instrument_cog(GeneralCommands(bot)))
 
 
 # Thanks man, people like you mean a lot to me going through my code and this is an easter egg, send me a screenshot with this message at @Goofygiraffe06 on twitter or anywhere else. :D
@@ -0,0 +1,367 @@
+# cogs/async_db.py - Shared connection manager, runs db_utils on a writer thread and a pool of reader threads.
+
+import asyncio
+import functools
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from . import db_utils
+from .challenge_cache import ActiveChallenge, challenge_start
+from .metrics import timed_query
+from .models import BotConfig
+from .standings import ALL_TIME, Standings
+from .write_batch import WriteBatcher
+
+
+def _load_active(con, guild_id):
+    return (
+        timed_query(db_utils.fetch_challenge_data, con, guild_id),
+        timed_query(db_utils.fetch_config, con, guild_id),
+        timed_query(db_utils.fetch_solver_ids, con, guild_id),
+        timed_query(db_utils.fetch_rating, con, guild_id) or [],
+    )
+
+
+def _write_and_fetch(con, write, fetch, guild_id, *args):
+    # Runs a write and reads back the guild's row it changed in the same worker call, for the write-through cache.
+    result = timed_query(write, con, guild_id, *args)
+    return result, timed_query(fetch, con, guild_id) if result else None
+
+
+# Helpers making several db_utils calls in one worker call, they time each call themselves so the
+# metrics are kept per db_utils function.
+_BUNDLES = (_load_active, _write_and_fetch)
+
+
+class AsyncDatabase:
+    """
+    Process-wide connection manager. The database is opened once, with one writer connection owned by a
+    single worker thread and a small pool of read-only connections (one per reader thread). Thanks to WAL
+    the readers see the last committed data without waiting on commits, and nothing ever blocks the
+    discord.py event loop. Each db_utils function is exposed as a coroutine with the same name,
+    minus the connection argument. Writes to the active challenge are mirrored into the guild's
+    ActiveChallenge cache, one per guild.
+    """
+
+    def __init__(self, path="bot.db", readers=4):
+        self.path = path
+        self._con = None
+        self._readers = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._active = {}
+        self._standings = {}  # (guild_id, season) -> Standings
+        self._solving = Counter()  # guild_id -> solves being committed
+        self._solved = Counter()  # guild_id -> solves committed so far
+        self.batcher = WriteBatcher(self)
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db-writer"
+        )
+        # An in-memory database only exists on its own connection, so everything has to go through the writer.
+        self._reader = (
+            self._writer
+            if path == ":memory:"
+            else ThreadPoolExecutor(
+                max_workers=readers, thread_name_prefix="db-reader"
+            )
+        )
+
+    def _writer_con(self):
+        if self._con is None:
+            self._con = db_utils.db_init(self.path)
+        return self._con
+
+    def _reader_con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            with self._lock:
+                # The schema has to exist before a reader can query it.
+                if self._con is None:
+                    self._writer.submit(self._writer_con).result()
+            con = db_utils.db_connect_reader(self.path)
+            if con is not None:
+                self._local.con = con
+                with self._lock:
+                    self._readers.append(con)
+        return con
+
+    def _call(self, connect, func, *args):
+        con = connect()
+        if con is None:
+            logging.error(f"Database unavailable, skipping {func.__name__}.")
+            return None
+        if func in _BUNDLES:
+            return func(con, *args)
+        return timed_query(func, con, *args)
+
+    async def run(self, func, *args):
+        """
+        Schedules func(con, *args) on the writer thread and waits for its result without blocking the loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._writer, functools.partial(self._call, self._writer_con, func, *args)
+        )
+
+    async def read(self, func, *args):
+        """
+        Same as run, but for read-only functions which are spread over the reader pool.
+        """
+        if self._reader is self._writer:
+            return await self.run(func, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._reader, functools.partial(self._call, self._reader_con, func, *args)
+        )
+
+    async def close(self):
+        """
+        Stops the worker threads and closes every connection.
+        """
+        await self.batcher.drain()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown)
+
+    def _shutdown(self):
+        self._reader.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        for con in self._readers:
+            con.close()
+        self._readers.clear()
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+    def _cache(self, guild_id: int):
+        active = self._active.get(guild_id)
+        if active is None:
+            active = self._active[guild_id] = ActiveChallenge()
+        return active
+
+    async def active_challenge(self, guild_id: int):
+        """
+        Returns the guild's ActiveChallenge cache, loading it from the database on first use.
+        """
+        active = self._cache(guild_id)
+        if not active.loaded:
+            challenge, config, solver_ids, ratings = await self.run(
+                _load_active, guild_id
+            )
+            # Another coroutine may have loaded (and written through) while we waited.
+            if not active.loaded:
+                active.load(challenge, config, solver_ids, ratings)
+        return active
+
+    async def update_config(self, guild_id: int, key: str, value: int):
+        updated = await self.run(db_utils.update_config, guild_id, key, value)
+        active = self._cache(guild_id)
+        if updated and active.loaded:
+            # Swap in a new immutable config, readers keep whichever version they already hold.
+            config = active.config or BotConfig()
+            active.set_config(config.with_value(key, value))
+        return updated
+
+    async def config(self, guild_id: int):
+        """
+        Returns the guild's cached BotConfig (None until /setup has been run), loading it on first use.
+        """
+        return (await self.active_challenge(guild_id)).config
+
+    async def insert_challenge(self, guild_id: int, values):
+        inserted, challenge = await self.run(
+            _write_and_fetch,
+            db_utils.insert_challenge,
+            db_utils.fetch_challenge_data,
+            guild_id,
+            values,
+        )
+        active = self._cache(guild_id)
+        if inserted:
+            active.set_challenge(challenge)
+        else:
+            # insert_challenge may have failed halfway, reload everything on the next read.
+            active.loaded = False
+        return inserted
+
+    async def insert_leaderboard(self, guild_id: int, user_id: int):
+        inserted = await self.run(db_utils.insert_leaderboard, guild_id, user_id)
+        if inserted:
+            self._cache(guild_id).add_solver(user_id)
+        return inserted
+
+    async def register_solve(self, guild_id: int, user_id: int):
+        """
+        Group-committed version of db_utils.register_solve, returns the rank or None.
+        """
+        self._solving[guild_id] += 1
+        try:
+            rank = await self.batcher.submit(db_utils.add_solve, guild_id, user_id)
+        except sqlite3.IntegrityError:
+            return None
+        except Exception as e:
+            logging.error(f"Error inserting table leaderboard: {e}")
+            return None
+        finally:
+            self._solving[guild_id] -= 1
+        self._solved[guild_id] += 1
+
+        active = self._cache(guild_id)
+        active.add_solver(user_id)
+        # Same increments add_solve made to user_stats, applied to the standings already in memory.
+        challenge = active.challenge
+        seconds = time.time() - challenge_start(challenge) if challenge else 0
+        season = (active.config.season if active.config else None) or 1
+        for key in ((guild_id, ALL_TIME), (guild_id, season)):
+            standings = self._standings.get(key)
+            if standings is not None:
+                standings.add_solve(user_id, rank, seconds)
+        return rank
+
+    async def standings(self, guild_id: int, season: int):
+        """
+        Returns the Standings of a guild and season (ALL_TIME for the all-time ones), loaded from user_stats
+        on first use and then kept up to date by register_solve.
+        """
+        standings = self._standings.get((guild_id, season))
+        if standings is not None:
+            return standings
+
+        solved = self._solved[guild_id]
+        idle = self._solving[guild_id] == 0
+        rows = await self.read(db_utils.fetch_user_stats, guild_id, season)
+        standings = Standings()
+        standings.load(rows or [])
+        # Only cache the snapshot if no solve was committed around the read, otherwise it could be counted twice.
+        if idle and self._solving[guild_id] == 0 and self._solved[guild_id] == solved:
+            standings = self._standings.setdefault((guild_id, season), standings)
+        return standings
+
+    async def len_leaderboard(self, guild_id: int):
+        return await self.read(db_utils.len_leaderboard, guild_id)
+
+    async def check_leaderboard(self, guild_id: int, user_id: int):
+        return await self.read(db_utils.check_leaderboard, guild_id, user_id)
+
+    async def update_hint(self, guild_id: int):
+        updated = await self.run(db_utils.update_hint, guild_id)
+        if updated:
+            self._cache(guild_id).mark_hints_released()
+        return updated
+
+    async def update_rate_limit(self, guild_id: int, rate: float, burst: int):
+        updated = await self.run(db_utils.update_rate_limit, guild_id, rate, burst)
+        if updated:
+            self._cache(guild_id).set_rate_limit(rate, burst)
+        return updated
+
+    async def update_attachment(self, guild_id: int, sha256: str):
+        updated = await self.run(db_utils.update_attachment, guild_id, sha256)
+        if updated:
+            self._cache(guild_id).set_attachment(sha256)
+        return updated
+
+    async def fetch_attachment_hashes(self):
+        return await self.read(db_utils.fetch_attachment_hashes)
+
+    async def insert_rating(self, guild_id: int, user_id: int, rating: int):
+        """
+        Group-committed version of db_utils.insert_rating.
+        """
+        try:
+            inserted = await self.batcher.submit(
+                db_utils.add_rating, guild_id, user_id, rating
+            )
+        except Exception as e:
+            logging.error(f"Error inserting table rating: {e}")
+            return None
+        if inserted:
+            self._cache(guild_id).add_rating(user_id, rating)
+        return inserted
+
+    async def fetch_config(self, guild_id: int):
+        return await self.read(db_utils.fetch_config, guild_id)
+
+    async def fetch_challenge_data(self, guild_id: int):
+        return await self.read(db_utils.fetch_challenge_data, guild_id)
+
+    async def fetch_active_guilds(self):
+        return await self.read(db_utils.fetch_active_guilds)
+
+    async def remove_challenge_data(self, guild_id: int):
+        removed = await self.run(db_utils.remove_challenge_data, guild_id)
+        active = self._cache(guild_id)
+        if removed:
+            active.clear()
+        else:
+            active.loaded = False
+        return removed
+
+    async def adopt_legacy_guild(self, guild_id: int):
+        adopted = await self.run(db_utils.adopt_legacy_guild, guild_id)
+        if adopted:
+            # Both caches were loaded from rows which just changed owner.
+            self._active.pop(0, None)
+            self._active.pop(guild_id, None)
+        return adopted
+
+    async def fetch_leaderboard_data(self, guild_id: int):
+        return await self.read(db_utils.fetch_leaderboard_data, guild_id)
+
+    async def fetch_solver_ids(self, guild_id: int):
+        return await self.read(db_utils.fetch_solver_ids, guild_id)
+
+    async def insert_event(self, guild_id: int, day: int, event: str, due: float):
+        return await self.run(db_utils.insert_event, guild_id, day, event, due)
+
+    async def delete_event(self, event_id: int):
+        return await self.run(db_utils.delete_event, event_id)
+
+    async def clear_events(self, guild_id: int):
+        return await self.run(db_utils.clear_events, guild_id)
+
+    async def fetch_events(self):
+        return await self.read(db_utils.fetch_events)
+
+    async def fetch_challenge_history(self, guild_id: int, day: int):
+        return await self.read(db_utils.fetch_challenge_history, guild_id, day)
+
+    async def fetch_user_history(self, guild_id: int, user_id: int):
+        return await self.read(db_utils.fetch_user_history, guild_id, user_id)
+
+    async def fetch_user_stats(self, guild_id: int, season: int):
+        return await self.read(db_utils.fetch_user_stats, guild_id, season)
+
+    async def fetch_meta(self, key: str):
+        return await self.read(db_utils.fetch_meta, key)
+
+    async def update_meta(self, key: str, value: str):
+        return await self.run(db_utils.update_meta, key, value)
+
+    async def insert_outbox(self, kind: str, payload: str):
+        return await self.run(db_utils.insert_outbox, kind, payload, time.time())
+
+    async def fetch_outbox(self, kind: str, limit: int, max_attempts: int):
+        return await self.run(db_utils.fetch_outbox, kind, time.time(), limit, max_attempts)
+
+    async def next_outbox_attempt(self, kind: str, max_attempts: int):
+        return await self.read(db_utils.next_outbox_attempt, kind, max_attempts)
+
+    async def delete_outbox(self, ids):
+        return await self.run(db_utils.delete_outbox, ids)
+
+    async def retry_outbox(self, ids, next_attempt: float, error: str):
+        return await self.run(db_utils.retry_outbox, ids, next_attempt, error)
+
+    async def fetch_rating(self, guild_id: int):
+        return await self.read(db_utils.fetch_rating, guild_id)
+
+    async def generate_title(self, guild_id: int):
+        return await self.read(db_utils.generate_title, guild_id)
+
+
+# The one shared instance used by every cog, connections are only opened on the first query.
+db = AsyncDatabase()
@@ -0,0 +1,157 @@
+# cogs/attachments.py - Local content-addressed copies of the challenge attachments.
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from urllib.parse import unquote, urlparse
+
+from .http_session import http_session
+
+# Largest attachment kept, and the size of the whole store before the least recently used files are evicted.
+MAX_FILE_BYTES = int(os.environ.get("ATTACHMENT_MAX_BYTES", 25 * 1024 * 1024))
+MAX_STORE_BYTES = int(os.environ.get("ATTACHMENT_STORE_BYTES", 1024 * 1024 * 1024))
+STORE_DIR = os.environ.get("ATTACHMENT_DIR", "attachments")
+
+# Time allowed for a whole download, in seconds.
+DOWNLOAD_TIMEOUT = 120
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class StoredAttachment:
+    __slots__ = ("sha256", "name", "size", "path")
+
+    def __init__(self, sha256, name, size, path):
+        self.sha256 = sha256
+        self.name = name
+        self.size = size
+        self.path = path
+
+
+def attachment_name(url: str, disposition_name=None):
+    """
+    File name for the attachment: the one the server sent, else the last part of the URL path, made safe.
+    """
+    name = disposition_name or unquote(os.path.basename(urlparse(url).path))
+    name = re.sub(r"[^\w.\-]", "_", name).strip("._")
+    return name[:100] or "attachment"
+
+
+class AttachmentStore:
+    """
+    Files are stored once under the SHA-256 of their content (root/ab/abcdef...), so the same attachment
+    used on several days or in several servers takes the space of one. Downloads are streamed to a
+    temporary file while being hashed, never held in memory, and abort as soon as they exceed max_file_bytes.
+    The modification time of a file is its last use; when the store grows past max_store_bytes the least
+    recently used files are evicted, except those of active challenges.
+    """
+
+    def __init__(self, root=STORE_DIR, max_file_bytes=MAX_FILE_BYTES, max_store_bytes=MAX_STORE_BYTES):
+        self.root = root
+        self.max_file_bytes = max_file_bytes
+        self.max_store_bytes = max_store_bytes
+
+    def path(self, sha256: str):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def _commit(self, tmp_path: str, sha256: str):
+        """
+        Moves a finished download to its place in the store, returns its path. Runs on a worker thread.
+        """
+        path = self.path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(tmp_path)  # Already stored, only refresh its last use.
+            os.utime(path)
+        else:
+            os.replace(tmp_path, path)
+        return path
+
+    async def store(self, chunks, name: str, keep=()):
+        """
+        Writes the byte chunks of an async iterator to the store, returns the StoredAttachment.
+        Raises AttachmentTooLarge past max_file_bytes. keep are hashes eviction has to leave alone.
+        """
+        loop = asyncio.get_running_loop()
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            # Disk writes go to a worker thread, a slow disk must not hold up the loop.
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_file_bytes:
+                        raise AttachmentTooLarge(f"{name} is larger than {self.max_file_bytes} bytes")
+                    digest.update(chunk)
+                    await loop.run_in_executor(None, f.write, chunk)
+            sha256 = digest.hexdigest()
+            path = await loop.run_in_executor(None, self._commit, tmp_path, sha256)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        await loop.run_in_executor(None, self.evict, set(keep) | {sha256})
+        return StoredAttachment(sha256, name, size, path)
+
+    async def fetch(self, url: str, keep=()):
+        """
+        Downloads url into the store through the shared HTTP session. Raises AttachmentTooLarge, or
+        whatever aiohttp raises if the download fails.
+        """
+        import aiohttp  # Already imported by the shared session, only needed for the timeout here.
+
+        session = await http_session.get()
+        async with session.get(
+            url, timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)
+        ) as response:
+            response.raise_for_status()
+            if response.content_length is not None and response.content_length > self.max_file_bytes:
+                raise AttachmentTooLarge(f"{url} is {response.content_length} bytes")
+            disposition = response.content_disposition
+            name = attachment_name(url, disposition.filename if disposition else None)
+            return await self.store(response.content.iter_chunked(CHUNK_SIZE), name, keep)
+
+    def evict(self, keep=()):
+        """
+        Deletes the least recently used files until the store fits in max_store_bytes, returns how many were deleted.
+        Runs on a worker thread, it walks the whole store.
+        """
+        files = []
+        total = 0
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, entry.path, stat.st_size))
+                total += stat.st_size
+
+        evicted = 0
+        for _, sha256, path, size in sorted(files):
+            if total <= self.max_store_bytes:
+                break
+            if sha256 in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning(f"Could not evict attachment {sha256}: {e}")
+                continue
+            total -= size
+            evicted += 1
+        if evicted:
+            logging.info(f"Evicted {evicted} attachment(s) from the store.")
+        return evicted
+
+
+attachment_store = AttachmentStore()
@@ -0,0 +1,119 @@
+# cogs/challenge_cache.py - In-memory copy of the active challenge, the config and the solvers.
+
+import calendar
+import time
+from dataclasses import replace
+
+from .flags import FlagVerifier
+
+
+def challenge_start(challenge_data):
+    """
+    Converts the start_time column (UTC, "%Y-%m-%d %H:%M:%S") to a unix timestamp.
+    """
+    return calendar.timegm(
+        time.strptime(challenge_data.start_time, "%Y-%m-%d %H:%M:%S")
+    )
+
+
+class ActiveChallenge:
+    """
+    Holds the active challenge row, the config, the set of user IDs who already solved it and
+    the raters with a running sum/count of their ratings, plus the compiled flag verifier of the challenge.
+    It is loaded once from the database and then kept up to date write-through by AsyncDatabase
+    (insert_challenge, remove_challenge_data, register_solve, insert_rating, update_config, update_hint and
+    update_rate_limit),
+    so hot paths like /submit can answer without a single SQL read.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.challenge = None
+        self.config = None
+        self.solvers = set()
+        self._verifier = None
+        self._reset_ratings()
+
+    def _reset_ratings(self):
+        self.raters = set()
+        self.rating_sum = 0
+        self.rating_count = 0
+
+    def load(self, challenge, config, solver_ids, ratings):
+        self.challenge = challenge
+        self._verifier = None
+        self.config = config
+        self.solvers = set(solver_ids)
+        self._reset_ratings()
+        for user_id, rating in ratings:
+            self.add_rating(user_id, rating)
+        self.loaded = True
+
+    def set_challenge(self, challenge):
+        """
+        A new challenge starts with an empty leaderboard, same as in the database.
+        """
+        self.challenge = challenge
+        self._verifier = None
+        self.solvers = set()
+        self._reset_ratings()
+
+    def clear(self):
+        self.challenge = None
+        self._verifier = None
+        self.solvers = set()
+        self._reset_ratings()
+
+    def set_config(self, config):
+        self.config = config
+
+    def set_rate_limit(self, rate, burst):
+        if self.challenge is not None:
+            self.challenge = replace(self.challenge, submit_rate=rate, submit_burst=burst)
+
+    def set_attachment(self, sha256):
+        if self.challenge is not None:
+            self.challenge = replace(self.challenge, attachment_hash=sha256)
+
+    @property
+    def verifier(self):
+        """
+        The FlagVerifier of the active challenge, compiled on first use and kept until the challenge changes.
+        None if there is no challenge or it has no accepted flag.
+        """
+        if self._verifier is None and self.challenge is not None:
+            self._verifier = FlagVerifier.from_challenge(self.challenge)
+        return self._verifier
+
+    def check_flag(self, flag: str):
+        verifier = self.verifier
+        return verifier is not None and verifier.verify(flag)
+
+    def mark_hints_released(self):
+        if self.challenge is not None:
+            self.challenge = replace(self.challenge, hints_released=1)
+
+    def add_solver(self, user_id: int):
+        self.solvers.add(user_id)
+
+    def has_solved(self, user_id: int):
+        return user_id in self.solvers
+
+    @property
+    def solve_count(self):
+        return len(self.solvers)
+
+    def add_rating(self, user_id: int, rating: int):
+        if user_id not in self.raters:
+            self.raters.add(user_id)
+            self.rating_sum += rating
+            self.rating_count += 1
+
+    def has_rated(self, user_id: int):
+        return user_id in self.raters
+
+    @property
+    def average_rating(self):
+        if self.rating_count == 0:
+            return None
+        return self.rating_sum / self.rating_count
@@ -0,0 +1,49 @@
+# cogs/command_sync.py - Syncs the application command tree only when the registered commands changed.
+
+import hashlib
+import json
+import logging
+import os
+
+import discord
+
+
+def command_fingerprint(tree, guild=None):
+    """
+    SHA-256 of the JSON payload the tree would send to Discord, commands sorted by name and keys sorted,
+    so it only changes when a command, option, description or permission actually changes.
+    """
+    payload = []
+    for command in tree.get_commands(guild=guild):
+        try:
+            payload.append(command.to_dict(tree))
+        except TypeError:  # discord.py < 2.4 takes no tree argument.
+            payload.append(command.to_dict())
+    payload.sort(key=lambda command: (command.get("type", 1), command["name"]))
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+async def sync_commands(bot, database):
+    """
+    Calls tree.sync() only if the fingerprint of the commands differs from the one stored at the last sync.
+    With DEV_GUILD_ID set, the global commands are copied to that guild and synced there instead,
+    guild syncs show up immediately which makes iterating on commands much faster.
+    Returns the number of synced commands, or None if the sync was skipped.
+    """
+    dev_guild = os.environ.get("DEV_GUILD_ID")
+    guild = discord.Object(id=int(dev_guild)) if dev_guild else None
+    if guild is not None:
+        bot.tree.copy_global_to(guild=guild)
+
+    key = f"command_tree:{guild.id}" if guild is not None else "command_tree:global"
+    fingerprint = command_fingerprint(bot.tree, guild)
+    if await database.fetch_meta(key) == fingerprint:
+        logging.info("Command tree unchanged, skipping sync.")
+        return None
+
+    synced = await bot.tree.sync(guild=guild)
+    await database.update_meta(key, fingerprint)
+    logging.info(f"Synced {len(synced)} command(s)...")
+    return len(synced)
@@ -3,50 +3,104 @@
 import logging
 import sqlite3
 
-# Logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s"
-)
-logging.getLogger("werkzeug").setLevel(logging.ERROR)
-logging.getLogger("flask.app").setLevel(logging.ERROR)
+from .flags import hash_flags, reveal_text
+from .models import BotConfig, Challenge, CONFIG_KEYS, CHALLENGE_COLUMNS, MODEL_TABLES, row_factory
+from .standings import ALL_TIME, BASE_POINTS, PODIUM_POINTS, solve_points
 
+# Page cache per connection in KiB (negative values are KiB for SQLite) and size of the memory map in bytes.
+CACHE_SIZE_KIB = 16384
+MMAP_SIZE = 256 * 1024 * 1024
 
-def db_init():
+# Statements of the hot reads, built once from the models. sqlite3 keeps them compiled in the statement
+# cache of each connection, keyed by the SQL text.
+SELECT_CONFIG = f"SELECT {', '.join(CONFIG_KEYS)} FROM config WHERE id = ?"
+SELECT_CHALLENGE = f"SELECT {', '.join(CHALLENGE_COLUMNS)} FROM challenge_data WHERE guild_id = ?"
+
+_config_row = row_factory(BotConfig)
+_challenge_row = row_factory(Challenge)
+
+
+def db_init(path="bot.db"):
     """
-    Creates a new database file if it doesn't exists and then runs the create_tables function.
+    Creates a new database file if it doesn't exists, tunes the connection and then runs the create_tables function.
     """
     try:
-        con = sqlite3.connect("bot.db")
+        con = sqlite3.connect(path, check_same_thread=False)
+        configure_connection(con)
         logging.info("Connected to the database.")
         create_tables(con)
+        if not check_schema(con):
+            con.close()
+            return None
+        return con
+    except sqlite3.Error as e:
+        logging.error(f"Error initializing database: {e}")
+        return None
+
+
+def db_connect_reader(path="bot.db"):
+    """
+    Opens an extra connection used only for reads, the schema is expected to exist already (db_init creates it).
+    With WAL enabled these connections read the last committed snapshot without waiting on the writer.
+    """
+    try:
+        con = sqlite3.connect(path, check_same_thread=False)
+        configure_connection(con)
+        con.execute("PRAGMA query_only = ON")
         return con
     except sqlite3.Error as e:
-        logging.error("Error initializing database.")
+        logging.error(f"Error opening read connection: {e}")
         return None
 
 
+def configure_connection(con):
+    """
+    Applies the performance pragmas to a connection: write-ahead logging so readers never block on commits,
+    synchronous=NORMAL (safe with WAL, one fsync per checkpoint instead of per commit), a larger page cache
+    and memory mapped I/O.
+    """
+    con.execute("PRAGMA journal_mode = WAL")
+    con.execute("PRAGMA synchronous = NORMAL")
+    con.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    con.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    con.execute("PRAGMA temp_store = MEMORY")
+    con.execute("PRAGMA busy_timeout = 5000")
+
+
 def create_tables(con):
     """
     It is executed for every connection to the database to verify and repair any inconsitencies in the database,
-    It creates a missing table if it doesn't exists.
+    It creates a missing table if it doesn't exists. Every table is keyed by guild so one bot serves many servers,
+    databases from the single server days are migrated in place with their data under guild 0.
     """
     try:
         cur = con.cursor()
+        legacy = _detach_legacy_tables(cur)
+
+        # The id of a config row is the guild id, last_day numbers the challenges of each guild
+        # and season is the current season of the /leaderboard standings (NULL is season 1).
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS config (
                 id INTEGER PRIMARY KEY,
                 channel_id INTEGER,
                 ctf_creators INTEGER,
-                leaderboard_channel_id INTEGER
+                leaderboard_channel_id INTEGER,
+                last_day INTEGER DEFAULT 0,
+                season INTEGER
             )
         """
         )
 
+        # One active challenge per guild. flags holds the salted hashes the answer is verified against (cogs/flags.py),
+        # answer only holds the reveal: text of the answer, if any, shown at the end of the challenge. submit_rate (attempts per minute) and
+        # submit_burst override the /submit rate limit defaults of cogs/ratelimit.py. attachment_hash is the local
+        # copy of the attachment URL in the attachment store (cogs/attachments.py), kept there while the challenge runs.
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS challenge_data (
-                day INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER PRIMARY KEY,
+                day INTEGER,
                 master_id INTEGER,
                 description TEXT,
                 answer TEXT,
@@ -54,7 +108,11 @@ def create_tables(con):
                 hints TEXT,
                 writeup TEXT,
                 hints_released INTEGER DEFAULT 0,
-                start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                flags TEXT,
+                submit_rate REAL,
+                submit_burst INTEGER,
+                attachment_hash TEXT
             )
         """
         )
@@ -62,48 +120,356 @@ def create_tables(con):
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS leaderboard (
+                guild_id INTEGER NOT NULL DEFAULT 0,
                 user_id INTEGER,
                 submission TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """
         )
 
+        # Every user can only be on the leaderboard of a guild once, older databases may hold duplicates
+        # which have to go before the unique index can be built.
+        cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'leaderboard_guild_user'"
+        )
+        if cur.fetchone() is None:
+            cur.execute("DROP INDEX IF EXISTS leaderboard_user_id")
+            cur.execute(
+                """
+                DELETE FROM leaderboard WHERE rowid NOT IN (
+                    SELECT MIN(rowid) FROM leaderboard GROUP BY guild_id, user_id
+                )
+            """
+            )
+            cur.execute(
+                "CREATE UNIQUE INDEX leaderboard_guild_user ON leaderboard (guild_id, user_id)"
+            )
+
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS ratings (
-                user_id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL DEFAULT 0,
+                user_id INTEGER,
+                rating INTEGER,
+                PRIMARY KEY (guild_id, user_id)
+            )
+        """
+        )
+
+        # Pending timed events (hint release, challenge end), see cogs/scheduler.py.
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schedule (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL DEFAULT 0,
+                day INTEGER,
+                event TEXT,
+                due REAL
+            )
+        """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS schedule_guild ON schedule (guild_id)")
+
+        # Append-only history, every challenge is moved here with its solves and ratings when it is rotated out
+        # (see _archive_challenge). Only the active rows are touched at rotation, so its cost doesn't grow with history.
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS challenge_history (
+                guild_id INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                master_id INTEGER,
+                description TEXT,
+                answer TEXT,
+                attachment TEXT,
+                hints TEXT,
+                writeup TEXT,
+                hints_released INTEGER,
+                start_time TIMESTAMP,
+                end_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS challenge_history_day ON challenge_history (guild_id, day)"
+        )
+
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS solve_history (
+                guild_id INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                rank INTEGER,
+                submission TIMESTAMP
+            )
+        """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS solve_history_day ON solve_history (guild_id, day)"
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS solve_history_user ON solve_history (guild_id, user_id)"
+        )
+
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rating_history (
+                guild_id INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
                 rating INTEGER
             )
         """
         )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS rating_history_day ON rating_history (guild_id, day)"
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS rating_history_user ON rating_history (guild_id, user_id)"
+        )
+
+        # Per user totals for the cross-day standings, one row per guild, season and user (season 0 is all-time).
+        # They are updated by every solve (add_solve), never recomputed from the history.
+        cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_stats'"
+        )
+        backfill = cur.fetchone() is None
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_stats (
+                guild_id INTEGER NOT NULL,
+                season INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                solves INTEGER NOT NULL DEFAULT 0,
+                first_bloods INTEGER NOT NULL DEFAULT 0,
+                points INTEGER NOT NULL DEFAULT 0,
+                solve_seconds REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, season, user_id)
+            )
+        """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS user_stats_points ON user_stats (guild_id, season, points DESC)"
+        )
+        if backfill:
+            _backfill_user_stats(cur)
 
+        # Small key/value store for bot-wide state, like the fingerprint of the last synced command tree.
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """
+        )
+
+        # Messages waiting to be delivered by a background worker (cogs/outbox.py), payload is JSON.
+        # A failed delivery is retried at next_attempt, rows are deleted once delivered.
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT
+            )
+        """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (kind, next_attempt)"
+        )
+
+        _copy_legacy_tables(cur, legacy)
+        _drop_plain_answers(cur)
         con.commit()
 
     except sqlite3.Error as e:
         logging.error(f"Error creating tables: {e}")
 
 
-def update_config(con, key: str, value: int):
+def check_schema(con):
+    """
+    Verifies that the tables read into the row models have every column the models expect, so a schema that
+    drifted from the code is reported when the database is opened instead of failing on some later read.
+    """
+    cur = con.cursor()
+    valid = True
+    for table, expected in MODEL_TABLES.items():
+        missing = [column for column in expected if column not in _columns(cur, table)]
+        if missing:
+            logging.error(f"Table {table} is missing the column(s) {', '.join(missing)}.")
+            valid = False
+    return valid
+
+
+def _columns(cur, table):
+    cur.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cur.fetchall()]
+
+
+def _detach_legacy_tables(cur):
+    """
+    First half of the single server to multi guild migration. Tables whose primary key changed are renamed
+    out of the way so create_tables can build the new ones, the others just get their new columns.
+    Returns the renamed tables, which _copy_legacy_tables moves into the new schema.
+    """
+    legacy = []
+
+    columns = _columns(cur, "config")
+    if columns and "last_day" not in columns:
+        cur.execute("ALTER TABLE config ADD COLUMN last_day INTEGER DEFAULT 0")
+    if columns and "season" not in columns:
+        cur.execute("ALTER TABLE config ADD COLUMN season INTEGER")
+
+    columns = _columns(cur, "challenge_data")
+    if columns and "guild_id" not in columns:
+        # The old AUTOINCREMENT counter becomes the day counter of guild 0.
+        cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'challenge_data'")
+        row = cur.fetchone()
+        if row:
+            cur.execute("INSERT OR IGNORE INTO config (id) VALUES (0)")
+            cur.execute("UPDATE config SET last_day = ? WHERE id = 0", (row[0],))
+        cur.execute("ALTER TABLE challenge_data RENAME TO challenge_data_legacy")
+        legacy.append("challenge_data")
+    elif columns:
+        # Rows from before the flags column get their hashes from _drop_plain_answers.
+        for column, column_type in (
+            ("flags", "TEXT"),
+            ("submit_rate", "REAL"),
+            ("submit_burst", "INTEGER"),
+            ("attachment_hash", "TEXT"),
+        ):
+            if column not in columns:
+                cur.execute(f"ALTER TABLE challenge_data ADD COLUMN {column} {column_type}")
+
+    columns = _columns(cur, "leaderboard")
+    if columns and "guild_id" not in columns:
+        cur.execute(
+            "ALTER TABLE leaderboard ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0"
+        )
+
+    columns = _columns(cur, "ratings")
+    if columns and "guild_id" not in columns:
+        cur.execute("ALTER TABLE ratings RENAME TO ratings_legacy")
+        legacy.append("ratings")
+
+    columns = _columns(cur, "schedule")
+    if columns and "guild_id" not in columns:
+        cur.execute("ALTER TABLE schedule ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0")
+
+    return legacy
+
+
+def _copy_legacy_tables(cur, legacy):
+    if "challenge_data" in legacy:
+        cur.execute(
+            """INSERT INTO challenge_data (guild_id, day, master_id, description, answer, attachment,
+                                           hints, writeup, hints_released, start_time)
+               SELECT 0, day, master_id, description, answer, attachment, hints, writeup, hints_released, start_time
+               FROM challenge_data_legacy"""
+        )
+        cur.execute("DROP TABLE challenge_data_legacy")
+    if "ratings" in legacy:
+        cur.execute(
+            "INSERT INTO ratings (guild_id, user_id, rating) SELECT 0, user_id, rating FROM ratings_legacy"
+        )
+        cur.execute("DROP TABLE ratings_legacy")
+
+
+def _drop_plain_answers(cur):
+    """
+    Challenges set before only the reveal text was kept have their whole answer, the plain flags, in answer.
+    They get their flags hashed if they weren't yet and answer is cut down to the reveal text, for the active
+    challenges and the history. Runs once per database, recorded in meta.
+    """
+    cur.execute("SELECT 1 FROM meta WHERE key = 'plain_answers_dropped'")
+    if cur.fetchone():
+        return
+    cur.execute("SELECT guild_id, answer, flags FROM challenge_data WHERE answer IS NOT NULL")
+    cur.executemany(
+        "UPDATE challenge_data SET answer = ?, flags = ? WHERE guild_id = ?",
+        [(reveal_text(answer), flags or hash_flags(answer), guild_id) for guild_id, answer, flags in cur.fetchall()],
+    )
+    cur.execute("SELECT rowid, answer FROM challenge_history WHERE answer IS NOT NULL")
+    cur.executemany(
+        "UPDATE challenge_history SET answer = ? WHERE rowid = ?",
+        [(reveal_text(answer), rowid) for rowid, answer in cur.fetchall()],
+    )
+    cur.execute("INSERT INTO meta (key, value) VALUES ('plain_answers_dropped', '1')")
+
+
+def _points_sql(rank):
+    cases = " ".join(f"WHEN {rank_} THEN {points}" for rank_, points in PODIUM_POINTS.items())
+    return f"CASE {rank} {cases} ELSE {BASE_POINTS} END"
+
+
+def _backfill_user_stats(cur):
+    """
+    One-off when user_stats is created: the archived solves become the all-time totals and those of season 1.
     """
-    Updates the config table of the database, As this bot is made for single server use only,
-    We use the id 0, to effectively update each attribute of the table independently.
+    for season in (ALL_TIME, 1):
+        cur.execute(
+            f"""INSERT INTO user_stats (guild_id, season, user_id, solves, first_bloods, points, solve_seconds)
+                SELECT s.guild_id, ?, s.user_id, COUNT(*), SUM(s.rank = 1), SUM({_points_sql("s.rank")}),
+                       COALESCE(SUM(strftime('%s', s.submission) - strftime('%s', c.start_time)), 0)
+                FROM solve_history s
+                LEFT JOIN challenge_history c ON c.guild_id = s.guild_id AND c.day = s.day
+                GROUP BY s.guild_id, s.user_id""",
+            (season,),
+        )
+
+
+def adopt_legacy_guild(con, guild_id: int):
+    """
+    Moves the data migrated under guild 0 to the given guild, used when the bot only serves one server.
+    Does nothing if there is no legacy data or the guild already has its own config.
     """
     try:
         cur = con.cursor()
+        cur.execute("SELECT 1 FROM config WHERE id = ?", (guild_id,))
+        if cur.fetchone():
+            return False
+        cur.execute("SELECT 1 FROM config WHERE id = 0")
+        if cur.fetchone() is None:
+            return False
+        with con:
+            cur.execute("UPDATE config SET id = ? WHERE id = 0", (guild_id,))
+            for table in (
+                "challenge_data",
+                "leaderboard",
+                "ratings",
+                "schedule",
+                "challenge_history",
+                "solve_history",
+                "rating_history",
+                "user_stats",
+            ):
+                cur.execute(f"UPDATE {table} SET guild_id = ? WHERE guild_id = 0", (guild_id,))
+        logging.info(f"Moved single server data to guild {guild_id}.")
+        return True
+    except sqlite3.Error as e:
+        logging.error(f"Error adopting legacy data: {e}")
+        return False
 
-        # Check if the record with id = 0 exists
-        cur.execute("SELECT id FROM config WHERE id = 0")
-        existing_record = cur.fetchone()
-
-        if existing_record:
-            # Update the existing record
-            query = f"UPDATE config SET {key} = ? WHERE id = 0"
-            cur.execute(query, (value,))
-        else:
-            # Insert a new record with id = 0
-            query = f"INSERT INTO config (id, {key}) VALUES (0, ?)"
-            cur.execute(query, (value,))
 
+def update_config(con, guild_id: int, key: str, value: int):
+    """
+    Updates the config table of the database, each guild has its own row (the id is the guild id)
+    and each attribute of the table is updated independently.
+    A single UPSERT creates the row on first use, so it is one statement and one commit.
+    """
+    if key not in CONFIG_KEYS:
+        logging.error(f"Error updating table config: unknown key {key!r}")
+        return False
+    try:
+        con.execute(
+            f"""INSERT INTO config (id, {key}) VALUES (?, ?)
+                ON CONFLICT(id) DO UPDATE SET {key} = excluded.{key}""",
+            (guild_id, value),
+        )
         con.commit()
         logging.info("Updated table config successfully.")
         return True
@@ -112,26 +478,61 @@ def update_config(con, key: str, value: int):
         return False
 
 
-def insert_challenge(con, values):
+def _archive_challenge(cur, guild_id: int):
     """
-    Inserts data into challenge_data table, first it goes by deleting few other tables because,
-    When we are inserting a new challenge that means we also no longer want the old data in other tables
-    and then finally inserts the supplied data.
+    Moves the guild's active challenge, its solves (with their rank) and its ratings to the history tables
+    and clears them, must run inside the caller's transaction. Only touches the guild's active rows.
     """
-    try:
-        cur = con.cursor()
-        cur.execute("DELETE FROM challenge_data")
-        cur.execute("DELETE FROM leaderboard")
-        cur.execute("DELETE FROM ratings")
+    cur.execute(
+        """INSERT INTO challenge_history (guild_id, day, master_id, description, answer, attachment,
+                                          hints, writeup, hints_released, start_time)
+           SELECT guild_id, day, master_id, description, answer, attachment, hints, writeup, hints_released, start_time
+           FROM challenge_data WHERE guild_id = ?""",
+        (guild_id,),
+    )
+    cur.execute(
+        """INSERT INTO solve_history (guild_id, day, user_id, rank, submission)
+           SELECT l.guild_id, c.day, l.user_id, ROW_NUMBER() OVER (ORDER BY l.rowid), l.submission
+           FROM leaderboard l JOIN challenge_data c ON c.guild_id = l.guild_id
+           WHERE l.guild_id = ?""",
+        (guild_id,),
+    )
+    cur.execute(
+        """INSERT INTO rating_history (guild_id, day, user_id, rating)
+           SELECT r.guild_id, c.day, r.user_id, r.rating
+           FROM ratings r JOIN challenge_data c ON c.guild_id = r.guild_id
+           WHERE r.guild_id = ?""",
+        (guild_id,),
+    )
+    cur.execute("DELETE FROM leaderboard WHERE guild_id = ?", (guild_id,))
+    cur.execute("DELETE FROM ratings WHERE guild_id = ?", (guild_id,))
+    cur.execute("DELETE FROM challenge_data WHERE guild_id = ?", (guild_id,))
 
-        con.commit()
 
-        cur.execute(
-            """INSERT INTO challenge_data (master_id, description, answer, attachment, hints, writeup)
-                        VALUES (?, ?, ?, ?, ?, ?)""",
-            values,
-        )
-        con.commit()
+def insert_challenge(con, guild_id: int, values):
+    """
+    Inserts data into challenge_data table, first the guild's previous challenge (if any) is archived
+    with its leaderboard and ratings, since a new challenge starts with empty ones,
+    and then finally inserts the supplied data as the guild's next day. Only the salted hashes of the answer's
+    flags and its reveal: text are stored, never the flags themselves.
+    """
+    try:
+        master_id, description, answer, *rest = values
+        flags = hash_flags(answer)
+        with con:
+            cur = con.cursor()
+            _archive_challenge(cur, guild_id)
+            cur.execute(
+                """INSERT INTO config (id, last_day) VALUES (?, 1)
+                   ON CONFLICT(id) DO UPDATE SET last_day = COALESCE(last_day, 0) + 1""",
+                (guild_id,),
+            )
+            cur.execute(
+                """INSERT INTO challenge_data
+                       (guild_id, day, master_id, description, answer, attachment, hints, writeup, flags)
+                   VALUES (?, (SELECT last_day FROM config WHERE id = ?), ?, ?, ?, ?, ?, ?, ?)""",
+                (guild_id, guild_id, master_id, description, reveal_text(answer), *rest, flags),
+            )
         logging.info("Inserted into table challenge_data successfully.")
         return True
     except sqlite3.Error as e:
@@ -139,14 +540,17 @@ def insert_challenge(con, values):
         return False
 
 
-def insert_leaderboard(con, user_id: int):
+def insert_leaderboard(con, guild_id: int, user_id: int):
     """
-    Simple function to insert a record to the leaderboard tables.
+    Simple function to insert a record to the leaderboard tables, returns False if the user is already on it.
     """
     try:
         cur = con.cursor()
 
-        cur.execute("INSERT INTO leaderboard (user_id) VALUES (?)", (user_id,))
+        cur.execute(
+            "INSERT INTO leaderboard (guild_id, user_id) VALUES (?, ?)",
+            (guild_id, user_id),
+        )
         con.commit()
         logging.info("Inserted into table leaderboard successfully.")
         return True
@@ -156,14 +560,100 @@ def insert_leaderboard(con, user_id: int):
         return False
 
 
-def len_leaderboard(con):
+def register_solve(con, guild_id: int, user_id: int):
+    """
+    Registers a correct submission and returns the solver's rank (1 for first blood) computed in the same
+    transaction as the insert. Returns None if the user already solved it, the unique index rejects the insert.
+    """
+    try:
+        with con:
+            rank = add_solve(con, guild_id, user_id)
+        logging.info("Inserted into table leaderboard successfully.")
+        return rank
+
+    except sqlite3.IntegrityError:
+        return None
+    except sqlite3.Error as e:
+        logging.error(f"Error inserting table leaderboard: {e}")
+        return None
+
+
+def add_solve(con, guild_id: int, user_id: int):
+    """
+    Statement half of register_solve: inserts the solve and returns its rank without committing,
+    so it can also run inside a batch. Raises sqlite3.IntegrityError for a duplicate solve.
+    The solver's all-time and current season totals in user_stats are bumped in the same transaction.
+    """
+    cur = con.execute(
+        "INSERT INTO leaderboard (guild_id, user_id) VALUES (?, ?)", (guild_id, user_id)
+    )
+    cur.execute(
+        "SELECT COUNT(*) FROM leaderboard WHERE guild_id = ? AND rowid <= ?",
+        (guild_id, cur.lastrowid),
+    )
+    rank = cur.fetchone()[0]
+
+    cur.execute(
+        """SELECT (SELECT COALESCE(season, 1) FROM config WHERE id = ?),
+                  (SELECT strftime('%s', 'now') - strftime('%s', start_time) FROM challenge_data WHERE guild_id = ?)""",
+        (guild_id, guild_id),
+    )
+    season, seconds = cur.fetchone()
+    cur.executemany(
+        """INSERT INTO user_stats (guild_id, season, user_id, solves, first_bloods, points, solve_seconds)
+           VALUES (?, ?, ?, 1, ?, ?, ?)
+           ON CONFLICT(guild_id, season, user_id) DO UPDATE SET
+               solves = solves + 1,
+               first_bloods = first_bloods + excluded.first_bloods,
+               points = points + excluded.points,
+               solve_seconds = solve_seconds + excluded.solve_seconds""",
+        [
+            (guild_id, s, user_id, int(rank == 1), solve_points(rank), seconds or 0)
+            for s in (ALL_TIME, season or 1)
+        ],
+    )
+    return rank
+
+
+def run_batch(con, ops):
     """
-    A simple function which returns the length of the table, used for determining the position in submit command.
+    Group commit: runs a list of (func, args) statement functions (add_solve, add_rating) in one transaction,
+    each inside its own savepoint so a failing operation is rolled back without affecting the others.
+    Returns one (ok, result_or_exception) pair per operation, if the commit itself fails every operation fails.
+    """
+    results = []
+    try:
+        # A single statement writer that failed leaves the implicit transaction open, nothing of it
+        # was committed, so it's rolled back instead of making BEGIN fail for every batch after it.
+        if con.in_transaction:
+            logging.warning("Rolling back a transaction left open on the writer connection.")
+            con.rollback()
+        con.execute("BEGIN")
+        for func, args in ops:
+            con.execute("SAVEPOINT batch_op")
+            try:
+                results.append((True, func(con, *args)))
+            except sqlite3.Error as e:
+                con.execute("ROLLBACK TO batch_op")
+                results.append((False, e))
+            con.execute("RELEASE batch_op")
+        con.commit()
+        return results
+    except sqlite3.Error as e:
+        logging.error(f"Error committing write batch: {e}")
+        if con.in_transaction:
+            con.rollback()
+        return [(False, e)] * len(ops)
+
+
+def len_leaderboard(con, guild_id: int):
+    """
+    A simple function which returns the length of the guild's leaderboard, used for determining the position in submit command.
     """
     try:
         cur = con.cursor()
 
-        cur.execute("SELECT COUNT(*) FROM leaderboard")
+        cur.execute("SELECT COUNT(*) FROM leaderboard WHERE guild_id = ?", (guild_id,))
         rows = cur.fetchone()
 
         return rows[0]
@@ -171,14 +661,17 @@ def len_leaderboard(con):
         logging.error(f"Error counting table leaderboard: {e}")
 
 
-def check_leaderboard(con, user_id: int):
+def check_leaderboard(con, guild_id: int, user_id: int):
     """
     A function to check if a specific user has already answered the challenge.
     """
     try:
         cur = con.cursor()
 
-        cur.execute("SELECT * FROM leaderboard WHERE user_id = ?", (user_id,))
+        cur.execute(
+            "SELECT 1 FROM leaderboard WHERE guild_id = ? AND user_id = ?",
+            (guild_id, user_id),
+        )
         existing_record = cur.fetchone()
 
         if existing_record:
@@ -190,110 +683,157 @@ def check_leaderboard(con, user_id: int):
         logging.error(f"Error checking table leaderboard: {e}")
 
 
-def update_hint(con):
+def update_hint(con, guild_id: int):
     """
     Function which is used to set the hints_released coloumn to True (1).
     """
     try:
         cur = con.cursor()
 
-        cur.execute("UPDATE leaderboard SET hints_released = 1")
+        cur.execute(
+            "UPDATE challenge_data SET hints_released = 1 WHERE guild_id = ?",
+            (guild_id,),
+        )
+        con.commit()
+        return True
     except sqlite3.Error as e:
-        logging.error(f"Error updating hints_released table leaderboard: {e}")
+        logging.error(f"Error updating hints_released table challenge_data: {e}")
+        return False
 
 
-def insert_rating(con, user_id: int, rating: int):
+def update_rate_limit(con, guild_id: int, rate: float, burst: int):
     """
-    A Function which is responsible for inserting ratings, it firstly check if that user id has already
-    rated the challenge or not, If yes, it returns False else True and inserts the data.
+    Sets the /submit rate limit of the guild's active challenge, None restores the default.
+    Returns False if there is no active challenge.
     """
     try:
-        cur = con.cursor()
+        cur = con.execute(
+            "UPDATE challenge_data SET submit_rate = ?, submit_burst = ? WHERE guild_id = ?",
+            (rate, burst, guild_id),
+        )
+        con.commit()
+        return cur.rowcount == 1
+    except sqlite3.Error as e:
+        logging.error(f"Error updating rate limit table challenge_data: {e}")
+        return False
 
-        # Check if the user ID already exists in the table
-        cur.execute("SELECT * FROM ratings WHERE user_id = ?", (user_id,))
-        existing_rating = cur.fetchone()
 
-        if existing_rating:
-            # If the user ID exists, return False
-            return False
-        else:
-            # If the user ID doesn't exist, insert a new row
-            cur.execute(
-                "INSERT INTO ratings (user_id, rating) VALUES (?, ?)", (user_id, rating)
-            )
-            con.commit()
-            return True
+def update_attachment(con, guild_id: int, sha256: str):
+    """
+    Records the hash of the local copy of the guild's active challenge attachment, so it isn't evicted.
+    Returns False if there is no active challenge.
+    """
+    try:
+        cur = con.execute(
+            "UPDATE challenge_data SET attachment_hash = ? WHERE guild_id = ?",
+            (sha256, guild_id),
+        )
+        con.commit()
+        return cur.rowcount == 1
+    except sqlite3.Error as e:
+        logging.error(f"Error updating attachment table challenge_data: {e}")
+        return False
+
+
+def fetch_attachment_hashes(con):
+    """
+    Returns the hashes of the attachments used by active challenges, the store never evicts them.
+    """
+    try:
+        cur = con.execute(
+            "SELECT DISTINCT attachment_hash FROM challenge_data WHERE attachment_hash IS NOT NULL"
+        )
+        return {row[0] for row in cur.fetchall()}
+    except sqlite3.Error as e:
+        logging.error(f"Error fetching table challenge_data: {e}")
+        return set()
+
+
+def insert_rating(con, guild_id: int, user_id: int, rating: int):
+    """
+    A Function which is responsible for inserting ratings, If the user id has already rated the challenge
+    it returns False else True and inserts the data.
+    """
+    try:
+        inserted = add_rating(con, guild_id, user_id, rating)
+        con.commit()
+        return inserted
     except sqlite3.Error as e:
         logging.error(f"Error inserting table rating: {e}")
 
 
-def fetch_config(con):
+def add_rating(con, guild_id: int, user_id: int, rating: int):
     """
-    A function which is used to return all the records and return it as dictionary,
-    if their is no config then it returns False.
+    Statement half of insert_rating, it does not commit so it can also run inside a batch.
+    The primary key on (guild_id, user_id) decides whether the user already rated, no SELECT needed.
+    """
+    cur = con.execute(
+        "INSERT OR IGNORE INTO ratings (guild_id, user_id, rating) VALUES (?, ?, ?)",
+        (guild_id, user_id, rating),
+    )
+    return cur.rowcount == 1
+
+
+def fetch_config(con, guild_id: int):
+    """
+    A function which is used to return the guild's config as a BotConfig,
+    if their is no config then it returns None.
     """
     try:
         cur = con.cursor()
-
-        cur.execute("SELECT * FROM config")
-        row = cur.fetchone()
-        if row:
-            return {
-                "channel_id": row[1],
-                "ctf_creators": row[2],
-                "leaderboard_channel_id": row[3],
-            }
+        cur.row_factory = _config_row
+        return cur.execute(SELECT_CONFIG, (guild_id,)).fetchone()
     except sqlite3.Error as e:
         logging.error(f"Error fetching table config: {e}")
         return None
 
 
-def fetch_challenge_data(con):
+def fetch_challenge_data(con, guild_id: int):
+    """
+    Returns the guild's active challenge as a Challenge, None if there is none.
+    """
     try:
         cur = con.cursor()
-        cur.execute("SELECT * FROM challenge_data")
-        row = cur.fetchone()
-        if row:
-            return {
-                "day": row[0],
-                "master_id": row[1],
-                "description": row[2],
-                "answer": row[3],
-                "attachment": row[4],
-                "hints": row[5],
-                "writeup": row[6],
-                "hints_released": row[7],
-                "start_time": row[8],
-            }
-        else:
-            return None
+        cur.row_factory = _challenge_row
+        return cur.execute(SELECT_CHALLENGE, (guild_id,)).fetchone()
     except sqlite3.Error as e:
         logging.error(f"Error fetching challenge data: {e}")
 
 
-def remove_challenge_data(con):
+def fetch_active_guilds(con):
+    """
+    Returns the IDs of the guilds which currently have an active challenge.
+    """
     try:
-        cur = con.cursor()
+        cur = con.execute("SELECT guild_id FROM challenge_data")
+        return [row[0] for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        logging.error(f"Error fetching table challenge_data: {e}")
+        return []
 
-        cur.execute("BEGIN TRANSACTION")
 
-        cur.execute("DELETE FROM challenge_data")
-        cur.execute("DELETE FROM leaderboard")
-        cur.execute("DELETE FROM ratings")
-        con.commit()
-        logging.info("Deleted table challenge_data successfully.")
+def remove_challenge_data(con, guild_id: int):
+    """
+    Ends the guild's active challenge, it is archived with its leaderboard and ratings in one transaction.
+    """
+    try:
+        with con:
+            _archive_challenge(con.cursor(), guild_id)
+        logging.info("Archived table challenge_data successfully.")
+        return True
 
     except sqlite3.Error as e:
         logging.error(f"Error deleting table challenge_data: {e}")
+        return False
 
 
-def fetch_leaderboard_data(con):
+def fetch_leaderboard_data(con, guild_id: int):
     try:
         cur = con.cursor()
 
         cur.execute(
-            "SELECT user_id, submission FROM leaderboard ORDER BY submission ASC"
+            "SELECT user_id, submission FROM leaderboard WHERE guild_id = ? ORDER BY rowid ASC",
+            (guild_id,),
         )
         leaderboard_data = cur.fetchall()
         return leaderboard_data
@@ -303,29 +843,259 @@ def fetch_leaderboard_data(con):
         return None
 
 
-def fetch_rating(con):
+def insert_event(con, guild_id: int, day: int, event: str, due: float):
+    """
+    Persists a scheduled event, due is a unix timestamp. Returns the id of the event.
+    """
+    try:
+        cur = con.execute(
+            "INSERT INTO schedule (guild_id, day, event, due) VALUES (?, ?, ?, ?)",
+            (guild_id, day, event, due),
+        )
+        con.commit()
+        return cur.lastrowid
+    except sqlite3.Error as e:
+        logging.error(f"Error inserting table schedule: {e}")
+        return None
+
+
+def delete_event(con, event_id: int):
+    try:
+        con.execute("DELETE FROM schedule WHERE id = ?", (event_id,))
+        con.commit()
+        return True
+    except sqlite3.Error as e:
+        logging.error(f"Error deleting from table schedule: {e}")
+        return False
+
+
+def clear_events(con, guild_id: int):
+    """
+    Drops every pending event of a guild, used when its active challenge is replaced or removed.
+    """
+    try:
+        con.execute("DELETE FROM schedule WHERE guild_id = ?", (guild_id,))
+        con.commit()
+        return True
+    except sqlite3.Error as e:
+        logging.error(f"Error deleting table schedule: {e}")
+        return False
+
+
+def fetch_events(con):
+    """
+    Returns every pending event of every guild as (id, guild_id, day, event, due) ordered by due time.
+    """
+    try:
+        cur = con.execute(
+            "SELECT id, guild_id, day, event, due FROM schedule ORDER BY due"
+        )
+        return cur.fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Error fetching table schedule: {e}")
+        return []
+
+
+def fetch_challenge_history(con, guild_id: int, day: int):
+    """
+    Returns an archived challenge with its solves in rank order as (user_id, rank, submission), or None.
+    """
+    try:
+        cur = con.execute(
+            """SELECT day, master_id, description, answer, attachment, hints, writeup, start_time, end_time
+               FROM challenge_history WHERE guild_id = ? AND day = ?""",
+            (guild_id, day),
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        challenge = dict(
+            zip(
+                ("day", "master_id", "description", "answer", "attachment", "hints", "writeup", "start_time", "end_time"),
+                row,
+            )
+        )
+        cur.execute(
+            "SELECT user_id, rank, submission FROM solve_history WHERE guild_id = ? AND day = ? ORDER BY rank",
+            (guild_id, day),
+        )
+        challenge["solves"] = cur.fetchall()
+        return challenge
+    except sqlite3.Error as e:
+        logging.error(f"Error fetching table challenge_history: {e}")
+        return None
+
+
+def fetch_user_history(con, guild_id: int, user_id: int):
+    """
+    Returns every archived solve of a user in the guild as (day, rank, submission), oldest first.
+    """
+    try:
+        cur = con.execute(
+            "SELECT day, rank, submission FROM solve_history WHERE guild_id = ? AND user_id = ? ORDER BY day",
+            (guild_id, user_id),
+        )
+        return cur.fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Error fetching table solve_history: {e}")
+        return []
+
+
+def fetch_user_stats(con, guild_id: int, season: int):
+    """
+    Returns the totals of every user of a guild and season as (user_id, solves, first_bloods, points, solve_seconds).
+    """
+    try:
+        cur = con.execute(
+            """SELECT user_id, solves, first_bloods, points, solve_seconds FROM user_stats
+               WHERE guild_id = ? AND season = ? ORDER BY points DESC""",
+            (guild_id, season),
+        )
+        return cur.fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Error fetching table user_stats: {e}")
+        return []
+
+
+def fetch_meta(con, key: str):
+    try:
+        cur = con.execute("SELECT value FROM meta WHERE key = ?", (key,))
+        row = cur.fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logging.error(f"Error fetching table meta: {e}")
+        return None
+
+
+def update_meta(con, key: str, value: str):
+    try:
+        con.execute(
+            """INSERT INTO meta (key, value) VALUES (?, ?)
+               ON CONFLICT(key) DO UPDATE SET value = excluded.value""",
+            (key, value),
+        )
+        con.commit()
+        return True
+    except sqlite3.Error as e:
+        logging.error(f"Error updating table meta: {e}")
+        return False
+
+
+def insert_outbox(con, kind: str, payload: str, now: float):
+    """
+    Queues a message for delivery, due straight away. Returns the id of the row.
+    """
+    try:
+        cur = con.execute(
+            "INSERT INTO outbox (kind, payload, next_attempt) VALUES (?, ?, ?)",
+            (kind, payload, now),
+        )
+        con.commit()
+        return cur.lastrowid
+    except sqlite3.Error as e:
+        logging.error(f"Error inserting table outbox: {e}")
+        return None
+
+
+def fetch_outbox(con, kind: str, now: float, limit: int, max_attempts: int):
+    """
+    Returns up to limit messages of a kind that are due, oldest first, as (id, payload, attempts).
+    Messages that failed max_attempts times are left in the table but no longer returned.
+    """
+    try:
+        cur = con.execute(
+            """SELECT id, payload, attempts FROM outbox
+               WHERE kind = ? AND next_attempt <= ? AND attempts < ?
+               ORDER BY id LIMIT ?""",
+            (kind, now, max_attempts, limit),
+        )
+        return cur.fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Error fetching table outbox: {e}")
+        return []
+
+
+def next_outbox_attempt(con, kind: str, max_attempts: int):
+    """
+    Returns when the next message of a kind is due, or None if there's nothing left to deliver.
+    """
+    try:
+        cur = con.execute(
+            "SELECT MIN(next_attempt) FROM outbox WHERE kind = ? AND attempts < ?",
+            (kind, max_attempts),
+        )
+        return cur.fetchone()[0]
+    except sqlite3.Error as e:
+        logging.error(f"Error fetching table outbox: {e}")
+        return None
+
+
+def delete_outbox(con, ids):
+    try:
+        con.executemany("DELETE FROM outbox WHERE id = ?", [(id,) for id in ids])
+        con.commit()
+        return True
+    except sqlite3.Error as e:
+        logging.error(f"Error deleting from table outbox: {e}")
+        return False
+
+
+def retry_outbox(con, ids, next_attempt: float, error: str):
+    """
+    Records a failed delivery of the messages and when to try them again.
+    """
+    try:
+        con.executemany(
+            """UPDATE outbox SET attempts = attempts + 1, next_attempt = ?, last_error = ?
+               WHERE id = ?""",
+            [(next_attempt, error, id) for id in ids],
+        )
+        con.commit()
+        return True
+    except sqlite3.Error as e:
+        logging.error(f"Error updating table outbox: {e}")
+        return False
+
+
+def fetch_solver_ids(con, guild_id: int):
+    """
+    Returns the user IDs of everyone on the guild's leaderboard, used to warm up the in-memory challenge cache.
+    """
     try:
         cur = con.cursor()
 
-        cur.execute("SELECT user_id, rating FROM ratings")
+        cur.execute("SELECT user_id FROM leaderboard WHERE guild_id = ?", (guild_id,))
+        return [row[0] for row in cur.fetchall()]
+
+    except sqlite3.Error as e:
+        logging.error(f"Error fetching table leaderboard: {e}")
+        return []
+
+
+def fetch_rating(con, guild_id: int):
+    try:
+        cur = con.cursor()
+
+        cur.execute(
+            "SELECT user_id, rating FROM ratings WHERE guild_id = ?", (guild_id,)
+        )
         ratings_data = cur.fetchall()
         return ratings_data
 
     except sqlite3.Error as e:
         logging.error(f"Error fetching table ratings: {e}")
 
-def generate_title(con):
+def generate_title(con, guild_id: int):
     try:
         cur = con.cursor()
         
-        cur.execute("SELECT * FROM sqlite_sequence")
+        cur.execute("SELECT last_day FROM config WHERE id = ?", (guild_id,))
         day = cur.fetchone()
         
-        if day:
-            return f"Set a Challenge for Day {day[1] + 1}"
+        if day and day[0]:
+            return f"Set a Challenge for Day {day[0] + 1}"
         else:
             return "Set a Challenge"
     
     except sqlite3.Error as e:
         logging.error(f"Error generating title: {e}")
-
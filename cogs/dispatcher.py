@@ -0,0 +1,171 @@
+# cogs/dispatcher.py - Central outbound queue for channel messages and DMs, paced per route and retried on rate limits.
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+# Discord allows about 5 messages per 5 seconds in a channel, each route gets a bucket a little under that.
+ROUTE_BURST = 5
+ROUTE_RATE = 0.9  # messages per second
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Longest message Discord accepts, merged announcements are kept under it.
+MAX_CONTENT = 2000
+
+
+def _retry_delay(error, attempt):
+    """
+    How long to wait before retrying a failed send, None if the error is not worth retrying.
+    discord.RateLimited carries retry_after, other HTTPExceptions only their status: 429 and 5xx
+    are retried with jittered exponential backoff, anything else (missing permissions, unknown channel) fails.
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return retry_after
+    status = getattr(error, "status", None)
+    if status == 429 or (status is not None and status >= 500):
+        return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+    return None
+
+
+class _Route:
+    def __init__(self):
+        self.queue = deque()  # (target, content, kwargs, merge, futures)
+        self.tokens = ROUTE_BURST
+        self.last = time.monotonic()
+        self.task = None
+
+    def wait_time(self):
+        now = time.monotonic()
+        self.tokens = min(ROUTE_BURST, self.tokens + (now - self.last) * ROUTE_RATE)
+        self.last = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / ROUTE_RATE
+
+    @property
+    def busy(self):
+        return bool(self.queue) or (self.task is not None and not self.task.done())
+
+    def expired(self):
+        """
+        True once the route is idle and its bucket has refilled, dropping it then loses no pacing state.
+        """
+        if self.busy:
+            return False
+        self.wait_time()
+        return self.tokens >= ROUTE_BURST
+
+
+class Dispatcher:
+    """
+    Every channel message and DM of the bot goes through here instead of calling send() directly.
+    Messages are queued per route (a channel or a user), each route is drained by its own task in FIFO
+    order and paced by a token bucket so the bot stays under Discord's per-channel limits instead of running
+    into 429s. When a send is rate limited anyway it is retried with backoff, so a rate limit slows the bot
+    down rather than failing the command. Plain text messages sent with merge=True that pile up on a route
+    are joined into a single message.
+    send() returns a future with the sent message (None if it failed), callers don't have to await it.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._pruned = time.monotonic()
+        self.sent = 0
+        self.merged = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def depth(self):
+        return sum(len(route.queue) for route in self._routes.values())
+
+    def depths(self):
+        return {key: len(route.queue) for key, route in self._routes.items() if route.queue}
+
+    def send(self, target, content=None, merge=False, **kwargs):
+        """
+        Queues target.send(content, **kwargs), target being anything with an id and a send coroutine
+        (TextChannel, User, Member). merge=True allows joining it with other plain text announcements.
+        """
+        future = asyncio.get_running_loop().create_future()
+        key = (type(target).__name__, target.id)
+        self._prune()
+        route = self._routes.get(key)
+        if route is None:
+            route = self._routes[key] = _Route()
+
+        merge = merge and content is not None and not kwargs
+        last = route.queue[-1] if route.queue else None
+        if (
+            merge
+            and last is not None
+            and last[3]
+            and len(last[1]) + len(content) + 1 <= MAX_CONTENT
+        ):
+            route.queue[-1] = (target, f"{last[1]}\n{content}", {}, True, last[4] + [future])
+            self.merged += 1
+        else:
+            route.queue.append((target, content, kwargs, merge, [future]))
+
+        if route.task is None or route.task.done():
+            route.task = asyncio.ensure_future(self._drain(route))
+        return future
+
+    async def _drain(self, route):
+        while route.queue:
+            delay = route.wait_time()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            route.tokens -= 1
+            target, content, kwargs, _, futures = route.queue.popleft()
+            message = await self._deliver(target, content, kwargs)
+            for future in futures:
+                if not future.done():
+                    future.set_result(message)
+
+    def _prune(self):
+        """
+        Drops the idle routes whose bucket has refilled, at most once per refill period. Routes are kept
+        until then, a fresh route starts with a full burst and would let the next messages skip the pacing.
+        """
+        now = time.monotonic()
+        if now - self._pruned < ROUTE_BURST / ROUTE_RATE:
+            return
+        self._pruned = now
+        for key in [key for key, route in self._routes.items() if route.expired()]:
+            del self._routes[key]
+
+    async def _deliver(self, target, content, kwargs):
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                message = await target.send(content, **kwargs)
+                self.sent += 1
+                return message
+            except Exception as e:
+                delay = _retry_delay(e, attempt)
+                if delay is None or attempt == MAX_ATTEMPTS - 1:
+                    self.failed += 1
+                    logging.error(f"Error sending message to {target}: {e}")
+                    return None
+                self.retried += 1
+                logging.warning(f"Rate limited sending to {target}, retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+
+    async def drain(self):
+        """
+        Waits until every queued message has been sent, used on shutdown.
+        """
+        while True:
+            tasks = [route.task for route in list(self._routes.values()) if route.busy]
+            if not tasks:
+                return
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Shared dispatcher used by every cog.
+dispatcher = Dispatcher()
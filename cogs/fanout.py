@@ -0,0 +1,76 @@
+# cogs/fanout.py - Background queue for the follow-up work of a command (DMs, announcements, prompts).
+
+import asyncio
+import logging
+
+
+class FanoutQueue:
+    """
+    Runs coroutine jobs in the background with at most `workers` of them in flight, so a command can
+    answer its interaction first and leave the slow Discord calls for later. A failing job is logged and
+    doesn't affect the others. The queue is bounded, when it is full new jobs are dropped with a warning
+    rather than holding up the command that submitted them.
+    Workers are started on the first submit, so the queue can be created at import time.
+    """
+
+    def __init__(self, workers=4, maxsize=1000):
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue = None
+        self._tasks = []
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.ensure_future(self._worker()) for _ in range(self.workers)
+        ]
+
+    def submit(self, func, *args):
+        """
+        Queues func(*args), func being a coroutine function. Returns False if the job was dropped.
+        """
+        if self._queue is None:
+            self._start()
+        try:
+            self._queue.put_nowait((func, args))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logging.warning(f"Fan-out queue is full, dropped {func.__qualname__}.")
+            return False
+
+    async def _worker(self):
+        while True:
+            func, args = await self._queue.get()
+            try:
+                await func(*args)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Error in background job {func.__qualname__}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def drain(self):
+        """
+        Waits for every queued job and stops the workers, used on shutdown.
+        """
+        if self._queue is None:
+            return
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queue = None
+        self._tasks = []
+
+
+# Shared queue for the follow-ups of interactions.
+fanout = FanoutQueue()
@@ -0,0 +1,31 @@
+# cogs/feedback.py - Delivery of /feedback submissions to the bot creator's webhook through the outbox.
+
+import os
+
+import discord
+
+from .async_db import db
+from .http_session import http_session
+from .outbox import Outbox
+
+# The feedback channel of the official bot server, self-hosters can point it at their own webhook.
+FEEDBACK_WEBHOOK_URL = os.environ.get(
+    "FEEDBACK_WEBHOOK_URL",
+    "https://discord.com/api/webhooks/1231415807549112360/hIUh0IQA6Cby1hThcZCUkTSEzslJEn7PdoWfNDpnzItgHZk85kBT5h20KxXDTx37yAVe",
+)
+
+# A webhook message holds at most 10 embeds.
+EMBEDS_PER_MESSAGE = 10
+
+
+async def send_feedback(payloads):
+    """
+    Sends a batch of feedback embeds (as dicts) in a single webhook message.
+    """
+    webhook = discord.Webhook.from_url(
+        FEEDBACK_WEBHOOK_URL, session=await http_session.get()
+    )
+    await webhook.send(embeds=[discord.Embed.from_dict(payload) for payload in payloads])
+
+
+feedback_outbox = Outbox(db, "feedback", send_feedback, batch_size=EMBEDS_PER_MESSAGE)
@@ -0,0 +1,138 @@
+# cogs/flags.py - Flag verification: salted hashes, several accepted flags per challenge and normalization rules.
+
+import hashlib
+import hmac
+import json
+import os
+import re
+
+# Options an accepted flag can be prefixed with, they can be combined (e.g. "nocase:nowrap:flag{Hello}").
+#   nocase:  case-insensitive match
+#   nowrap:  the flag{...} wrapper is optional, "flag{abc}" and "abc" are both accepted
+#   re:      the rest of the line is a regular expression which has to match the whole submission
+OPTIONS = ("nocase", "nowrap", "re")
+
+# Matches a wrapped flag like flag{...} or CTF{...}, the prefix can't be empty.
+WRAPPER = re.compile(r"^[A-Za-z0-9_]+\{(.*)\}$", re.DOTALL)
+
+SALT_BYTES = 16
+
+# A line of the answer starting with this is not a flag but the text revealed when the challenge ends,
+# it is the only part of the answer stored in plain text.
+REVEAL = "reveal:"
+
+
+def parse_flags(text: str):
+    """
+    Splits the answer typed in /setchallenge into (options, flag) pairs, one accepted flag per non-empty line.
+    """
+    specs = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith(REVEAL):
+            continue
+        options = set()
+        while True:
+            prefix, sep, rest = line.partition(":")
+            if not sep or prefix not in OPTIONS or prefix in options:
+                break
+            options.add(prefix)
+            if prefix == "re":  # Anything after re: belongs to the pattern.
+                line = rest
+                break
+            line = rest
+        if line:
+            specs.append((frozenset(options), line))
+    return specs
+
+
+def reveal_text(text: str):
+    """
+    The text of the answer's reveal: line, None if the admin didn't give one.
+    """
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith(REVEAL):
+            return line[len(REVEAL):].strip() or None
+    return None
+
+
+def normalize(flag: str, options):
+    flag = flag.strip()
+    if "nowrap" in options:
+        wrapped = WRAPPER.match(flag)
+        if wrapped:
+            flag = wrapped.group(1)
+    if "nocase" in options:
+        flag = flag.casefold()
+    return flag
+
+
+def _digest(salt: bytes, flag: str):
+    return hmac.new(salt, flag.encode(), hashlib.sha256).digest()
+
+
+def hash_flags(text: str, salt: bytes = None):
+    """
+    Turns the answer into what is stored in challenge_data.flags: a JSON document with one random salt per
+    challenge and, for every accepted flag, its options and the salted hash of the normalized flag.
+    Regular expressions can't be hashed, they are stored as written.
+    """
+    salt = salt or os.urandom(SALT_BYTES)
+    entries = []
+    for options, flag in parse_flags(text):
+        entry = {"options": sorted(options)}
+        if "re" in options:
+            entry["pattern"] = flag
+        else:
+            entry["hash"] = _digest(salt, normalize(flag, options)).hex()
+        entries.append(entry)
+    return json.dumps({"salt": salt.hex(), "flags": entries})
+
+
+class FlagVerifier:
+    """
+    Compiled form of a challenge's accepted flags. The hashes are grouped by normalization, so checking a
+    submission costs one normalization and one HMAC per group (at most four) plus a constant-time comparison
+    per hash, however many flags there are. Regex flags are compiled once here.
+    ActiveChallenge keeps one verifier per challenge, so nothing is parsed or compiled on /submit.
+    """
+
+    def __init__(self, stored: str):
+        data = json.loads(stored)
+        self.salt = bytes.fromhex(data["salt"])
+        self.hashes = {}  # normalization options -> accepted digests
+        self.patterns = []  # (normalization options, compiled pattern)
+        for entry in data["flags"]:
+            options = frozenset(entry["options"])
+            if "re" in options:
+                pattern = re.compile(
+                    entry["pattern"], re.IGNORECASE if "nocase" in options else 0
+                )
+                self.patterns.append((options - {"nocase"}, pattern))
+            else:
+                self.hashes.setdefault(options, []).append(bytes.fromhex(entry["hash"]))
+
+    @classmethod
+    def from_challenge(cls, challenge_data):
+        """
+        Builds the verifier of a challenge row. Returns None if the challenge has no accepted flag.
+        """
+        if not challenge_data.flags:
+            return None
+        verifier = cls(challenge_data.flags)
+        return verifier if verifier else None
+
+    def __bool__(self):
+        return bool(self.hashes or self.patterns)
+
+    def verify(self, submission: str):
+        matched = False
+        for options, digests in self.hashes.items():
+            digest = _digest(self.salt, normalize(submission, options))
+            for accepted in digests:
+                # No early exit, the time taken doesn't depend on which flag (if any) matched.
+                matched |= hmac.compare_digest(digest, accepted)
+        for options, pattern in self.patterns:
+            matched |= pattern.fullmatch(normalize(submission, options)) is not None
+        return matched
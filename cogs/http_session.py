@@ -0,0 +1,32 @@
+# cogs/http_session.py - One pooled aiohttp session for the bot's own HTTP requests (webhooks, downloads).
+
+# Total time allowed for one request, in seconds.
+REQUEST_TIMEOUT = 30
+
+
+class SharedSession:
+    """
+    Lazily created aiohttp.ClientSession shared by everything that talks to outside services, so
+    connections (and their TLS handshakes) are reused instead of paying for a new connector per request.
+    It is created inside the running loop on first use and recreated if it was closed.
+    """
+
+    def __init__(self):
+        self._session = None
+
+    async def get(self):
+        if self._session is None or self._session.closed:
+            import aiohttp  # Imported here so the modules using the session can be imported without it.
+
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+http_session = SharedSession()
@@ -0,0 +1,222 @@
+# cogs/metrics.py - In-process latency histograms for the app commands and the database calls.
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds of the histogram buckets, in seconds. Observations above the last one go in the +Inf bucket.
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+class _Shard:
+    __slots__ = ("counts", "total", "errors", "rows")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.errors = 0
+        self.rows = 0
+
+
+class Timer:
+    """
+    Latency histogram, call count, error count and rows touched of one command or query.
+    Every thread writes to its own shard, so recording never takes a lock (the database calls run on
+    the worker threads, the commands on the event loop). A snapshot adds the shards up, it may miss
+    an observation that is being recorded at that moment.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._shards = []
+        self._local = threading.local()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            self._shards.append(shard)  # list.append is atomic, no lock needed.
+        return shard
+
+    def observe(self, seconds: float, error=False, rows=0):
+        shard = self._shard()
+        shard.counts[bisect_left(BUCKETS, seconds)] += 1
+        shard.total += seconds
+        shard.errors += error
+        shard.rows += rows
+
+    def snapshot(self):
+        counts = [0] * (len(BUCKETS) + 1)
+        total = 0.0
+        errors = rows = 0
+        for shard in list(self._shards):
+            for i, count in enumerate(shard.counts):
+                counts[i] += count
+            total += shard.total
+            errors += shard.errors
+            rows += shard.rows
+        return Snapshot(self.name, counts, total, errors, rows)
+
+
+class Snapshot:
+    __slots__ = ("name", "counts", "total", "errors", "rows")
+
+    def __init__(self, name, counts, total, errors, rows):
+        self.name = name
+        self.counts = counts
+        self.total = total
+        self.errors = errors
+        self.rows = rows
+
+    @property
+    def calls(self):
+        return sum(self.counts)
+
+    def quantile(self, q: float):
+        """
+        Upper bound of the bucket holding the q-quantile, None without observations and inf past the last bucket.
+        """
+        calls = self.calls
+        if not calls:
+            return None
+        rank = q * calls
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    """
+    Timers of the app commands ("command") and of the functions run on the database threads ("query").
+    """
+
+    def __init__(self):
+        self._timers = {"command": {}, "query": {}}
+        self._lock = threading.Lock()
+
+    def timer(self, kind: str, name: str):
+        timers = self._timers[kind]
+        timer = timers.get(name)
+        if timer is None:
+            # Only the first call of each name gets here, two threads creating the same timer must agree.
+            with self._lock:
+                timer = timers.setdefault(name, Timer(name))
+        return timer
+
+    def command(self, name: str):
+        return self.timer("command", name)
+
+    def query(self, name: str):
+        return self.timer("query", name)
+
+    def snapshot(self, kind: str):
+        return [timer.snapshot() for timer in list(self._timers[kind].values())]
+
+    def openmetrics(self):
+        """
+        Everything in the OpenMetrics text format, for the localhost endpoint.
+        """
+        lines = []
+        for kind, label in (("command", "command"), ("query", "query")):
+            family = f"dailyctf_{kind}_seconds"
+            snapshots = self.snapshot(kind)
+            lines.append(f"# TYPE {family} histogram")
+            lines.append(f"# UNIT {family} seconds")
+            for snap in snapshots:
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), snap.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{family}_bucket{{{label}="{snap.name}",le="{le}"}} {cumulative}')
+                lines.append(f'{family}_count{{{label}="{snap.name}"}} {cumulative}')
+                lines.append(f'{family}_sum{{{label}="{snap.name}"}} {snap.total!r}')
+            lines.append(f"# TYPE dailyctf_{kind}_errors counter")
+            for snap in snapshots:
+                lines.append(f'dailyctf_{kind}_errors_total{{{label}="{snap.name}"}} {snap.errors}')
+            lines.append(f"# TYPE dailyctf_{kind}_rows counter")
+            for snap in snapshots:
+                lines.append(f'dailyctf_{kind}_rows_total{{{label}="{snap.name}"}} {snap.rows}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Registry()
+
+
+def timed_query(func, con, *args):
+    """
+    Runs func(con, *args) and records it under the function's name. Rows touched are the rows written,
+    or the rows returned for a read.
+    """
+    timer = metrics.query(func.__name__)
+    changes = con.total_changes
+    start = time.perf_counter()
+    try:
+        result = func(con, *args)
+    except Exception:
+        timer.observe(time.perf_counter() - start, error=True)
+        raise
+    rows = con.total_changes - changes
+    if not rows and isinstance(result, list):
+        rows = len(result)
+    timer.observe(time.perf_counter() - start, rows=rows)
+    return result
+
+
+def _timed_callback(timer, callback):
+    @functools.wraps(callback)
+    async def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = await callback(*args, **kwargs)
+        except Exception:
+            timer.observe(time.perf_counter() - start, error=True)
+            raise
+        timer.observe(time.perf_counter() - start)
+        return result
+
+    return timed
+
+
+def instrument_cog(cog):
+    """
+    Times every app command of the cog, call it on the instance before it's added to the bot.
+    discord.py has no hook around a command's callback, so the instance's copy of it is wrapped.
+    """
+    for command in cog.walk_app_commands():
+        callback = getattr(command, "_callback", None)  # Groups have no callback of their own.
+        if callback is not None:
+            command._callback = _timed_callback(
+                metrics.command(command.qualified_name), callback
+            )
+    return cog
+
+
+async def serve(port: int, host="127.0.0.1"):
+    """
+    Starts the OpenMetrics endpoint (GET /metrics), bound to localhost unless told otherwise.
+    Returns the aiohttp runner, clean it up to stop the server.
+    """
+    from aiohttp import web
+
+    async def handler(request):
+        return web.Response(
+            body=metrics.openmetrics().encode(),
+            headers={"Content-Type": OPENMETRICS_CONTENT_TYPE},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -3,6 +3,7 @@
 import discord
 from discord.ext import commands
 import time
+from .metrics import instrument_cog
 
 
 class misc(commands.Cog):
@@ -58,6 +59,7 @@ class misc(commands.Cog):
                 `/timeleft` - Tells the time left for the hint and the challenge end.
                 `/feedback` - Submit feedback, bugs, or suggestions.
                 `/rate` - Rate an active challenge.
+                `/leaderboard` - Show the season or all-time standings.
                 """
         embed.add_field(name="General Commands", value=general_commands, inline=False)
 
@@ -66,6 +68,9 @@ class misc(commands.Cog):
                 `/setchallenge` - Create a new challenge.
                 `/shutdown` - Shutdown the active challenge.
                 `/setup` - Setup bot settings for the server.
+                `/ratelimit` - Show or change the /submit rate limit.
+                `/newseason` - Start a new season of the leaderboard.
+                `/stats` - Show the command and database timings.
                 """
         embed.add_field(
             name="Admin Commands (for CTF creators)", value=admin_commands, inline=False
@@ -75,4 +80,4 @@ class misc(commands.Cog):
 
 
 async def setup(bot) -> None:
-    await bot.add_cog(misc(bot))
+    await bot.add_cog(instrument_cog(misc(bot)))
@@ -0,0 +1,62 @@
+# cogs/models.py - Typed objects for the rows the bot reads from the database.
+
+from dataclasses import dataclass, fields, replace
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class BotConfig:
+    """
+    Server configuration set through /setup. It is immutable: every write produces a new object
+    with the version bumped, so a reader holding a reference never sees a half-applied update.
+    """
+
+    channel_id: Optional[int] = None
+    ctf_creators: Optional[int] = None
+    leaderboard_channel_id: Optional[int] = None
+    season: Optional[int] = None
+    version: int = 0
+
+    def with_value(self, key: str, value):
+        return replace(self, **{key: value, "version": self.version + 1})
+
+
+# Columns of the config table that can be set, also used to validate keys before they reach SQL.
+CONFIG_KEYS = tuple(field.name for field in fields(BotConfig) if field.name != "version")
+
+
+@dataclass(frozen=True)
+class Challenge:
+    """
+    The active challenge of a server, a row of challenge_data. Changes (hint released, rate limit, attachment)
+    are made with dataclasses.replace, so the copy cached in ActiveChallenge is swapped in one assignment.
+    """
+
+    guild_id: Optional[int] = None
+    day: Optional[int] = None
+    master_id: Optional[int] = None
+    description: Optional[str] = None
+    answer: Optional[str] = None
+    attachment: Optional[str] = None
+    hints: Optional[str] = None
+    writeup: Optional[str] = None
+    hints_released: int = 0
+    start_time: Optional[str] = None
+    flags: Optional[str] = None
+    submit_rate: Optional[float] = None
+    submit_burst: Optional[int] = None
+    attachment_hash: Optional[str] = None
+
+
+# Columns read into each model, in field order so a row maps positionally onto the constructor.
+CHALLENGE_COLUMNS = tuple(field.name for field in fields(Challenge))
+
+# Tables backing the models and the columns they must have, checked when the database is opened.
+MODEL_TABLES = {"config": CONFIG_KEYS, "challenge_data": CHALLENGE_COLUMNS}
+
+
+def row_factory(model):
+    """
+    Cursor row_factory building model objects instead of tuples, for statements selecting the model's columns.
+    """
+    return lambda cursor, row: model(*row)
@@ -3,13 +3,21 @@
 import logging
 from discord.ext import commands, tasks
 import random
+import functools
 from .utils import release_hints, end_challenge
+from .scheduler import scheduler
+from .async_db import db
+from .dispatcher import dispatcher
+from .command_sync import sync_commands
+from .feedback import feedback_outbox
 import discord
 
 
 class onReady(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # on_ready fires again after reconnects and gateway session restarts, the setup below only runs once.
+        self.ready_once = False
 
     # Fun 1337-styled activities for bot presence
     ACTIVITIES = [
@@ -65,17 +73,28 @@ class onReady(commands.Cog):
     @commands.Cog.listener()
     async def on_ready(self):
         logging.info(f"We have logged in as {self.bot.user}")
+        if self.ready_once:
+            return
+        # Set before the first await, so an on_ready dispatched while this one is running returns straight away.
+        self.ready_once = True
+
+        # Data from the single server days is stored under guild 0, hand it to the server if there's only one.
+        if len(self.bot.guilds) == 1:
+            await db.adopt_legacy_guild(self.bot.guilds[0].id)
         try:
-            synced = await self.bot.tree.sync()
-            logging.info(f"Synced {len(synced)} command(s)...")
+            # Only hits the heavily rate limited sync endpoint when the commands changed since the last sync.
+            await sync_commands(self.bot, db)
         except Exception as e:
             logging.error(f"Error syncing commands!: {e}")
+        scheduler.register("hint", functools.partial(release_hints, self.bot))
+        scheduler.register("end", functools.partial(end_challenge, self.bot))
         try:
-            self.bot.loop.create_task(release_hints(self.bot))
+            await scheduler.start()
         except Exception as e:
-            logging.error(e)
-        self.bot.loop.create_task(end_challenge(self.bot))
-        await self.change_activity.start()
+            logging.error(f"Error starting scheduler: {e}")
+        # Delivers feedback left in the outbox by the previous run.
+        feedback_outbox.start()
+        self.change_activity.start()
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
@@ -88,11 +107,13 @@ class onReady(commands.Cog):
             None,
         )
         if channel is not None:
-            await channel.send(
+            dispatcher.send(
+                channel,
                 "Hello, thanks for adding DailyCTF Robot to your server! 🎉\n"
                 "DailyCTF Robot is a bot designed to automate and enhance the experience of hosting Capture The Flag challenges, making it seamless for both organizers and participants."
             )
-            await channel.send(
+            dispatcher.send(
+                channel,
                 "To get started, please use the `/setup` command to configure me for your server."
             )
             cheatsheet = """
@@ -104,7 +125,7 @@ class onReady(commands.Cog):
 			`/timeleft` - Shows the remaining time for hint and for the challenege to end.
 			`/feedback` - Allows to submit feedback to bot creator.
 			"""
-            await channel.send(cheatsheet)
+            dispatcher.send(channel, cheatsheet)
 
 
 async def setup(bot) -> None:
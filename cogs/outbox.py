@@ -0,0 +1,111 @@
+# cogs/outbox.py - Durable queue for messages sent to outside services, delivered in the background.
+
+import asyncio
+import json
+import logging
+import random
+import time
+
+# Retry delays between failed deliveries, in seconds: exponential with jitter, capped.
+RETRY_BASE = 5.0
+RETRY_MAX = 3600.0
+MAX_ATTEMPTS = 10
+
+# How often the worker looks for due messages when nothing wakes it up.
+POLL_INTERVAL = 60.0
+
+
+def retry_delay(attempts: int):
+    delay = min(RETRY_MAX, RETRY_BASE * 2 ** attempts)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class Outbox:
+    """
+    Messages of one kind are stored in the outbox table first, so the command that produced them can answer
+    straight away and nothing is lost if the service is down or the bot restarts. A single worker task
+    delivers them in batches of up to batch_size with deliver(payloads), an async function that raises on
+    failure; a failed batch is retried later with backoff, and given up on (left in the table) after
+    MAX_ATTEMPTS. Payloads are anything JSON serializable.
+    The worker is started by the first put() or by start(), which also delivers what a previous run left.
+    """
+
+    def __init__(self, database, kind: str, deliver, batch_size=10):
+        self.database = database
+        self.kind = kind
+        self.deliver = deliver
+        self.batch_size = batch_size
+        self.delivered = 0
+        self.failed = 0
+        self._event = None
+        self._task = None
+
+    @property
+    def _wakeup(self):
+        # Created on first use, on Python < 3.10 an Event binds to the loop current at creation time.
+        if self._event is None:
+            self._event = asyncio.Event()
+        return self._event
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def put(self, payload):
+        """
+        Stores the payload for delivery, returns its id or None if it couldn't be stored.
+        """
+        message_id = await self.database.insert_outbox(self.kind, json.dumps(payload))
+        self.start()
+        self._wakeup.set()
+        return message_id
+
+    async def flush(self):
+        """
+        Delivers one batch of due messages, returns how many were delivered (0 if nothing was due or it failed).
+        """
+        rows = await self.database.fetch_outbox(self.kind, self.batch_size, MAX_ATTEMPTS)
+        if not rows:
+            return 0
+        ids = [row[0] for row in rows]
+        try:
+            await self.deliver([json.loads(row[1]) for row in rows])
+        except Exception as e:
+            attempts = max(row[2] for row in rows)
+            self.failed += len(ids)
+            logging.error(f"Delivering {len(ids)} {self.kind} message(s) failed (attempt {attempts + 1}): {e!r}")
+            await self.database.retry_outbox(ids, time.time() + retry_delay(attempts), repr(e))
+            return 0
+        await self.database.delete_outbox(ids)
+        self.delivered += len(ids)
+        return len(ids)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                while await self.flush():
+                    pass
+            except Exception as e:
+                logging.error(f"Error in the {self.kind} outbox worker: {e!r}")
+
+            # The floor keeps a database that can't record the retry from turning this into a busy loop.
+            due = await self.database.next_outbox_attempt(self.kind, MAX_ATTEMPTS)
+            timeout = POLL_INTERVAL if due is None else min(POLL_INTERVAL, max(0.5, due - time.time()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
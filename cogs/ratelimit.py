@@ -0,0 +1,77 @@
+# cogs/ratelimit.py - Token bucket rate limiter for /submit, keyed by guild and user.
+
+import time
+from collections import Counter, OrderedDict
+
+# Defaults used when the active challenge has no limits of its own (see /ratelimit).
+DEFAULT_RATE = 6.0  # attempts per minute
+DEFAULT_BURST = 5
+
+# Sent to every rejected attempt, the same string each time so a flood costs nothing to answer.
+RATE_LIMITED_MESSAGE = "Slow down! You're submitting too fast, try again in a bit."
+
+
+class TokenBucketLimiter:
+    """
+    One token bucket per (guild_id, user_id): every attempt takes a token, tokens refill at `rate` per minute
+    up to `burst`. Buckets live in an OrderedDict in least recently used order, so a check is O(1) and
+    buckets unused for `idle` seconds are evicted from the front as new attempts come in (with the default
+    limits a bucket is full again long before that). max_entries bounds the memory even if every bucket is active.
+    """
+
+    def __init__(self, idle=600.0, max_entries=100_000):
+        self.idle = idle
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # (guild_id, user_id) -> [tokens, last refill]
+        self.allowed = Counter()  # guild_id -> attempts let through
+        self.rejected = Counter()  # guild_id -> attempts rejected
+
+    def allow(self, guild_id: int, user_id: int, rate=None, burst=None, now=None):
+        rate = (rate or DEFAULT_RATE) / 60
+        burst = burst or DEFAULT_BURST
+        now = time.monotonic() if now is None else now
+        key = (guild_id, user_id)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        self._evict(now)
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed[guild_id] += 1
+            return True
+        self.rejected[guild_id] += 1
+        return False
+
+    def _evict(self, now):
+        buckets = self._buckets
+        while buckets:
+            key, (_, last) = next(iter(buckets.items()))
+            if now - last < self.idle and len(buckets) <= self.max_entries:
+                break
+            del buckets[key]
+
+    def reset(self, guild_id: int):
+        """
+        Drops the guild's buckets and counters, used when a new challenge starts.
+        """
+        for key in [key for key in self._buckets if key[0] == guild_id]:
+            del self._buckets[key]
+        self.allowed.pop(guild_id, None)
+        self.rejected.pop(guild_id, None)
+
+    def stats(self, guild_id: int):
+        return {
+            "tracked": sum(1 for key in self._buckets if key[0] == guild_id),
+            "allowed": self.allowed[guild_id],
+            "rejected": self.rejected[guild_id],
+        }
+
+
+# Shared limiter for /submit.
+submit_limiter = TokenBucketLimiter()
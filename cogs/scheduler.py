@@ -0,0 +1,148 @@
+# cogs/scheduler.py - Single task that fires the timed challenge events (hint release, challenge end).
+
+import asyncio
+import heapq
+import logging
+import time
+
+from .async_db import db
+from .challenge_cache import challenge_start
+
+# Offsets from the challenge start time, in seconds.
+HINT_DELAY = 6 * 60 * 60
+END_DELAY = 24 * 60 * 60
+
+
+class Scheduler:
+    """
+    Keeps every pending event of every guild in a min-heap ordered by deadline and runs them from one task,
+    sleeping until the earliest deadline or until the heap changes. Events are persisted in the schedule table,
+    so after a restart start() reloads them and anything that came due while the bot was down fires straight away.
+    Handlers are coroutine functions taking the guild id and the challenge day, registered per event name.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._heap = []  # (due, event_id, guild_id, day, event)
+        self._handlers = {}
+        self._event = None
+        self._task = None
+
+    @property
+    def _wakeup(self):
+        # Created on first use, on Python < 3.10 an Event binds to the loop current at creation time.
+        if self._event is None:
+            self._event = asyncio.Event()
+        return self._event
+
+    def register(self, event: str, handler):
+        self._handlers[event] = handler
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """
+        Loads the persisted events and starts the scheduler task, calling it again is a no-op.
+        """
+        if self.running:
+            return
+        self._heap = []
+        events = await self.database.fetch_events()
+
+        now = time.time()
+        ended = {
+            (guild_id, day)
+            for _, guild_id, day, event, due in events
+            if event == "end" and due <= now
+        }
+        for event_id, guild_id, day, event, due in events:
+            # A hint is pointless once the challenge it belongs to is over.
+            if event == "hint" and (guild_id, day) in ended:
+                await self.database.delete_event(event_id)
+                continue
+            self._heap.append((due, event_id, guild_id, day, event))
+        heapq.heapify(self._heap)
+
+        # Databases from before the scheduler have active challenges but no events.
+        scheduled = {guild_id for _, _, guild_id, _, _ in self._heap}
+        for guild_id in await self.database.fetch_active_guilds():
+            if guild_id not in scheduled:
+                active = await self.database.active_challenge(guild_id)
+                await self.schedule_challenge(guild_id, active.challenge)
+
+        self._task = asyncio.create_task(self._run())
+        logging.info(f"Scheduler started with {len(self._heap)} pending event(s).")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def schedule(self, guild_id: int, day: int, event: str, due: float):
+        event_id = await self.database.insert_event(guild_id, day, event, due)
+        if event_id is not None:
+            heapq.heappush(self._heap, (due, event_id, guild_id, day, event))
+            self._wakeup.set()
+
+    async def schedule_challenge(self, guild_id: int, challenge_data):
+        """
+        Replaces the guild's pending events with the hint release and end of the given challenge.
+        """
+        await self.cancel(guild_id)
+        start = challenge_start(challenge_data)
+        day = challenge_data.day
+        if challenge_data.hints and not challenge_data.hints_released:
+            await self.schedule(guild_id, day, "hint", start + HINT_DELAY)
+        await self.schedule(guild_id, day, "end", start + END_DELAY)
+
+    async def cancel(self, guild_id: int):
+        """
+        Drops every pending event of a guild.
+        """
+        await self.database.clear_events(guild_id)
+        self._heap = [entry for entry in self._heap if entry[2] != guild_id]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def pending(self, guild_id=None):
+        return sorted(
+            entry for entry in self._heap if guild_id is None or entry[2] == guild_id
+        )
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due, event_id, guild_id, day, event = heapq.heappop(self._heap)
+            await self.database.delete_event(event_id)
+            handler = self._handlers.get(event)
+            if handler is None:
+                logging.warning(f"No handler registered for scheduled event {event}.")
+                continue
+            try:
+                await handler(guild_id, day)
+            except Exception as e:
+                logging.error(
+                    f"Error running scheduled event {event} for Day-{day} in guild {guild_id}: {e}"
+                )
+
+
+# Shared scheduler, the handlers are registered by the onReady cog.
+scheduler = Scheduler(db)
@@ -1,35 +1,28 @@
 # cogs/setup.py - Handles server specific configuration for the bot including role selection and channel selection.
 
 import discord
-from .db_utils import db_init, update_config, fetch_config
+from .async_db import db
+from .metrics import instrument_cog
 from discord.ext import commands
 import logging
 from discord.ext.commands import has_permissions, CheckFailure
 
-# Initialize logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s"
-)
 
-logging.getLogger("werkzeug").setLevel(logging.ERROR)
-logging.getLogger("flask.app").setLevel(logging.ERROR)
-
-
-# Shared Configuration Object to hold our configuration
+# Configuration Object to hold the configuration of a guild
 class Config:
-    def __init__(self, con):
-        self.con = con
+    def __init__(self, db, guild_id):
+        self.db = db
+        self.guild_id = guild_id
 
-    def get(self, key, default=None):
-        config = fetch_config(self.con)
+    async def get(self, key, default=None):
+        config = await self.db.config(self.guild_id)
         if config:
-            return config.get(key, default)
+            return getattr(config, key, default)
         else:
             return default
 
-    def set(self, key, value):
-        update_config(self.con, key, value)
-        self.con.commit()
+    async def set(self, key, value):
+        await self.db.update_config(self.guild_id, key, value)
 
 
 # Create a select menu for roles
@@ -44,7 +37,7 @@ class RoleSelect(discord.ui.Select):
         self.config = config
 
     async def callback(self, interaction: discord.Interaction):
-        self.config.set("ctf_creators", int(self.values[0]))
+        await self.config.set("ctf_creators", int(self.values[0]))
         await interaction.response.send_message(
             f"Selected Role: <@&{self.values[0]}>", ephemeral=True
         )
@@ -66,7 +59,7 @@ class ChannelSelect(discord.ui.Select):
         self.config = config
 
     async def callback(self, interaction: discord.Interaction):
-        self.config.set("channel_id", int(self.values[0]))
+        await self.config.set("channel_id", int(self.values[0]))
         await interaction.response.send_message(
             f"Selected Channel: <#{self.values[0]}>", ephemeral=True
         )
@@ -85,7 +78,7 @@ class LeaderboardChannelSelect(discord.ui.Select):
         self.config = config
 
     async def callback(self, interaction: discord.Interaction):
-        self.config.set("leaderboard_channel_id", int(self.values[0]))
+        await self.config.set("leaderboard_channel_id", int(self.values[0]))
         await interaction.response.send_message(
             f"Selected Leaderboard Channel: <#{self.values[0]}>", ephemeral=True
         )
@@ -103,14 +96,13 @@ class SetupView(discord.ui.View):
 
 
 class Setup(commands.Cog):
-    def __init__(self, bot, con):
+    def __init__(self, bot):
         self.bot = bot
-        self.con = con
-        self.config = Config(con)
 
     @discord.app_commands.command(
         name="setup", description="Setup bot settings for the server."
     )
+    @discord.app_commands.guild_only()
     @has_permissions(administrator=True)
     async def setup(self, interaction: discord.Interaction) -> None:
         logging.info(
@@ -118,7 +110,7 @@ class Setup(commands.Cog):
         )
         roles = interaction.guild.roles
         channels = interaction.guild.channels
-        view = SetupView(roles, channels, self.config)
+        view = SetupView(roles, channels, Config(db, interaction.guild_id))
         await interaction.response.send_message(
             "Please select the appropriate role and channel:", view=view, ephemeral=True
         )
@@ -136,5 +128,4 @@ class Setup(commands.Cog):
 
 
 async def setup(bot) -> None:
-    con = db_init()
-    await bot.add_cog(Setup(bot, con))
+    await bot.add_cog(instrument_cog(Setup(bot)))
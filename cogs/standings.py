@@ -0,0 +1,81 @@
+# cogs/standings.py - Cross-day standings: points per solve and the in-memory top-K served by /leaderboard.
+
+from bisect import insort
+
+# Season 0 holds the all-time totals, real seasons are numbered from 1 (see /newseason).
+ALL_TIME = 0
+
+# Points for a solve by rank, everyone after the podium gets the base points.
+PODIUM_POINTS = {1: 150, 2: 130, 3: 120}
+BASE_POINTS = 100
+
+TOP_K = 10
+
+
+def solve_points(rank: int):
+    return PODIUM_POINTS.get(rank, BASE_POINTS)
+
+
+class UserStats:
+    __slots__ = ("solves", "first_bloods", "points", "solve_seconds")
+
+    def __init__(self, solves=0, first_bloods=0, points=0, solve_seconds=0):
+        self.solves = solves
+        self.first_bloods = first_bloods
+        self.points = points
+        self.solve_seconds = solve_seconds
+
+    @property
+    def average_solve_time(self):
+        return self.solve_seconds / self.solves if self.solves else None
+
+
+class Standings:
+    """
+    Totals of every user of one guild and season, mirroring the user_stats rows, plus the top `k` users
+    kept sorted. Points only ever go up, so a solve can only move a user up: the top list is updated with
+    one insertion into a list of k entries and /leaderboard never sorts the whole guild.
+    """
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.totals = {}
+        self._top = []  # sort keys (-points, -first_bloods, user_id) of the top k users
+
+    @staticmethod
+    def _key(user_id, stats):
+        return (-stats.points, -stats.first_bloods, user_id)
+
+    def load(self, rows):
+        """
+        rows are (user_id, solves, first_bloods, points, solve_seconds) tuples, as returned by fetch_user_stats.
+        """
+        self.totals = {row[0]: UserStats(*row[1:]) for row in rows}
+        self._top = sorted(self._key(user_id, stats) for user_id, stats in self.totals.items())[: self.k]
+
+    def add_solve(self, user_id: int, rank: int, seconds):
+        stats = self.totals.get(user_id)
+        if stats is None:
+            stats = self.totals[user_id] = UserStats()
+        old_key = self._key(user_id, stats)
+
+        stats.solves += 1
+        stats.first_bloods += rank == 1
+        stats.points += solve_points(rank)
+        stats.solve_seconds += seconds or 0
+
+        if old_key in self._top:
+            self._top.remove(old_key)
+        new_key = self._key(user_id, stats)
+        if len(self._top) < self.k or new_key < self._top[-1]:
+            insort(self._top, new_key)
+            del self._top[self.k :]
+
+    def top(self):
+        """
+        The top users as (user_id, UserStats), best first.
+        """
+        return [(key[2], self.totals[key[2]]) for key in self._top]
+
+    def get(self, user_id: int):
+        return self.totals.get(user_id)
@@ -1,82 +1,66 @@
 import logging
-import asyncio
-import datetime
 import json
 import discord
 from discord.ext import commands
-from .db_utils import (
-    db_init,
-    fetch_config,
-    update_config,
-    fetch_challenge_data,
-    remove_challenge_data,
-    len_leaderboard,
-    update_hint,
-    fetch_rating,
-    insert_rating,
-    fetch_leaderboard_data,
-)
-
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s"
-)
-logging.getLogger("werkzeug").setLevel(logging.ERROR)
-logging.getLogger("flask.app").setLevel(logging.ERROR)
-
-con = db_init()
-
-
-async def end_challenge(bot):
-    config = fetch_config(con)
-    challenge_data = fetch_challenge_data(con)
-
-    if challenge_data is None:
+from .async_db import db
+from .scheduler import scheduler
+from .dispatcher import dispatcher
+
+async def end_challenge(bot, guild_id, day):
+    """
+    Scheduled handler for the end of a challenge, it announces the results and clears the challenge.
+    """
+    config = await db.config(guild_id)
+    challenge_data = (await db.active_challenge(guild_id)).challenge
+
+    if challenge_data is None or challenge_data.day != day:
+        logging.warning(f"Day-{day} challenge is no longer active. Nothing to end.")
         return
 
-    if challenge_data["start_time"] != "":
-        start_time = datetime.datetime.strptime(
-            challenge_data["start_time"], "%Y-%m-%d %H:%M:%S"
-        )
-        elapsed_time = datetime.datetime.utcnow() - start_time
-        remaining_time = 86400 - elapsed_time.total_seconds()
-
-        if remaining_time > 0:
-            await asyncio.sleep(remaining_time)
-    else:
-        await asyncio.sleep(86400)
-
-    challenge_channel = bot.get_channel(config["challenge_channel"])
+    challenge_channel = bot.get_channel(config.channel_id)
 
     if challenge_channel:
-        await display_leaderboard(bot)
-        await challenge_channel.send(
-            f"Day-{challenge_data['day']} Challenge has finished!"
+        await display_leaderboard(bot, guild_id)
+        dispatcher.send(
+            challenge_channel,
+            f"Day-{challenge_data.day} Challenge has finished!",
+            merge=True,
         )
-        logging.info(f"Day-{challenge_data['day']} challenge has been finished...")
+        logging.info(f"Day-{challenge_data.day} challenge has been finished...")
 
-        if "writeup" in challenge_data and challenge_data["writeup"]:
-            await challenge_channel.send(
-                f"Writeup for Day-{challenge_data['day']}: {challenge_data['writeup']}"
+        if challenge_data.writeup:
+            dispatcher.send(
+                challenge_channel,
+                f"Writeup for Day-{challenge_data.day}: {challenge_data.writeup}",
+                merge=True,
             )
         else:
-            await challenge_channel.send(
-                f"No writeup provided for Day-{challenge_data['day']}."
+            dispatcher.send(
+                challenge_channel,
+                f"No writeup provided for Day-{challenge_data.day}.",
+                merge=True,
             )
 
-        avg = calculate_average_rating()
+        avg = await calculate_average_rating(guild_id)
         if avg is not None:
-            await challenge_channel.send(
-                f"The average rating for the challenge is: {avg:.2f}"
+            dispatcher.send(
+                challenge_channel,
+                f"The average rating for the challenge is: {avg:.2f}",
+                merge=True,
             )
         else:
-            await challenge_channel.send("No ratings received for the challenge.")
-        remove_challenge_data(con)
+            dispatcher.send(
+                challenge_channel, "No ratings received for the challenge.", merge=True
+            )
+
+    await db.remove_challenge_data(guild_id)
+    await scheduler.cancel(guild_id)
 
 
-async def display_leaderboard(bot):
-    config = fetch_config(con)
-    leaderboard_data = fetch_leaderboard_data(con)
-    challenge_data = fetch_challenge_data(con)
+async def display_leaderboard(bot, guild_id):
+    config = await db.config(guild_id)
+    leaderboard_data = await db.fetch_leaderboard_data(guild_id)
+    challenge_data = (await db.active_challenge(guild_id)).challenge
 
     if not leaderboard_data:
         logging.warning("No leaderboard data available.")
@@ -84,7 +68,7 @@ async def display_leaderboard(bot):
 
     # Create an embed object
     embed = discord.Embed(
-        title=f"🏆 The winners of Day {challenge_data['day']} CTF are: 🏆",
+        title=f"🏆 The winners of Day {challenge_data.day} CTF are: 🏆",
         description="Here are the top performers!",
         color=discord.Color.blue(),
     )
@@ -98,24 +82,17 @@ async def display_leaderboard(bot):
             embed.add_field(
                 name=f"{position_emojis[i]} {user.name}", value="", inline=False
             )
-    challenge_channel = bot.get_channel(config["leaderboard_channel_id"])
+    challenge_channel = bot.get_channel(config.leaderboard_channel_id)
     if challenge_channel:
-        await challenge_channel.send(embed=embed)
+        dispatcher.send(challenge_channel, embed=embed)
 
 
-def calculate_average_rating():
-    challenge_data = fetch_challenge_data(con)
-    ratings_data = fetch_rating(con)
+async def calculate_average_rating(guild_id):
+    # The cache keeps a running sum and count of the ratings, so this never rescans the table.
+    active = await db.active_challenge(guild_id)
 
-    if challenge_data and ratings_data:
-        total_ratings = sum(rating[1] for rating in ratings_data)
-        num_ratings = len(ratings_data)
-
-        if num_ratings > 0:
-            average_rating = total_ratings / num_ratings
-            return average_rating
-        else:
-            return None
+    if active.challenge and active.rating_count:
+        return active.average_rating
     else:
         logging.warning(
             "No challenge data or ratings data available. Unable to calculate average rating."
@@ -140,9 +117,12 @@ class RateButton(discord.ui.Button):
         self.rating = rating
 
     async def callback(self, interaction: discord.Interaction):
-        user_id = str(interaction.user.id)
+        user_id = interaction.user.id
 
-        rating_inserted = insert_rating(con, user_id, self.rating)
+        active = await db.active_challenge(interaction.guild_id)
+        rating_inserted = not active.has_rated(user_id) and await db.insert_rating(
+            interaction.guild_id, user_id, self.rating
+        )
         if rating_inserted:
             await interaction.response.send_message(
                 f"You rated the challenge {self.rating} stars!", ephemeral=True
@@ -153,39 +133,30 @@ class RateButton(discord.ui.Button):
             )
 
 
-async def release_hints(bot):
+async def release_hints(bot, guild_id, day):
+    """
+    Scheduled handler for the hint release, the hint is only posted if nobody solved the challenge yet.
+    """
     logging.info("Function release_hints started.")
 
-    challenge_data = fetch_challenge_data(con)
-    if not challenge_data:
-        logging.warning("No challenge data available. Exiting release_hints.")
+    active = await db.active_challenge(guild_id)
+    challenge_data = active.challenge
+    if not challenge_data or challenge_data.day != day:
+        logging.warning(f"Day-{day} challenge is no longer active. Exiting release_hints.")
         return
 
-    if "start_time" in challenge_data:
-        start_time = datetime.datetime.strptime(
-            challenge_data["start_time"], "%Y-%m-%d %H:%M:%S"
-        )
-        elapsed_time = datetime.datetime.utcnow() - start_time
-        remaining_time = 21600 - elapsed_time.total_seconds()
+    config = active.config
 
-        if remaining_time > 0:
-            await asyncio.sleep(remaining_time)
-    else:
-        logging.error(
-            "start_time not found in challenge_data. Unable to determine hint release time."
-        )
-
-    config = fetch_config(con)
-
-    if challenge_data["hints"] != "" and len_leaderboard(con) == 0:
-        challenge_channel = bot.get_channel(config["challenge_channel"])
+    if challenge_data.hints != "" and active.solve_count == 0:
+        challenge_channel = bot.get_channel(config.channel_id)
         if challenge_channel:
-            await challenge_channel.send(
-                f"Hint for Day-{challenge_data['day']}: `{challenge_data['hints']}`"
+            dispatcher.send(
+                challenge_channel,
+                f"Hint for Day-{challenge_data.day}: `{challenge_data.hints}`"
             )
-            logging.info(f"Hint for Day-{challenge_data['day']} released.")
+            logging.info(f"Hint for Day-{challenge_data.day} released.")
 
-        update_hint(con)
+        await db.update_hint(guild_id)
     else:
         logging.warning(
             "Hints were either already revealed or there is an active leaderboard. No hint was released."
@@ -193,15 +164,13 @@ async def release_hints(bot):
 
 
 async def check_rating(interaction):
-    challenge_data = fetch_challenge_data(con)
-    if challenge_data:
-        ratings = fetch_rating(con)
-        for rating in ratings:
-            if rating[0] == interaction.user.id:
-                await interaction.followup.send(
-                    "You've already submitted!", ephemeral=True
-                )
-                return
+    active = await db.active_challenge(interaction.guild_id)
+    if active.challenge:
+        if active.has_rated(interaction.user.id):
+            await interaction.followup.send(
+                "You've already submitted!", ephemeral=True
+            )
+            return
 
         view = RateView()
         await interaction.followup.send(
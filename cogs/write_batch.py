@@ -0,0 +1,74 @@
+# cogs/write_batch.py - Group commit for the hot write paths (solves and ratings).
+
+import asyncio
+import functools
+
+from . import db_utils
+from .metrics import timed_query
+
+
+class WriteBatcher:
+    """
+    Collects writes for a few milliseconds and commits them in a single transaction on the database
+    writer thread, instead of paying one commit per solve or rating. Every caller still awaits its own
+    result: the return value of its statement function, or the sqlite3 exception it raised.
+    While a batch is being committed new writes keep queueing up, so batches grow with the load.
+    """
+
+    def __init__(self, database, window=0.005, max_batch=256):
+        self.database = database
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self._commits = set()
+
+    async def submit(self, func, *args):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((func, args, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    async def drain(self):
+        """
+        Commits whatever is still pending and waits for the in-flight batches, used on shutdown.
+        """
+        self._flush()
+        if self._commits:
+            await asyncio.gather(*self._commits, return_exceptions=True)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._commit(batch))
+            # Keep a reference until the commit is done, the loop only holds weak ones.
+            self._commits.add(task)
+            task.add_done_callback(self._commits.discard)
+
+    async def _commit(self, batch):
+        try:
+            results = await self.database.run(
+                db_utils.run_batch,
+                # Timed one by one too, the run_batch timing covers the whole commit.
+                [(functools.partial(timed_query, func), args) for func, args, _ in batch],
+            )
+        except Exception as e:
+            results = [(False, e)] * len(batch)
+        if results is None:
+            results = [(False, RuntimeError("Database unavailable"))] * len(batch)
+
+        for (_, _, future), (ok, value) in zip(batch, results):
+            if future.done():  # The caller was cancelled.
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
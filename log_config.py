@@ -0,0 +1,127 @@
+# log_config.py - Logging setup for the whole bot, log records are written by a background thread.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+
+# Rotating log file, 10 MiB per file and 5 old files kept.
+LOG_FILE_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+
+# INFO and DEBUG records kept per call site and per second, the rest is counted and dropped.
+SAMPLE_LIMIT = 20
+SAMPLE_INTERVAL = 1.0
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log collectors.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets at most `limit` INFO or DEBUG records through per call site (file and line) every `interval`
+    seconds, so a line logged on every solve can't flood the log during a burst. The first record let
+    through after some were dropped says how many. Warnings and errors are never dropped.
+    """
+
+    def __init__(self, limit=SAMPLE_LIMIT, interval=SAMPLE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._sites = {}  # (pathname, lineno) -> [window start, records let through, records dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.limit:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.interval:
+                dropped = site[2] if site is not None else 0
+                self._sites[key] = [now, 1, 0]
+            elif site[1] < self.limit:
+                site[1] += 1
+                dropped = 0
+            else:
+                site[2] += 1
+                return False
+        if dropped:
+            record.suppressed = dropped
+            record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+        return True
+
+
+def setup_logging(level=None, json_format=None, log_file=None, sample_limit=None):
+    """
+    Sends every log record through a queue to a QueueListener thread which does the formatting and the
+    writing (stderr and, if configured, a rotating file), so logging from the event loop or a database
+    thread never waits on I/O. Called once by main.py, cogs only use logging.getLogger / logging.info.
+    Arguments left to None are read from the environment: LOG_LEVEL, LOG_FORMAT (text or json), LOG_FILE
+    and LOG_SAMPLE_LIMIT (0 disables sampling). Returns the listener, it is stopped at exit.
+    """
+    level = level or os.environ.get("LOG_LEVEL", "INFO").upper()
+    if json_format is None:
+        json_format = os.environ.get("LOG_FORMAT", "text").lower() == "json"
+    log_file = log_file or os.environ.get("LOG_FILE")
+    if sample_limit is None:
+        sample_limit = int(os.environ.get("LOG_SAMPLE_LIMIT", SAMPLE_LIMIT))
+
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(
+            logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+            )
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Sampled before the record is queued, a dropped record costs no more than the filter.
+    queue_handler.addFilter(SamplingFilter(sample_limit))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # Suppress Flask development server log
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    logging.getLogger("flask.app").setLevel(logging.ERROR)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,115 @@
+# supervisor.py - Keeps the bot process alive and restarts only the gateway session when it dies.
+
+import asyncio
+import logging
+import random
+import time
+
+import discord
+
+# Backoff between session restarts, in seconds. It goes back to the base once a session has stayed up for STABLE_AFTER.
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+STABLE_AFTER = 600.0
+
+# Errors retrying can't fix.
+FATAL_ERRORS = (discord.LoginFailure, discord.PrivilegedIntentsRequired)
+
+
+def backoff_delay(attempt: int):
+    """
+    Exponential backoff with jitter: half of the delay is fixed, the other half random, so a fleet of
+    restarting bots doesn't reconnect in lockstep.
+    """
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class Supervisor:
+    """
+    Runs the gateway session of an already set up bot and starts a new one whenever it ends with an error,
+    instead of relaunching the whole process. The bot object, the loaded cogs, the database connections,
+    the caches and the scheduler all stay as they are, only the websocket (and the HTTP session if it died)
+    is rebuilt. Short outages are already handled by discord.py's own reconnect, the supervisor covers
+    the errors it gives up on.
+    Restarts, gateway disconnects and the total downtime are counted and logged on every recovery.
+    """
+
+    def __init__(self, bot, token):
+        self.bot = bot
+        self.token = token
+        self.restarts = 0
+        self.disconnects = 0
+        self.downtime = 0.0
+        self.last_error = None
+        self._down_since = None
+        bot.add_listener(self._on_disconnect, "on_disconnect")
+        bot.add_listener(self._on_up, "on_ready")
+        bot.add_listener(self._on_up, "on_resumed")
+
+    async def _on_disconnect(self):
+        self.disconnects += 1
+        if self._down_since is None:
+            self._down_since = time.monotonic()
+
+    async def _on_up(self):
+        if self._down_since is None:
+            return
+        outage = time.monotonic() - self._down_since
+        self._down_since = None
+        self.downtime += outage
+        logging.info(
+            f"Gateway back after {outage:.1f}s (restarts: {self.restarts}, disconnects: {self.disconnects}, "
+            f"total downtime: {self.downtime:.1f}s)."
+        )
+
+    def stats(self):
+        return {
+            "restarts": self.restarts,
+            "disconnects": self.disconnects,
+            "downtime": self.downtime,
+            "last_error": self.last_error,
+        }
+
+    async def run(self):
+        """
+        Logs in and keeps a gateway session running until the bot is closed.
+        """
+        attempt = 0
+        logged_in = False
+        while not self.bot.is_closed():
+            started = time.monotonic()
+            try:
+                if not logged_in:
+                    await self.bot.login(self.token)
+                    logged_in = True
+                await self.bot.connect(reconnect=True)
+                return  # connect only returns once the bot was closed on purpose.
+            except FATAL_ERRORS:
+                raise
+            except Exception as e:
+                self.last_error = repr(e)
+                logging.error(f"Gateway session ended: {e!r}")
+
+            if self._down_since is None:
+                self._down_since = time.monotonic()
+            if time.monotonic() - started > STABLE_AFTER:
+                attempt = 0
+            delay = backoff_delay(attempt)
+            attempt += 1
+            self.restarts += 1
+            logging.info(f"Restarting the gateway session in {delay:.1f}s (restart {self.restarts}).")
+            await asyncio.sleep(delay)
+
+            # Fresh connection state and HTTP session, everything outside discord.py is left alone.
+            # Closing the session also closes the connector it owns, login only builds a new one when it's unset.
+            await self.bot.http.close()
+            self.bot.http.connector = discord.utils.MISSING
+            self.bot.clear()
+            # close() also left a clean_close event on the shard queue of the AutoShardedBot, which clear()
+            # doesn't empty: the next connect() would read it and return at once. The setup hook builds a new
+            # queue, the ready event is kept so whoever waits in wait_until_ready() is still woken up.
+            ready = self.bot._ready
+            await self.bot._async_setup_hook()
+            self.bot._ready = ready
+            logged_in = False
@@ -0,0 +1,159 @@
+import unittest
+import asyncio
+import os
+import sys
+import tempfile
+sys.path.append(os.path.abspath('..'))
+
+from cogs.async_db import AsyncDatabase
+from cogs.metrics import metrics
+
+GUILD_ID = 1234
+
+class TestAsyncDatabase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """
+        Create a fresh database file for every test case.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = AsyncDatabase(os.path.join(self.tmp.name, "bot.db"))
+
+    async def asyncTearDown(self):
+        """
+        Stop the database worker and remove the temporary files.
+        """
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_roundtrip(self):
+        """
+        Test that writes and reads go through the worker thread.
+        """
+        values = (123, "Test description", "Test answer", "", "Test hints", "Test writeup")
+        self.assertTrue(await self.db.insert_challenge(GUILD_ID, values))
+        challenge_data = await self.db.fetch_challenge_data(GUILD_ID)
+        self.assertEqual(challenge_data.description, "Test description")
+
+        self.assertTrue(await self.db.insert_leaderboard(GUILD_ID, 123))
+        self.assertTrue(await self.db.check_leaderboard(GUILD_ID, 123))
+        self.assertEqual(await self.db.len_leaderboard(GUILD_ID), 1)
+
+    async def test_query_metrics(self):
+        """
+        Test that the db_utils functions behind the cache helpers are timed under their own names.
+        """
+        def calls():
+            return {s.name: s.calls for s in metrics.snapshot("query")}
+
+        before = calls()
+        values = (123, "Test description", "Test answer", "", "Test hints", "Test writeup")
+        await self.db.insert_challenge(GUILD_ID, values)
+        self.db._cache(GUILD_ID).loaded = False
+        await self.db.active_challenge(GUILD_ID)
+        after = calls()
+
+        for name in ("insert_challenge", "fetch_challenge_data", "fetch_config", "fetch_solver_ids", "fetch_rating"):
+            self.assertGreater(after.get(name, 0), before.get(name, 0), name)
+        self.assertNotIn("_load_active", after)
+        self.assertNotIn("_write_and_fetch", after)
+
+    async def test_concurrent_calls(self):
+        """
+        Test that many concurrent coroutines are serialized safely on the single connection.
+        """
+        await asyncio.gather(*(self.db.insert_leaderboard(GUILD_ID, user_id) for user_id in range(50)))
+        self.assertEqual(await self.db.len_leaderboard(GUILD_ID), 50)
+
+    async def test_connection_tuning(self):
+        """
+        Test that the shared connections run in WAL mode and readers see committed writes.
+        """
+        self.assertTrue(await self.db.update_config(GUILD_ID, 'channel_id', 42))
+        journal_mode = await self.db.read(lambda con: con.execute("PRAGMA journal_mode").fetchone()[0])
+        self.assertEqual(journal_mode, "wal")
+        config = await self.db.fetch_config(GUILD_ID)
+        self.assertEqual(config.channel_id, 42)
+
+    async def test_active_challenge_write_through(self):
+        """
+        Test that the ActiveChallenge cache follows the writes without being reloaded.
+        """
+        active = await self.db.active_challenge(GUILD_ID)
+        self.assertIsNone(active.challenge)
+
+        values = (123, "Test description", "Test answer", "", "Test hints", "Test writeup")
+        await self.db.insert_challenge(GUILD_ID, values)
+        await self.db.update_config(GUILD_ID, 'leaderboard_channel_id', 7)
+        await self.db.insert_leaderboard(GUILD_ID, 456)
+        await self.db.update_hint(GUILD_ID)
+
+        self.assertIs(await self.db.active_challenge(GUILD_ID), active)
+        self.assertIsNone(active.challenge.answer)
+        self.assertTrue(active.check_flag("Test answer"))
+        self.assertEqual(active.challenge.hints_released, 1)
+        self.assertEqual(active.config.leaderboard_channel_id, 7)
+        self.assertTrue(active.has_solved(456))
+        self.assertEqual(active.solve_count, 1)
+
+        await self.db.remove_challenge_data(GUILD_ID)
+        self.assertIsNone(active.challenge)
+        self.assertEqual(active.solve_count, 0)
+
+    async def test_config_versioning(self):
+        """
+        Test that config writes swap in a new BotConfig with a bumped version.
+        """
+        self.assertIsNone(await self.db.config(GUILD_ID))
+        await self.db.update_config(GUILD_ID, 'channel_id', 1)
+        first = await self.db.config(GUILD_ID)
+        await self.db.update_config(GUILD_ID, 'ctf_creators', 2)
+        second = await self.db.config(GUILD_ID)
+        self.assertEqual((first.channel_id, first.ctf_creators), (1, None))
+        self.assertEqual((second.channel_id, second.ctf_creators), (1, 2))
+        self.assertGreater(second.version, first.version)
+
+    async def test_group_commit(self):
+        """
+        Test that batched solves get distinct ranks and a duplicate in the same batch fails alone.
+        """
+        ranks = await asyncio.gather(*(self.db.register_solve(GUILD_ID, user_id) for user_id in [1, 2, 3, 2]))
+        self.assertEqual(ranks, [1, 2, 3, None])
+        self.assertEqual(await self.db.len_leaderboard(GUILD_ID), 3)
+        self.assertTrue(await self.db.insert_rating(GUILD_ID, 1, 5))
+        self.assertFalse(await self.db.insert_rating(GUILD_ID, 1, 4))
+
+    async def test_rating_aggregate(self):
+        """
+        Test that the cached rating set and running average follow the inserts and survive a reload.
+        """
+        await self.db.insert_challenge(GUILD_ID, (123, "Test description", "Test answer", "", "Test hints", ""))
+        active = await self.db.active_challenge(GUILD_ID)
+        await asyncio.gather(self.db.insert_rating(GUILD_ID, 1, 5), self.db.insert_rating(GUILD_ID, 2, 2), self.db.insert_rating(GUILD_ID, 1, 1))
+        self.assertTrue(active.has_rated(1))
+        self.assertFalse(active.has_rated(3))
+        self.assertEqual(active.average_rating, 3.5)
+
+        active.loaded = False
+        reloaded = await self.db.active_challenge(GUILD_ID)
+        self.assertEqual((reloaded.rating_count, reloaded.average_rating), (2, 3.5))
+
+    async def test_standings(self):
+        """
+        Test that loaded standings follow new solves and match user_stats after a reload.
+        """
+        await self.db.insert_challenge(GUILD_ID, (123, "Test description", "Test answer", "", "Test hints", ""))
+        await self.db.register_solve(GUILD_ID, 1)
+        standings = await self.db.standings(GUILD_ID, 0)
+        self.assertIs(await self.db.standings(GUILD_ID, 0), standings)
+
+        await self.db.update_config(GUILD_ID, 'season', 2)
+        await asyncio.gather(*(self.db.register_solve(GUILD_ID, user_id) for user_id in [2, 3]))
+        self.assertEqual([(user_id, stats.points) for user_id, stats in standings.top()], [(1, 150), (2, 130), (3, 120)])
+
+        season = await self.db.standings(GUILD_ID, 2)
+        self.assertEqual([user_id for user_id, _ in season.top()], [2, 3])
+        rows = await self.db.fetch_user_stats(GUILD_ID, 0)
+        self.assertEqual([(row[0], row[3]) for row in rows], [(1, 150), (2, 130), (3, 120)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import sys
+import tempfile
+sys.path.append(os.path.abspath('..'))
+
+from cogs.attachments import AttachmentStore, AttachmentTooLarge, attachment_name
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+class TestAttachmentStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """
+        Create an empty store in a temporary directory for every test case.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = AttachmentStore(self.tmp.name, max_file_bytes=100, max_store_bytes=250)
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        self.tmp.cleanup()
+
+    def files(self):
+        return sorted(
+            name for _, _, names in os.walk(self.tmp.name) for name in names
+        )
+
+    async def test_store(self):
+        """
+        Test that chunks are stored under the SHA-256 of their content.
+        """
+        stored = await self.store.store(chunks(b"hello ", b"world"), "hello.txt")
+        self.assertEqual(stored.sha256, "b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9")
+        self.assertEqual(stored.size, 11)
+        with open(stored.path, "rb") as f:
+            self.assertEqual(f.read(), b"hello world")
+        self.assertEqual(stored.path, self.store.path(stored.sha256))
+
+    async def test_dedup(self):
+        """
+        Test that the same content stored twice is kept once.
+        """
+        first = await self.store.store(chunks(b"same"), "a.txt")
+        second = await self.store.store(chunks(b"sa", b"me"), "b.txt")
+        self.assertEqual(first.path, second.path)
+        self.assertEqual(self.files(), [first.sha256])
+
+    async def test_too_large(self):
+        """
+        Test that a file over max_file_bytes is rejected and leaves nothing behind.
+        """
+        with self.assertRaises(AttachmentTooLarge):
+            await self.store.store(chunks(b"x" * 60, b"x" * 60), "big.bin")
+        self.assertEqual(self.files(), [])
+
+    async def test_evict(self):
+        """
+        Test that the least recently used files are evicted first, except the kept ones.
+        """
+        a = await self.store.store(chunks(b"a" * 100), "a")
+        b = await self.store.store(chunks(b"b" * 100), "b")
+        os.utime(a.path, (1, 1))
+        os.utime(b.path, (2, 2))
+        c = await self.store.store(chunks(b"c" * 100), "c", keep=[a.sha256])
+        self.assertEqual(self.files(), sorted([a.sha256, c.sha256]))
+        self.assertFalse(os.path.exists(b.path))
+
+    def test_attachment_name(self):
+        """
+        Test that file names come from the server or the URL and are made safe.
+        """
+        self.assertEqual(attachment_name("https://example.com/files/chall%201.zip?x=1"), "chall_1.zip")
+        self.assertEqual(attachment_name("https://example.com/dl", "../../etc/passwd"), "etc_passwd")
+        self.assertEqual(attachment_name("https://example.com/"), "attachment")
+
+if __name__ == '__main__':
+    unittest.main()
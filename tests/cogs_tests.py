@@ -0,0 +1,23 @@
+import unittest
+import importlib
+import os
+import sys
+sys.path.append(os.path.abspath('..'))
+
+import main
+
+class TestCogs(unittest.IsolatedAsyncioTestCase):
+    async def test_load_cogs(self):
+        """
+        Test that every extension of main.COGS imports and sets up, load_cogs only logs a failing one.
+        """
+        async with main.create_bot() as bot:
+            for name in main.COGS:
+                with self.subTest(cog=name):
+                    importlib.import_module(name)
+                    await bot.load_extension(name)
+            commands = {command.name for command in bot.tree.get_commands()}
+        self.assertTrue({"setchallenge", "shutdown", "ratelimit", "newseason", "stats", "submit"} <= commands)
+
+if __name__ == '__main__':
+    unittest.main()
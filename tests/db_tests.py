@@ -5,6 +5,9 @@ import os
 sys.path.append(os.path.abspath('..'))
 
 from cogs.db_utils import *
+from cogs.flags import FlagVerifier
+
+GUILD_ID = 1234
 
 class TestDatabaseFunctions(unittest.TestCase):
     def setUp(self):
@@ -25,33 +28,34 @@ class TestDatabaseFunctions(unittest.TestCase):
         Test the fetch_challenge_data function.
         """
         # Test fetching challenge data when no data is present
-        self.assertIsNone(fetch_challenge_data(self.con), "Expected None when no challenge data is present.")
+        self.assertIsNone(fetch_challenge_data(self.con, GUILD_ID), "Expected None when no challenge data is present.")
 
         # Insert test data
-        test_data = (1, 123, "Test description", "Test answer", "", "Test hints", "Test writeup", 0, "2024-04-25 12:00:00")
+        test_data = (GUILD_ID, 1, 123, "Test description", "Test answer", "", "Test hints", "Test writeup", 0, "2024-04-25 12:00:00", None, None, None, None)
         cur = self.con.cursor()
-        cur.execute("INSERT INTO challenge_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", test_data)
+        cur.execute("INSERT INTO challenge_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", test_data)
         self.con.commit()
 
         # Test fetching challenge data when data is present
-        fetched_data = fetch_challenge_data(self.con)
+        fetched_data = fetch_challenge_data(self.con, GUILD_ID)
         self.assertIsNotNone(fetched_data, "Expected challenge data when inserted.")
-        self.assertEqual(fetched_data['description'], "Test description")
+        self.assertEqual(fetched_data.description, "Test description")
+        self.assertEqual((fetched_data.guild_id, fetched_data.day), (GUILD_ID, 1))
 
     def test_fetch_leaderboard_data(self):
         """
         Test the fetch_leaderboard_data function.
         """
         # Test fetching leaderboard data when no data is present
-        self.assertEqual(fetch_leaderboard_data(self.con), [], "Expected empty list when no leaderboard data is present.")
+        self.assertEqual(fetch_leaderboard_data(self.con, GUILD_ID), [], "Expected empty list when no leaderboard data is present.")
 
         # Insert test data
         cur = self.con.cursor()
-        cur.execute("INSERT INTO leaderboard (user_id, submission) VALUES (?, ?)", (123, "2024-04-25 12:00:00"))
+        cur.execute("INSERT INTO leaderboard (guild_id, user_id, submission) VALUES (?, ?, ?)", (GUILD_ID, 123, "2024-04-25 12:00:00"))
         self.con.commit()
 
         # Test fetching leaderboard data when data is present
-        fetched_data = fetch_leaderboard_data(self.con)
+        fetched_data = fetch_leaderboard_data(self.con, GUILD_ID)
         self.assertIsNotNone(fetched_data, "Expected leaderboard data when inserted.")
         self.assertEqual(len(fetched_data), 1)
 
@@ -60,15 +64,15 @@ class TestDatabaseFunctions(unittest.TestCase):
         Test the fetch_rating function.
         """
         # Test fetching ratings data when no data is present
-        self.assertEqual(fetch_rating(self.con), [], "Expected empty list when no ratings data is present.")
+        self.assertEqual(fetch_rating(self.con, GUILD_ID), [], "Expected empty list when no ratings data is present.")
 
         # Insert test data
         cur = self.con.cursor()
-        cur.execute("INSERT INTO ratings (user_id, rating) VALUES (?, ?)", (123, 5))
+        cur.execute("INSERT INTO ratings (guild_id, user_id, rating) VALUES (?, ?, ?)", (GUILD_ID, 123, 5))
         self.con.commit()
 
         # Test fetching ratings data when data is present
-        fetched_data = fetch_rating(self.con)
+        fetched_data = fetch_rating(self.con, GUILD_ID)
         self.assertIsNotNone(fetched_data, "Expected ratings data when inserted.")
         self.assertEqual(len(fetched_data), 1)
 
@@ -77,14 +81,14 @@ class TestDatabaseFunctions(unittest.TestCase):
         Test the remove_challenge_data function.
         """
         # Insert test data
-        test_data = (1, 123, "Test description", "Test answer", "", "Test hints", "Test writeup", 0, "2024-04-25 12:00:00")
+        test_data = (GUILD_ID, 1, 123, "Test description", "Test answer", "", "Test hints", "Test writeup", 0, "2024-04-25 12:00:00", None, None, None, None)
         cur = self.con.cursor()
-        cur.execute("INSERT INTO challenge_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", test_data)
+        cur.execute("INSERT INTO challenge_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", test_data)
         self.con.commit()
 
         # Test removing challenge data
-        remove_challenge_data(self.con)
-        fetched_data = fetch_challenge_data(self.con)
+        remove_challenge_data(self.con, GUILD_ID)
+        fetched_data = fetch_challenge_data(self.con, GUILD_ID)
         self.assertIsNone(fetched_data, "Expected None after challenge data is removed.")
 
     def test_insert_challenge(self):
@@ -93,13 +97,101 @@ class TestDatabaseFunctions(unittest.TestCase):
         """
         # Test inserting challenge data
         values = (123, "Test description", "Test answer", "", "Test hints", "Test writeup")
-        result = insert_challenge(self.con, values)
+        result = insert_challenge(self.con, GUILD_ID, values)
         self.assertTrue(result, "Expected True when challenge data is inserted.")
 
         # Add assertions for inserted data
-        fetched_data = fetch_challenge_data(self.con)
+        fetched_data = fetch_challenge_data(self.con, GUILD_ID)
         self.assertIsNotNone(fetched_data, "Expected challenge data when inserted.")
-        self.assertEqual(fetched_data['description'], "Test description")
+        self.assertEqual(fetched_data.description, "Test description")
+        self.assertNotIn("Test answer", fetched_data.flags, "Expected the flags to be stored hashed.")
+        self.assertIsNone(fetched_data.answer, "Expected no plain answer without a reveal: line.")
+
+        insert_challenge(self.con, GUILD_ID, (123, "d", "flag{x}\nreveal: flag{x}", "", "h", ""))
+        self.assertEqual(fetch_challenge_data(self.con, GUILD_ID).answer, "flag{x}")
+        self.assertEqual(self.con.execute("SELECT answer FROM challenge_history").fetchall(), [(None,)])
+
+    def test_drop_plain_answers(self):
+        """
+        Test that answers stored in plain text by older versions are hashed and cut down to their reveal text once.
+        """
+        insert_challenge(self.con, GUILD_ID, (123, "d", "flag{old}", "", "h", ""))
+        self.con.execute("UPDATE challenge_data SET answer = 'flag{old}', flags = NULL")
+        self.con.execute("INSERT INTO challenge_history (guild_id, day, answer) VALUES (?, 0, 'flag{a}\nreveal: A')", (GUILD_ID,))
+        self.con.execute("DELETE FROM meta")
+        self.con.commit()
+
+        create_tables(self.con)
+        fetched_data = fetch_challenge_data(self.con, GUILD_ID)
+        self.assertIsNone(fetched_data.answer)
+        self.assertTrue(FlagVerifier.from_challenge(fetched_data).verify("flag{old}"))
+        self.assertEqual(self.con.execute("SELECT answer FROM challenge_history").fetchall(), [("A",)])
+
+    def test_rotation_archives_history(self):
+        """
+        Test that rotating and removing challenges moves them to the history tables with their solves and ratings.
+        """
+        values = (123, "Test description", "Test answer", "", "Test hints", "Test writeup")
+        insert_challenge(self.con, GUILD_ID, values)
+        register_solve(self.con, GUILD_ID, 7)
+        register_solve(self.con, GUILD_ID, 8)
+        insert_rating(self.con, GUILD_ID, 7, 5)
+        insert_challenge(self.con, GUILD_ID, values)
+        register_solve(self.con, GUILD_ID, 8)
+        remove_challenge_data(self.con, GUILD_ID)
+
+        day_one = fetch_challenge_history(self.con, GUILD_ID, 1)
+        self.assertEqual(day_one['description'], "Test description")
+        self.assertEqual([(user_id, rank) for user_id, rank, _ in day_one['solves']], [(7, 1), (8, 2)])
+        self.assertEqual([(day, rank) for day, rank, _ in fetch_user_history(self.con, GUILD_ID, 8)], [(1, 2), (2, 1)])
+        self.assertEqual(self.con.execute("SELECT day, user_id, rating FROM rating_history").fetchall(), [(1, 7, 5)])
+
+        self.assertIsNone(fetch_challenge_data(self.con, GUILD_ID))
+        self.assertEqual(len_leaderboard(self.con, GUILD_ID), 0)
+        self.assertIsNone(fetch_challenge_history(self.con, 99, 1))
+
+    def test_user_stats(self):
+        """
+        Test that solves update the all-time and season totals and that old history is backfilled once.
+        """
+        values = (123, "Test description", "Test answer", "", "Test hints", "Test writeup")
+        insert_challenge(self.con, GUILD_ID, values)
+        register_solve(self.con, GUILD_ID, 7)
+        register_solve(self.con, GUILD_ID, 8)
+        insert_challenge(self.con, GUILD_ID, values)
+        update_config(self.con, GUILD_ID, 'season', 2)
+        register_solve(self.con, GUILD_ID, 8)
+
+        all_time = {row[0]: row[1:4] for row in fetch_user_stats(self.con, GUILD_ID, 0)}
+        self.assertEqual(all_time, {7: (1, 1, 150), 8: (2, 1, 280)})
+        self.assertEqual([row[0] for row in fetch_user_stats(self.con, GUILD_ID, 1)], [7, 8])
+        self.assertEqual([row[:4] for row in fetch_user_stats(self.con, GUILD_ID, 2)], [(8, 1, 1, 150)])
+
+        remove_challenge_data(self.con, GUILD_ID)
+        self.con.execute("DROP TABLE user_stats")
+        create_tables(self.con)
+        backfilled = {row[0]: row[1:4] for row in fetch_user_stats(self.con, GUILD_ID, 0)}
+        self.assertEqual(backfilled, all_time)
+
+    def test_meta(self):
+        """
+        Test the fetch_meta and update_meta functions.
+        """
+        self.assertIsNone(fetch_meta(self.con, "command_tree:global"))
+        self.assertTrue(update_meta(self.con, "command_tree:global", "abc"))
+        self.assertTrue(update_meta(self.con, "command_tree:global", "def"))
+        self.assertEqual(fetch_meta(self.con, "command_tree:global"), "def")
+
+    def test_update_rate_limit(self):
+        """
+        Test the update_rate_limit function.
+        """
+        self.assertFalse(update_rate_limit(self.con, GUILD_ID, 2.5, 3), "Expected False without an active challenge.")
+        insert_challenge(self.con, GUILD_ID, (123, "Test description", "Test answer", "", "Test hints", ""))
+        self.assertIsNone(fetch_challenge_data(self.con, GUILD_ID).submit_rate)
+        self.assertTrue(update_rate_limit(self.con, GUILD_ID, 2.5, 3))
+        fetched_data = fetch_challenge_data(self.con, GUILD_ID)
+        self.assertEqual((fetched_data.submit_rate, fetched_data.submit_burst), (2.5, 3))
 
     def test_insert_leaderboard(self):
         """
@@ -107,14 +199,120 @@ class TestDatabaseFunctions(unittest.TestCase):
         """
         # Test inserting leaderboard data
         user_id = 123
-        result = insert_leaderboard(self.con, user_id)
+        result = insert_leaderboard(self.con, GUILD_ID, user_id)
         self.assertTrue(result, "Expected True when leaderboard data is inserted.")
 
         # Add assertions for inserted data
-        fetched_data = fetch_leaderboard_data(self.con)
+        fetched_data = fetch_leaderboard_data(self.con, GUILD_ID)
         self.assertIsNotNone(fetched_data, "Expected leaderboard data when inserted.")
         self.assertEqual(len(fetched_data), 1)
 
+    def test_register_solve(self):
+        """
+        Test that register_solve returns the rank and rejects duplicates.
+        """
+        self.assertEqual(register_solve(self.con, GUILD_ID, 123), 1)
+        self.assertEqual(register_solve(self.con, GUILD_ID, 456), 2)
+        self.assertIsNone(register_solve(self.con, GUILD_ID, 123), "Expected None for a duplicate solve.")
+        self.assertFalse(insert_leaderboard(self.con, GUILD_ID, 456), "Expected False for a duplicate insert.")
+        self.assertEqual(len_leaderboard(self.con, GUILD_ID), 2)
+
+    def test_leaderboard_duplicates_removed(self):
+        """
+        Test that create_tables removes duplicate solves from older databases before indexing.
+        """
+        con = sqlite3.connect(":memory:")
+        con.execute("CREATE TABLE leaderboard (user_id INTEGER, submission TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        con.executemany("INSERT INTO leaderboard (user_id) VALUES (?)", [(1,), (2,), (1,)])
+        create_tables(con)
+        self.assertEqual(sorted(fetch_solver_ids(con, 0)), [1, 2])
+        con.close()
+
+    def test_guilds_are_isolated(self):
+        """
+        Test that challenges, solves and day numbers are kept per guild.
+        """
+        values = (123, "Test description", "Test answer", "", "Test hints", "Test writeup")
+        insert_challenge(self.con, GUILD_ID, values)
+        insert_challenge(self.con, GUILD_ID, values)
+        insert_challenge(self.con, 99, values)
+        self.assertEqual(fetch_challenge_data(self.con, GUILD_ID).day, 2)
+        self.assertEqual(fetch_challenge_data(self.con, 99).day, 1)
+        self.assertEqual(generate_title(self.con, GUILD_ID), "Set a Challenge for Day 3")
+
+        self.assertEqual(register_solve(self.con, GUILD_ID, 123), 1)
+        self.assertEqual(register_solve(self.con, 99, 123), 1)
+        remove_challenge_data(self.con, 99)
+        self.assertIsNone(fetch_challenge_data(self.con, 99))
+        self.assertEqual(fetch_solver_ids(self.con, GUILD_ID), [123])
+
+    def test_check_schema(self):
+        """
+        Test that a table missing a column of its row model is reported when the database is opened.
+        """
+        self.assertTrue(check_schema(self.con))
+        con = sqlite3.connect(":memory:")
+        con.execute("CREATE TABLE config (id INTEGER PRIMARY KEY, channel_id INTEGER)")
+        con.execute("CREATE TABLE challenge_data (guild_id INTEGER PRIMARY KEY, day INTEGER)")
+        with self.assertLogs(level="ERROR") as logs:
+            self.assertFalse(check_schema(con))
+        self.assertIn("ctf_creators", logs.output[0])
+        self.assertIn("attachment_hash", logs.output[1])
+        con.close()
+
+    def test_single_server_migration(self):
+        """
+        Test that a database from the single server schema is migrated under guild 0 and can be adopted.
+        """
+        con = sqlite3.connect(":memory:")
+        con.executescript("""
+            CREATE TABLE config (id INTEGER PRIMARY KEY, channel_id INTEGER, ctf_creators INTEGER, leaderboard_channel_id INTEGER);
+            CREATE TABLE challenge_data (day INTEGER PRIMARY KEY AUTOINCREMENT, master_id INTEGER, description TEXT, answer TEXT,
+                attachment TEXT, hints TEXT, writeup TEXT, hints_released INTEGER DEFAULT 0, start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE leaderboard (user_id INTEGER, submission TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE ratings (user_id INTEGER PRIMARY KEY, rating INTEGER);
+            INSERT INTO config VALUES (0, 1, 2, 3);
+            INSERT INTO challenge_data (day, master_id, description, answer, attachment, hints, writeup) VALUES (7, 123, 'd', 'a', '', 'h', '');
+            INSERT INTO leaderboard (user_id) VALUES (5);
+            INSERT INTO ratings VALUES (5, 4);
+        """)
+        create_tables(con)
+        self.assertEqual(fetch_challenge_data(con, 0).day, 7)
+        self.assertEqual(generate_title(con, 0), "Set a Challenge for Day 8")
+
+        self.assertTrue(adopt_legacy_guild(con, GUILD_ID))
+        self.assertEqual(fetch_config(con, GUILD_ID).leaderboard_channel_id, 3)
+        self.assertEqual(fetch_solver_ids(con, GUILD_ID), [5])
+        self.assertEqual(fetch_rating(con, GUILD_ID), [(5, 4)])
+        self.assertFalse(adopt_legacy_guild(con, GUILD_ID))
+        con.close()
+
+    def test_run_batch_after_failed_write(self):
+        """
+        Test that a batch still commits after a failed single statement write left its transaction open.
+        """
+        self.assertTrue(insert_leaderboard(self.con, GUILD_ID, 1))
+        with self.assertLogs(level="ERROR"):
+            self.assertFalse(insert_leaderboard(self.con, GUILD_ID, 1))
+        self.assertTrue(self.con.in_transaction)
+        with self.assertLogs(level="WARNING"):
+            results = run_batch(self.con, [(add_rating, (GUILD_ID, 2, 5))])
+        self.assertEqual(results, [(True, True)])
+        self.assertEqual(fetch_rating(self.con, GUILD_ID), [(2, 5)])
+
+    def test_run_batch(self):
+        """
+        Test that run_batch commits every operation and isolates the failing one.
+        """
+        results = run_batch(self.con, [(add_solve, (GUILD_ID, 1)), (add_solve, (GUILD_ID, 1)), (add_rating, (GUILD_ID, 1, 5))])
+        self.assertEqual(results[0], (True, 1))
+        self.assertFalse(results[1][0])
+        self.assertIsInstance(results[1][1], sqlite3.IntegrityError)
+        self.assertEqual(results[2], (True, True))
+        self.assertFalse(self.con.in_transaction)
+        self.assertEqual(len(fetch_leaderboard_data(self.con, GUILD_ID)), 1)
+        self.assertEqual(len(fetch_rating(self.con, GUILD_ID)), 1)
+
     def test_insert_rating(self):
         """
         Test the insert_rating function.
@@ -122,11 +320,11 @@ class TestDatabaseFunctions(unittest.TestCase):
         # Test inserting ratings data
         user_id = 123
         rating = 5
-        result = insert_rating(self.con, user_id, rating)
+        result = insert_rating(self.con, GUILD_ID, user_id, rating)
         self.assertTrue(result, "Expected True when ratings data is inserted.")
 
         # Add assertions for inserted data
-        fetched_data = fetch_rating(self.con)
+        fetched_data = fetch_rating(self.con, GUILD_ID)
         self.assertIsNotNone(fetched_data, "Expected ratings data when inserted.")
         self.assertEqual(len(fetched_data), 1)
 
@@ -137,21 +335,51 @@ class TestDatabaseFunctions(unittest.TestCase):
         # Test updating config
         key = 'channel_id'
         value = 12345
-        result = update_config(self.con, key, value)
+        result = update_config(self.con, GUILD_ID, key, value)
         self.assertTrue(result, "Expected True when config is updated.")
 
         # Add assertions for updated config
         cur = self.con.cursor()
-        cur.execute("SELECT channel_id FROM config WHERE id = 0")
+        cur.execute("SELECT channel_id FROM config WHERE id = ?", (GUILD_ID,))
         fetched_data = cur.fetchone()
         self.assertIsNotNone(fetched_data, "Expected config data when updated.")
         self.assertEqual(fetched_data[0], value)
 
+    def test_update_hint(self):
+        """
+        Test the update_hint function.
+        """
+        values = (123, "Test description", "Test answer", "", "Test hints", "Test writeup")
+        insert_challenge(self.con, GUILD_ID, values)
+        self.assertTrue(update_hint(self.con, GUILD_ID), "Expected True when hints_released is updated.")
+        self.assertEqual(fetch_challenge_data(self.con, GUILD_ID).hints_released, 1)
+
+    def test_fetch_solver_ids(self):
+        """
+        Test the fetch_solver_ids function.
+        """
+        self.assertEqual(fetch_solver_ids(self.con, GUILD_ID), [])
+        insert_leaderboard(self.con, GUILD_ID, 123)
+        insert_leaderboard(self.con, GUILD_ID, 456)
+        self.assertEqual(sorted(fetch_solver_ids(self.con, GUILD_ID)), [123, 456])
+
+    def test_update_config_upsert(self):
+        """
+        Test that updating one key keeps the others and fetch_config returns them.
+        """
+        update_config(self.con, GUILD_ID, 'channel_id', 1)
+        update_config(self.con, GUILD_ID, 'leaderboard_channel_id', 2)
+        update_config(self.con, GUILD_ID, 'channel_id', 3)
+        config = fetch_config(self.con, GUILD_ID)
+        self.assertEqual(config.channel_id, 3)
+        self.assertEqual(config.leaderboard_channel_id, 2)
+        self.assertIsNone(config.ctf_creators)
+
     def test_fetch_challenge_data_not_exist(self):
         """
         Test fetching challenge data when no data exists.
         """
-        fetched_data = fetch_challenge_data(self.con)
+        fetched_data = fetch_challenge_data(self.con, GUILD_ID)
         self.assertIsNone(fetched_data, "Expected None when no challenge data exists.")
 
     def test_update_config_invalid_key(self):
@@ -161,7 +389,7 @@ class TestDatabaseFunctions(unittest.TestCase):
         # Test updating config with an invalid key
         key = 'invalid_key'
         value = 12345
-        result = update_config(self.con, key, value)
+        result = update_config(self.con, GUILD_ID, key, value)
         self.assertFalse(result, "Expected False when updating config with an invalid key.")
 
 if __name__ == '__main__':
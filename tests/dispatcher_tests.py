@@ -0,0 +1,98 @@
+import unittest
+import asyncio
+import sys
+import time
+import os
+sys.path.append(os.path.abspath('..'))
+
+from cogs import dispatcher as dispatcher_module
+from cogs.dispatcher import Dispatcher
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+class FakeChannel:
+    def __init__(self, id, failures=()):
+        self.id = id
+        self.failures = list(failures)
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append((content, kwargs))
+        return len(self.sent)
+
+class TestDispatcher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.backoff = dispatcher_module.BACKOFF_BASE
+        self.rate = dispatcher_module.ROUTE_RATE
+        dispatcher_module.BACKOFF_BASE = 0.001
+        dispatcher_module.ROUTE_RATE = 50
+        self.dispatcher = Dispatcher()
+
+    def tearDown(self):
+        dispatcher_module.BACKOFF_BASE = self.backoff
+        dispatcher_module.ROUTE_RATE = self.rate
+
+    async def test_fifo_per_route(self):
+        """
+        Test that messages of a route are sent in order and routes are dropped once idle.
+        """
+        channel = FakeChannel(1)
+        futures = [self.dispatcher.send(channel, str(i)) for i in range(3)]
+        self.assertEqual(self.dispatcher.depth, 3)
+        self.assertEqual(await asyncio.gather(*futures), [1, 2, 3])
+        self.assertEqual([content for content, _ in channel.sent], ["0", "1", "2"])
+        await self.dispatcher.drain()
+        self.assertEqual(self.dispatcher.depths(), {})
+
+    async def test_bursts_on_idle_route(self):
+        """
+        Test that bursts sent one after the other to a route that went idle are still paced by its bucket,
+        and that the route is only dropped once the bucket has refilled.
+        """
+        channel = FakeChannel(1)
+        burst = dispatcher_module.ROUTE_BURST
+        start = time.monotonic()
+        for _ in range(4):
+            await asyncio.gather(*(self.dispatcher.send(channel, "hello") for _ in range(burst)))
+        elapsed = time.monotonic() - start
+        self.assertEqual(len(channel.sent), 4 * burst)
+        # Only the first burst is free, the other messages wait for a token each.
+        self.assertGreaterEqual(elapsed, 3 * burst / dispatcher_module.ROUTE_RATE * 0.9)
+
+        await asyncio.sleep(burst / dispatcher_module.ROUTE_RATE * 1.1)
+        await self.dispatcher.send(FakeChannel(2), "hello")
+        self.assertEqual(list(self.dispatcher._routes), [("FakeChannel", 2)])
+
+    async def test_merge(self):
+        """
+        Test that queued plain text announcements are merged, but not across an embed.
+        """
+        channel = FakeChannel(1)
+        self.dispatcher.send(channel, "first")
+        self.dispatcher.send(channel, "a", merge=True)
+        self.dispatcher.send(channel, "b", merge=True)
+        self.dispatcher.send(channel, embed="embed")
+        last = self.dispatcher.send(channel, "c", merge=True)
+        await last
+        self.assertEqual(channel.sent, [("first", {}), ("a\nb", {}), (None, {"embed": "embed"}), ("c", {})])
+        self.assertEqual(self.dispatcher.merged, 1)
+
+    async def test_retry_on_rate_limit(self):
+        """
+        Test that 429 and 5xx errors are retried and other errors fail without raising.
+        """
+        channel = FakeChannel(1, failures=[HTTPError(429), HTTPError(503)])
+        self.assertEqual(await self.dispatcher.send(channel, "hello"), 1)
+        self.assertEqual(self.dispatcher.retried, 2)
+
+        forbidden = FakeChannel(2, failures=[HTTPError(403)])
+        self.assertIsNone(await self.dispatcher.send(forbidden, "hello"))
+        self.assertEqual(self.dispatcher.failed, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import asyncio
+import sys
+import os
+sys.path.append(os.path.abspath('..'))
+
+from cogs.fanout import FanoutQueue
+
+class TestFanoutQueue(unittest.IsolatedAsyncioTestCase):
+    async def test_bounded_concurrency(self):
+        """
+        Test that no more than `workers` jobs run at the same time and every job runs.
+        """
+        queue = FanoutQueue(workers=3)
+        running = []
+        peak = []
+        done = []
+
+        async def job(i):
+            running.append(i)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(i)
+            done.append(i)
+
+        for i in range(10):
+            self.assertTrue(queue.submit(job, i))
+        await queue.drain()
+        self.assertEqual(sorted(done), list(range(10)))
+        self.assertEqual(max(peak), 3)
+
+    async def test_error_isolation(self):
+        """
+        Test that a failing job is counted and doesn't stop the others.
+        """
+        queue = FanoutQueue(workers=1)
+        done = []
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def ok():
+            done.append(True)
+
+        queue.submit(fail)
+        queue.submit(ok)
+        await queue.drain()
+        self.assertEqual(done, [True])
+        self.assertEqual((queue.completed, queue.failed), (1, 1))
+
+    async def test_full_queue_drops(self):
+        """
+        Test that jobs are dropped instead of blocking once the queue is full.
+        """
+        queue = FanoutQueue(workers=1, maxsize=2)
+        results = [queue.submit(asyncio.sleep, 0) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(queue.dropped, 1)
+        await queue.drain()
+
+if __name__ == '__main__':
+    unittest.main()
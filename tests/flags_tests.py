@@ -0,0 +1,76 @@
+import unittest
+import json
+import sys
+import os
+sys.path.append(os.path.abspath('..'))
+
+from cogs.flags import FlagVerifier, hash_flags, parse_flags, reveal_text
+from cogs.challenge_cache import ActiveChallenge
+from cogs.models import Challenge
+
+class TestFlags(unittest.TestCase):
+    def test_parse_flags(self):
+        """
+        Test that every line is one flag and the option prefixes are split off.
+        """
+        specs = parse_flags("flag{a}\n\n nocase:nowrap:flag{B} \nre:flag\\{\\d+\\}:x")
+        self.assertEqual(specs, [
+            (frozenset(), "flag{a}"),
+            (frozenset({"nocase", "nowrap"}), "flag{B}"),
+            (frozenset({"re"}), "flag\\{\\d+\\}:x"),
+        ])
+        self.assertEqual(parse_flags("flag{a}\nreveal: flag{a} (or anything wrapped)"), [(frozenset(), "flag{a}")])
+        self.assertEqual(reveal_text("flag{a}\nreveal: flag{a} (or anything wrapped)"), "flag{a} (or anything wrapped)")
+        self.assertIsNone(reveal_text("flag{a}"))
+
+    def test_flags_are_hashed(self):
+        """
+        Test that the stored flags don't contain the plain answer and are salted.
+        """
+        stored = hash_flags("flag{secret}")
+        self.assertNotIn("secret", stored)
+        self.assertNotEqual(json.loads(stored)["flags"], json.loads(hash_flags("flag{secret}"))["flags"])
+
+    def test_verify(self):
+        """
+        Test exact, normalized, multiple and regex flags.
+        """
+        verifier = FlagVerifier(hash_flags("flag{Exact}\nnocase:nowrap:flag{Loose}\nre:flag\\{[0-9]{4}\\}"))
+        self.assertTrue(verifier.verify("flag{Exact}"))
+        self.assertTrue(verifier.verify(" flag{Exact} "))
+        self.assertFalse(verifier.verify("flag{exact}"))
+        self.assertTrue(verifier.verify("FLAG{loose}"))
+        self.assertTrue(verifier.verify("LOOSE"))
+        self.assertTrue(verifier.verify("flag{1234}"))
+        self.assertFalse(verifier.verify("flag{12345}"))
+        self.assertFalse(verifier.verify(""))
+        # nowrap only strips a wrapper with a prefix.
+        self.assertFalse(verifier.verify("{Loose}"))
+
+    def test_no_flags(self):
+        """
+        Test that an answer with only a reveal line gives a verifier without accepted flags.
+        """
+        self.assertFalse(FlagVerifier(hash_flags("reveal: x")))
+        self.assertTrue(FlagVerifier(hash_flags("flag{a}\nreveal: x")))
+
+    def test_cached_verifier(self):
+        """
+        Test that the cache compiles one verifier per challenge.
+        """
+        active = ActiveChallenge()
+        active.load(Challenge(day=1, flags=hash_flags("flag{old}")), None, [], [])
+        verifier = active.verifier
+        self.assertIs(active.verifier, verifier)
+        self.assertTrue(active.check_flag("flag{old}"))
+
+        active.set_challenge(Challenge(day=2, answer="flag{new}", flags=hash_flags("flag{new}")))
+        self.assertFalse(active.check_flag("flag{old}"))
+        self.assertTrue(active.check_flag("flag{new}"))
+
+        active.set_challenge(Challenge(day=3, answer="", flags=hash_flags("")))
+        self.assertIsNone(active.verifier)
+        self.assertFalse(active.check_flag(""))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import atexit
+import json
+import logging
+import logging.handlers
+import sys
+import os
+sys.path.append(os.path.abspath('..'))
+
+from log_config import SamplingFilter, JsonFormatter, setup_logging
+
+def make_record(level=logging.INFO, msg="Inserted into table leaderboard successfully.", lineno=10):
+    return logging.LogRecord("test", level, "cogs/db_utils.py", lineno, msg, None, None)
+
+class TestSamplingFilter(unittest.TestCase):
+    def test_limit_per_call_site(self):
+        """
+        Test that only `limit` records of a call site pass per interval, and that other call sites are counted apart.
+        """
+        sampler = SamplingFilter(limit=3, interval=60)
+        passed = [sampler.filter(make_record()) for _ in range(10)]
+        self.assertEqual(passed, [True] * 3 + [False] * 7)
+        self.assertTrue(sampler.filter(make_record(lineno=11)))
+
+    def test_warnings_never_dropped(self):
+        """
+        Test that warnings and errors pass even when the call site is over its limit.
+        """
+        sampler = SamplingFilter(limit=1, interval=60)
+        self.assertTrue(sampler.filter(make_record(logging.ERROR)))
+        for _ in range(5):
+            self.assertTrue(sampler.filter(make_record(logging.ERROR)))
+
+    def test_suppressed_count_reported(self):
+        """
+        Test that the first record of a new interval carries the number of records dropped in the last one.
+        """
+        sampler = SamplingFilter(limit=1, interval=60)
+        sampler.filter(make_record())
+        sampler.filter(make_record())
+        sampler.filter(make_record())
+        sampler.interval = 0  # The next record starts a new interval.
+        record = make_record()
+        self.assertTrue(sampler.filter(record))
+        self.assertEqual(record.suppressed, 2)
+        self.assertIn("2 similar messages suppressed", record.getMessage())
+
+    def test_disabled(self):
+        """
+        Test that a limit of 0 disables sampling.
+        """
+        sampler = SamplingFilter(limit=0)
+        self.assertTrue(all(sampler.filter(make_record()) for _ in range(100)))
+
+class TestLogging(unittest.TestCase):
+    def test_json_formatter(self):
+        """
+        Test that the JSON formatter writes one parseable object with the level and message.
+        """
+        entry = json.loads(JsonFormatter().format(make_record(logging.WARNING, "Rate limited", lineno=3)))
+        self.assertEqual(entry["level"], "WARNING")
+        self.assertEqual(entry["message"], "Rate limited")
+        self.assertEqual(entry["line"], 3)
+
+    def test_setup_logging(self):
+        """
+        Test that setup_logging leaves a single QueueHandler on the root logger and that records reach the file.
+        """
+        import tempfile
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bot.log")
+            listener = setup_logging(level="INFO", json_format=True, log_file=path)
+            try:
+                self.assertEqual(len(root.handlers), 1)
+                self.assertIsInstance(root.handlers[0], logging.handlers.QueueHandler)
+                logging.info("queued line")
+            finally:
+                atexit.unregister(listener.stop)
+                listener.stop()
+                for handler in listener.handlers:
+                    handler.close()
+                root.handlers[:] = handlers
+                root.setLevel(level)
+            with open(path) as f:
+                entries = [json.loads(line) for line in f]
+        self.assertEqual(entries[-1]["message"], "queued line")
+
+if __name__ == '__main__':
+    unittest.main()
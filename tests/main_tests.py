@@ -0,0 +1,52 @@
+import unittest
+import asyncio
+import contextlib
+import io
+import os
+import sys
+sys.path.append(os.path.abspath('..'))
+
+import main
+from cogs.dispatcher import dispatcher
+from cogs.fanout import fanout
+
+class Channel:
+    id = 1
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(0.01)
+        self.sent.append(content)
+
+class TestShutdown(unittest.IsolatedAsyncioTestCase):
+    async def test_drain(self):
+        """
+        Test that a stop delivers the messages queued by pending fan-out jobs before returning.
+        """
+        channel = Channel()
+
+        async def announce(i):
+            await asyncio.sleep(0.01)
+            dispatcher.send(channel, f"message {i}")
+
+        for i in range(3):
+            fanout.submit(announce, i)
+        await main.drain()
+        self.assertEqual(channel.sent, ["message 0", "message 1", "message 2"])
+        self.assertEqual(dispatcher.depth, 0)
+
+class TestProfileStartup(unittest.IsolatedAsyncioTestCase):
+    async def test_profile_startup(self):
+        """
+        Test that --profile-startup reports every helper module and cog and closes the bot without having connected.
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            await main.profile_startup()
+        for name in main.HELPERS + main.COGS:
+            self.assertIn(name, output.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import sqlite3
+import threading
+import sys
+import os
+sys.path.append(os.path.abspath('..'))
+
+from cogs.metrics import Registry, Timer, BUCKETS, timed_query, metrics
+
+class TestTimer(unittest.TestCase):
+    def test_histogram_buckets(self):
+        """
+        Test that observations land in the first bucket whose bound is not below them, and the overflow bucket past the last one.
+        """
+        timer = Timer("submit")
+        timer.observe(0.00005)
+        timer.observe(0.001)
+        timer.observe(0.0011)
+        timer.observe(60)
+        snap = timer.snapshot()
+        self.assertEqual(snap.counts[0], 1)
+        self.assertEqual(snap.counts[BUCKETS.index(0.001)], 1)
+        self.assertEqual(snap.counts[BUCKETS.index(0.0025)], 1)
+        self.assertEqual(snap.counts[-1], 1)
+        self.assertEqual(snap.calls, 4)
+        self.assertAlmostEqual(snap.total, 60.00215)
+
+    def test_quantile(self):
+        """
+        Test that quantiles are the upper bound of the bucket holding them.
+        """
+        timer = Timer("submit")
+        self.assertIsNone(timer.snapshot().quantile(0.5))
+        for _ in range(98):
+            timer.observe(0.0008)
+        timer.observe(0.3)
+        timer.observe(0.3)
+        snap = timer.snapshot()
+        self.assertEqual(snap.quantile(0.5), 0.001)
+        self.assertEqual(snap.quantile(0.99), 0.5)
+
+    def test_threads_are_merged(self):
+        """
+        Test that observations recorded on several threads are all counted.
+        """
+        timer = Timer("add_solve")
+
+        def work():
+            for _ in range(1000):
+                timer.observe(0.001, rows=1)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        timer.observe(0.001, error=True)
+        snap = timer.snapshot()
+        self.assertEqual(snap.calls, 4001)
+        self.assertEqual(snap.rows, 4000)
+        self.assertEqual(snap.errors, 1)
+
+class TestRegistry(unittest.TestCase):
+    def test_openmetrics(self):
+        """
+        Test the OpenMetrics exposition: cumulative buckets, count, sum, errors, rows and the EOF marker.
+        """
+        registry = Registry()
+        registry.command("submit").observe(0.002)
+        registry.command("submit").observe(0.02)
+        registry.query("add_solve").observe(0.001, rows=3)
+        text = registry.openmetrics()
+        lines = text.splitlines()
+        self.assertIn('dailyctf_command_seconds_bucket{command="submit",le="0.001"} 0', lines)
+        self.assertIn('dailyctf_command_seconds_bucket{command="submit",le="0.0025"} 1', lines)
+        self.assertIn('dailyctf_command_seconds_bucket{command="submit",le="+Inf"} 2', lines)
+        self.assertIn('dailyctf_command_seconds_count{command="submit"} 2', lines)
+        self.assertIn('dailyctf_command_errors_total{command="submit"} 0', lines)
+        self.assertIn('dailyctf_query_rows_total{query="add_solve"} 3', lines)
+        self.assertEqual(lines[-1], "# EOF")
+
+    def test_timed_query(self):
+        """
+        Test that timed_query records the rows written, the rows read and errors under the function's name.
+        """
+        con = sqlite3.connect(":memory:")
+        con.execute("CREATE TABLE t (x INTEGER)")
+
+        def insert_rows(con, n):
+            con.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(n)])
+
+        def read_rows(con):
+            return con.execute("SELECT x FROM t").fetchall()
+
+        def broken(con):
+            raise sqlite3.OperationalError("boom")
+
+        before = {s.name: (s.calls, s.rows, s.errors) for s in metrics.snapshot("query")}
+        timed_query(insert_rows, con, 5)
+        self.assertEqual(len(timed_query(read_rows, con)), 5)
+        with self.assertRaises(sqlite3.OperationalError):
+            timed_query(broken, con)
+        after = {s.name: (s.calls, s.rows, s.errors) for s in metrics.snapshot("query")}
+
+        def delta(name):
+            old = before.get(name, (0, 0, 0))
+            return tuple(a - b for a, b in zip(after[name], old))
+
+        self.assertEqual(delta("insert_rows"), (1, 5, 0))
+        self.assertEqual(delta("read_rows"), (1, 5, 0))
+        self.assertEqual(delta("broken"), (1, 0, 1))
+
+if __name__ == '__main__':
+    unittest.main()
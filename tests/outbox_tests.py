@@ -0,0 +1,170 @@
+import unittest
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+sys.path.append(os.path.abspath('..'))
+
+import discord
+from aiohttp import web
+
+from cogs import feedback
+from cogs.async_db import AsyncDatabase
+from cogs.http_session import http_session
+from cogs.outbox import Outbox, MAX_ATTEMPTS
+
+class TestOutbox(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """
+        Create a fresh database file and a recording deliver function for every test case.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = AsyncDatabase(os.path.join(self.tmp.name, "bot.db"))
+        self.batches = []
+        self.fail = False
+
+        async def deliver(payloads):
+            if self.fail:
+                raise ConnectionError("webhook down")
+            self.batches.append(payloads)
+
+        self.outbox = Outbox(self.db, "feedback", deliver, batch_size=3)
+
+    async def asyncTearDown(self):
+        """
+        Stop the worker and the database, and remove the temporary files.
+        """
+        await self.outbox.stop()
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_batches(self):
+        """
+        Test that queued messages are delivered oldest first in batches of batch_size and then removed.
+        """
+        for i in range(7):
+            await self.db.insert_outbox("feedback", f'{{"n": {i}}}')
+        self.assertEqual(await self.outbox.flush(), 3)
+        self.assertEqual(await self.outbox.flush(), 3)
+        self.assertEqual(await self.outbox.flush(), 1)
+        self.assertEqual(await self.outbox.flush(), 0)
+        self.assertEqual([[p["n"] for p in batch] for batch in self.batches], [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertIsNone(await self.db.next_outbox_attempt("feedback", MAX_ATTEMPTS))
+
+    async def test_retry(self):
+        """
+        Test that a failed delivery is kept and rescheduled, and delivered once it's due again.
+        """
+        await self.db.insert_outbox("feedback", '{"n": 1}')
+        self.fail = True
+        self.assertEqual(await self.outbox.flush(), 0)
+        due = await self.db.next_outbox_attempt("feedback", MAX_ATTEMPTS)
+        self.assertGreater(due, time.time())
+        self.assertEqual(await self.outbox.flush(), 0)  # Not due yet.
+
+        self.fail = False
+        await self.db.retry_outbox([1], 0, "made due for the test")
+        self.assertEqual(await self.outbox.flush(), 1)
+        self.assertEqual(self.batches, [[{"n": 1}]])
+        self.assertEqual((self.outbox.delivered, self.outbox.failed), (1, 1))
+
+    async def test_gives_up(self):
+        """
+        Test that a message that failed MAX_ATTEMPTS times is no longer delivered.
+        """
+        await self.db.insert_outbox("feedback", '{"n": 1}')
+        for _ in range(MAX_ATTEMPTS):
+            await self.db.retry_outbox([1], 0, "still down")
+        self.assertEqual(await self.outbox.flush(), 0)
+        self.assertIsNone(await self.db.next_outbox_attempt("feedback", MAX_ATTEMPTS))
+
+    async def test_worker(self):
+        """
+        Test that put() stores the payload and the background worker delivers it.
+        """
+        self.assertIsNotNone(await self.outbox.put({"title": "Bug"}))
+        for _ in range(100):
+            if self.batches:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.batches, [[{"title": "Bug"}]])
+
+class TestFeedbackWebhook(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """
+        Start a local stand-in for the feedback webhook and point send_feedback and discord.py at it.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = AsyncDatabase(os.path.join(self.tmp.name, "bot.db"))
+        self.received = []
+        self.failures = 0
+
+        async def execute(request):
+            self.received.append(await request.json())
+            if self.failures:
+                self.failures -= 1
+                # A 429 without a Via header comes from before Discord's API, discord.py raises it straight away.
+                return web.Response(
+                    status=429, body=b'{"message": "Too Many Requests"}', content_type="application/json"
+                )
+            return web.Response(status=204)
+
+        app = web.Application()
+        app.router.add_post("/api/v10/webhooks/{webhook_id}/{token}", execute)
+        self.runner = web.AppRunner(app, shutdown_timeout=1)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.patches = [
+            mock.patch.object(discord.webhook.async_.Route, "BASE", f"http://127.0.0.1:{port}/api/v10"),
+            mock.patch.object(
+                feedback, "FEEDBACK_WEBHOOK_URL", f"https://discord.com/api/webhooks/1231415807549112360/{'t' * 68}"
+            ),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.outbox = Outbox(self.db, "feedback", feedback.send_feedback, batch_size=feedback.EMBEDS_PER_MESSAGE)
+
+    async def asyncTearDown(self):
+        """
+        Stop the outbox, the shared session, the stand-in server and the database.
+        """
+        for patch in self.patches:
+            patch.stop()
+        await self.outbox.stop()
+        await http_session.close()
+        await self.runner.cleanup()
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_delivery(self):
+        """
+        Test that queued feedback reaches the webhook as embeds of a single message over the shared session.
+        """
+        await self.db.insert_outbox("feedback", '{"title": "Bug", "description": "It broke"}')
+        await self.db.insert_outbox("feedback", '{"title": "Idea"}')
+        self.assertEqual(await self.outbox.flush(), 2)
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual([embed["title"] for embed in self.received[0]["embeds"]], ["Bug", "Idea"])
+        self.assertEqual(self.received[0]["embeds"][0]["description"], "It broke")
+
+    async def test_retry_after_failure(self):
+        """
+        Test that a delivery the webhook rejects is kept and sent again once it's due.
+        """
+        self.failures = 1
+        await self.db.insert_outbox("feedback", '{"title": "Bug"}')
+        self.assertEqual(await self.outbox.flush(), 0)
+        self.assertEqual(self.outbox.failed, 1)
+
+        await self.db.retry_outbox([1], 0, "made due for the test")
+        self.assertEqual(await self.outbox.flush(), 1)
+        self.assertEqual(len(self.received), 2)
+        self.assertEqual(self.received[1]["embeds"][0]["title"], "Bug")
+        self.assertIsNone(await self.db.next_outbox_attempt("feedback", MAX_ATTEMPTS))
+
+if __name__ == '__main__':
+    unittest.main()
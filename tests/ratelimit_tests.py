@@ -0,0 +1,48 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath('..'))
+
+from cogs.ratelimit import TokenBucketLimiter
+
+class TestTokenBucketLimiter(unittest.TestCase):
+    def test_burst_and_refill(self):
+        """
+        Test that a user gets `burst` attempts in a row and then one more per refill interval.
+        """
+        limiter = TokenBucketLimiter()
+        self.assertEqual([limiter.allow(1, 10, rate=60, burst=3, now=0) for _ in range(4)], [True, True, True, False])
+        self.assertFalse(limiter.allow(1, 10, rate=60, burst=3, now=0.5))
+        self.assertTrue(limiter.allow(1, 10, rate=60, burst=3, now=1.6))
+        self.assertEqual(limiter.stats(1), {"tracked": 1, "allowed": 4, "rejected": 2})
+
+    def test_keys_are_independent(self):
+        """
+        Test that users and guilds each have their own bucket.
+        """
+        limiter = TokenBucketLimiter()
+        self.assertTrue(limiter.allow(1, 10, burst=1, now=0))
+        self.assertFalse(limiter.allow(1, 10, burst=1, now=0))
+        self.assertTrue(limiter.allow(1, 11, burst=1, now=0))
+        self.assertTrue(limiter.allow(2, 10, burst=1, now=0))
+        limiter.reset(1)
+        self.assertEqual(limiter.stats(1), {"tracked": 0, "allowed": 0, "rejected": 0})
+        self.assertEqual(limiter.stats(2)["tracked"], 1)
+
+    def test_idle_eviction(self):
+        """
+        Test that idle buckets are evicted and the number of buckets is bounded.
+        """
+        limiter = TokenBucketLimiter(idle=10, max_entries=100)
+        for user_id in range(50):
+            limiter.allow(1, user_id, now=0)
+        limiter.allow(1, 50, now=5)
+        limiter.allow(1, 51, now=11)
+        self.assertEqual(limiter.stats(1)["tracked"], 2)
+
+        for user_id in range(1000):
+            limiter.allow(2, user_id, now=12)
+        self.assertEqual(limiter.stats(2)["tracked"], 100)
+
+if __name__ == '__main__':
+    unittest.main()
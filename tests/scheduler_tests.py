@@ -0,0 +1,83 @@
+import unittest
+import asyncio
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.abspath('..'))
+
+from cogs.async_db import AsyncDatabase
+from cogs.scheduler import Scheduler, HINT_DELAY, END_DELAY, challenge_start
+
+GUILD_ID = 1234
+
+class TestScheduler(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """
+        Create a fresh database with an active challenge and a scheduler recording the fired events.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "bot.db")
+        self.db = AsyncDatabase(self.path)
+        await self.db.insert_challenge(GUILD_ID, (123, "Test description", "Test answer", "", "Test hints", ""))
+        self.challenge = (await self.db.active_challenge(GUILD_ID)).challenge
+        self.fired = []
+        self.scheduler = self.new_scheduler(self.db)
+
+    async def asyncTearDown(self):
+        await self.scheduler.stop()
+        await self.db.close()
+        self.tmp.cleanup()
+
+    def new_scheduler(self, database):
+        scheduler = Scheduler(database)
+        for event in ("hint", "end"):
+            scheduler.register(event, self.recorder(event))
+        return scheduler
+
+    def recorder(self, event):
+        async def handler(guild_id, day):
+            self.fired.append((event, guild_id, day))
+        return handler
+
+    async def test_schedule_challenge(self):
+        """
+        Test that setting a challenge persists its hint and end events.
+        """
+        await self.scheduler.schedule_challenge(GUILD_ID, self.challenge)
+        start = challenge_start(self.challenge)
+        day = self.challenge.day
+        self.assertEqual([entry[0] for entry in self.scheduler.pending()], [start + HINT_DELAY, start + END_DELAY])
+        self.assertEqual([event[1:4] for event in await self.db.fetch_events()], [(GUILD_ID, day, "hint"), (GUILD_ID, day, "end")])
+
+    async def test_fires_in_deadline_order(self):
+        """
+        Test that due events of every guild fire earliest first and are removed from the database.
+        """
+        await self.scheduler.start()
+        now = time.time()
+        await self.scheduler.cancel(GUILD_ID)
+        await self.scheduler.schedule(GUILD_ID, 1, "end", now + 0.05)
+        await self.scheduler.schedule(99, 1, "hint", now + 0.01)
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.fired, [("hint", 99, 1), ("end", GUILD_ID, 1)])
+        self.assertEqual(await self.db.fetch_events(), [])
+
+    async def test_recovers_missed_deadlines(self):
+        """
+        Test that a restart fires overdue events in one pass and drops hints of finished challenges.
+        """
+        past = time.time() - 10
+        await self.scheduler.cancel(GUILD_ID)
+        await self.scheduler.schedule(GUILD_ID, 1, "hint", past - 5)
+        await self.scheduler.schedule(GUILD_ID, 1, "end", past)
+        await self.scheduler.schedule(GUILD_ID, 2, "hint", past)
+
+        restarted = self.new_scheduler(self.db)
+        await restarted.start()
+        await asyncio.sleep(0.1)
+        await restarted.stop()
+        self.assertEqual(self.fired, [("end", GUILD_ID, 1), ("hint", GUILD_ID, 2)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath('..'))
+
+from cogs.standings import Standings, solve_points
+
+class TestStandings(unittest.TestCase):
+    def test_top_k(self):
+        """
+        Test that the top list follows solves and only keeps the best k users.
+        """
+        standings = Standings(k=2)
+        standings.load([(1, 1, 0, 100, 60), (2, 1, 1, 150, 30), (3, 1, 0, 100, 90)])
+        self.assertEqual([user_id for user_id, _ in standings.top()], [2, 1])
+
+        standings.add_solve(3, 1, 30)
+        self.assertEqual([user_id for user_id, _ in standings.top()], [3, 2])
+        standings.add_solve(4, 4, 10)
+        self.assertEqual([user_id for user_id, _ in standings.top()], [3, 2])
+
+        stats = standings.get(3)
+        self.assertEqual((stats.solves, stats.first_bloods, stats.points, stats.average_solve_time), (2, 1, 250, 60))
+
+    def test_matches_full_sort(self):
+        """
+        Test that the incremental top list is the same as sorting every user.
+        """
+        standings = Standings(k=5)
+        for i in range(200):
+            standings.add_solve(i * 7 % 23, i % 5 + 1, i)
+        expected = sorted(standings.totals.items(), key=lambda item: (-item[1].points, -item[1].first_bloods, item[0]))[:5]
+        self.assertEqual([user_id for user_id, _ in standings.top()], [user_id for user_id, _ in expected])
+        self.assertEqual(solve_points(1), 150)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import asyncio
+import os
+import sys
+from unittest import mock
+sys.path.append(os.path.abspath('..'))
+
+import discord
+
+import supervisor
+from benchmarks.fake_discord import FakeDiscord
+from main import create_bot
+from supervisor import Supervisor
+
+class TestSupervisor(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """
+        Start the local stand-in for the Discord REST API and gateway and point discord.py at it.
+        """
+        self.fake = FakeDiscord(members=2, latency=0.001, jitter=0)
+        await self.fake.start()
+        # Restored on tear down, patch_discord() overwrites them.
+        self.routes = [
+            mock.patch.object(discord.http.Route, "BASE", discord.http.Route.BASE),
+            mock.patch.object(discord.webhook.async_.Route, "BASE", discord.webhook.async_.Route.BASE),
+            mock.patch.object(
+                discord.gateway.DiscordWebSocket, "DEFAULT_GATEWAY", discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY
+            ),
+        ]
+        for route in self.routes:
+            route.start()
+        self.fake.patch_discord()
+
+    async def asyncTearDown(self):
+        """
+        Stop the stand-in server.
+        """
+        await self.fake.stop()
+        for route in self.routes:
+            route.stop()
+
+    async def test_restart_reconnects(self):
+        """
+        Test that after the gateway closes the session with an error the supervisor logs in and connects again
+        with the bot main.py runs, instead of returning as if the bot had been closed.
+        """
+        bot = create_bot()
+        ready = []
+        reconnected = asyncio.Event()
+
+        async def on_ready():
+            ready.append(bot.user.id)
+            if len(ready) == 1:
+                # A close code discord.py doesn't reconnect on by itself ends connect() with an error.
+                for ws in list(self.fake._sockets):
+                    await ws.close(code=4011)
+            else:
+                reconnected.set()
+
+        def backoff_delay(attempt):
+            # Without a working restart the supervisor would retry forever.
+            if attempt >= 3:
+                raise AssertionError("the session never came back")
+            return 0
+
+        bot.add_listener(on_ready, "on_ready")
+        with mock.patch.object(supervisor, "backoff_delay", backoff_delay):
+            async with bot:
+                session = Supervisor(bot, "token")
+                task = asyncio.create_task(session.run())
+                with self.assertLogs(level="ERROR"):
+                    await asyncio.wait_for(reconnected.wait(), 30)
+                # The second session has to keep running until the bot is closed.
+                await asyncio.sleep(0.5)
+                self.assertFalse(task.done(), "the supervisor returned after reconnecting")
+                await bot.close()
+                await asyncio.wait_for(task, 10)
+        self.assertEqual(session.restarts, 1)
+        self.assertEqual(len(ready), 2)
+
+if __name__ == '__main__':
+    unittest.main()